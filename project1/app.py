@@ -5,24 +5,80 @@
     2. Use zincrby to create or update the request count
     3. Use the API request as the member value in the sorted set
     4. API counts are recorded within the sorted set named 'api'
+    5. Optionally buffer counts per worker and flush them with
+       one redis pipeline (see write_behind.py)
+    6. Optionally store a hash of the path as the member and map
+       hashes back to paths in 'api:paths' (see path_keys.py)
+    7. Optionally count paths by route template and keep the concrete
+       paths in 'api:raw' (see normalize.py)
+    8. Optionally count requests in per-minute buckets with TTLs for
+       /stats/?window=... (see windows.py)
+    9. Optionally replace exact counting with an approximate Count-Min
+       Sketch and top-K sorted set (see counters.py)
+   10. Optionally cache /stats/ responses in redis with ETags
+       (see stats_cache.py)
 '''
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from http import HTTPStatus
-import random
+import json
 from redis import Redis, RedisError
-import requests
+import threading
+import uuid
+
+from counting import (
+    REDIS_LOG_KEY_NAME,
+    REDIS_TEST_JOB_KEY_PREFIX,
+    STATS_MAX_LIMIT,
+    STATS_MAX_OFFSET,
+    STATS_PAGE_SIZE,
+    TEST_JOB_TTL,
+    create_counter,
+    create_path_keys,
+    decode_cursor,
+    encode_cursor,
+    next_after,
+    parse_int,
+    request_counts,
+    stats_rows)
+from counters import top_rows
+from loadgen import LoadGenerator
+import settings
+from stats_cache import StatsCache
+import windows
+from write_behind import WriteBehindBuffer
 
 # Connect to Redis
 redis = Redis(
-    host="redis",
+    host=settings.REDIS_HOST,
     db=0,
     socket_connect_timeout=2,
     socket_timeout=2,
     decode_responses=True)
 
-REDIS_LOG_KEY_NAME = 'api'
-REDIS_INT64_MAX = 9223372036854775807  # (2 power 63 -1)
+path_keys = create_path_keys(redis)
+counter = create_counter(redis, path_keys)
+
+stats_cache = None
+if settings.STATS_CACHE_SECONDS:
+    stats_cache = StatsCache(
+        redis,
+        REDIS_LOG_KEY_NAME,
+        max_age=settings.STATS_CACHE_SECONDS,
+        max_body=settings.STATS_CACHE_MAX_BYTES)
+
+write_behind = None
+if settings.WRITE_BEHIND_ENABLED:
+    write_behind = WriteBehindBuffer(
+        redis,
+        REDIS_LOG_KEY_NAME,
+        flush_size=settings.WRITE_BEHIND_FLUSH_SIZE,
+        flush_interval=settings.WRITE_BEHIND_FLUSH_INTERVAL,
+        max_keys=settings.WRITE_BEHIND_MAX_KEYS,
+        counter=counter)
+
+# Load tests running in this process, see api_test()
+test_job_slots = threading.BoundedSemaphore(settings.TEST_MAX_JOBS)
 
 app = Flask(__name__)
 
@@ -54,6 +110,24 @@ def api_record(path):
 def stats():
     """
         Reports API calls in highest to lowest usage order.
+
+        Optional query parameters:
+            limit      return at most this many rows, up to
+                       STATS_MAX_LIMIT
+            offset     skip this many rows, up to STATS_MAX_OFFSET
+            cursor     value of X-Next-Cursor from the previous page
+            min_count  skip paths requested fewer times than this
+            window     only count requests from the last 5m, 15m, 1h,
+                       24h or 7d (requires API_WINDOWS)
+
+        With a limit the page is read with a single ZREVRANGEBYSCORE ...
+        LIMIT, or after a cursor with one script call that starts at the
+        last row's rank (see counters.py), and the next cursor is
+        returned in the X-Next-Cursor header. Without a limit the whole set is streamed page by page
+        so memory stays flat however many paths have been recorded.
+
+        When API_STATS_CACHE_SECONDS is set responses are served from a
+        shared cache with an ETag; If-None-Match gets a 304.
     """
     # Log all API requests
     exception = log_api()
@@ -61,86 +135,287 @@ def stats():
         return jsonify({'error': exception}), HTTPStatus.INTERNAL_SERVER_ERROR
 
     try:
-        data = redis.zrevrangebyscore(
-            REDIS_LOG_KEY_NAME,
-            REDIS_INT64_MAX,
-            0,
-            withscores=True)
-
-        # The redis response is an ordered list of lists:
-        #   [["/stats",13.0],["/api/1/2/3/4/5",6.0]]
-        # and I prefer an ordered list of dictionaries so the
-        # caller doesn't need to guess which is which.
-        # Ordering is by descending request count
-        response_data = []
-        for row in data:
-            response_data.append({'count': row[1], 'url': row[0]})
-        return jsonify(response_data), HTTPStatus.OK
+        limit = query_int('limit')
+        offset = query_int('offset', 0)
+        min_count = query_int('min_count', 0)
+        after = request.args.get('cursor')
+        if after is not None:
+            after = decode_cursor(after)
+    except ValueError:
+        return jsonify({'error': 'limit, offset and min_count must be '
+                        'non-negative integers and cursor a value of '
+                        'X-Next-Cursor'}), \
+            HTTPStatus.BAD_REQUEST
+    if limit is not None and limit > STATS_MAX_LIMIT:
+        return jsonify({'error': 'limit must be at most {}, leave it out '
+                        'to stream every row'.format(STATS_MAX_LIMIT)}), \
+            HTTPStatus.BAD_REQUEST
+    if offset > STATS_MAX_OFFSET:
+        return jsonify({'error': 'offset must be at most {}, page further '
+                        'with cursor'.format(STATS_MAX_OFFSET)}), \
+            HTTPStatus.BAD_REQUEST
+
+    window = request.args.get('window')
+    if window is not None and not settings.WINDOWS_ENABLED:
+        return jsonify({'error': 'windowed stats are not enabled'}), \
+            HTTPStatus.BAD_REQUEST
+    if window is not None and window not in windows.WINDOWS:
+        return jsonify({'error': 'window must be one of {}'.format(
+            ', '.join(windows.WINDOWS))}), HTTPStatus.BAD_REQUEST
+
+    if stats_cache:
+        try:
+            cached = stats_cache.get(request.args, request.if_none_match)
+        except RedisError as exc:
+            # Serve uncached rather than fail when the cache is unavailable
+            print('Stats cache error: {}'.format(exc))
+            cached = None
+        if cached:
+            return stats_response(
+                cached.get('body'), cached['etag'], cached.get('cursor'))
+
+    try:
+        key = REDIS_LOG_KEY_NAME
+        if window:
+            key = windows.window_key(
+                redis,
+                REDIS_LOG_KEY_NAME,
+                window,
+                cache_seconds=settings.WINDOW_CACHE_SECONDS)
+
+        if limit is None:
+            chunks = stream_stats(offset, min_count, key, after)
+            if stats_cache:
+                chunks = cache_stream(chunks, request.args.copy())
+            return Response(
+                stream_with_context(chunks),
+                mimetype='application/json')
+
+        data, after = read_stats(offset, limit, min_count, key, after)
     except RedisError as exc:
         return jsonify({'error': exc}), HTTPStatus.INTERNAL_SERVER_ERROR
 
+    body = json.dumps(data)
+    cursor = encode_cursor(after) if after else None
+    etag = None
+    if stats_cache:
+        try:
+            etag = stats_cache.put(request.args, body, cursor)
+        except RedisError as exc:
+            print('Stats cache error: {}'.format(exc))
+    return stats_response(body, etag, cursor)
+
+
+def stats_response(body, etag=None, cursor=None):
+    """
+        Return a stats page, or a 304 when the caller already has it.
+    """
+    if etag and etag in request.if_none_match:
+        response = Response(status=HTTPStatus.NOT_MODIFIED)
+    else:
+        response = Response(body, mimetype='application/json')
+    if etag:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'max-age={}'.format(
+            settings.STATS_CACHE_SECONDS)
+    if cursor:
+        response.headers['X-Next-Cursor'] = cursor
+    return response
+
+
+def cache_stream(chunks, args):
+    """
+        Pass a streamed stats response through, caching it once complete
+        if it is small enough.
+    """
+    body = []
+    size = 0
+    for chunk in chunks:
+        yield chunk
+        if body is not None:
+            body.append(chunk)
+            size += len(chunk)
+            if size > stats_cache.max_body:
+                body = None
+
+    # A truncated stream (redis error) ends without the closing bracket
+    if body and body[-1] == ']':
+        try:
+            stats_cache.put(args, ''.join(body))
+        except RedisError as exc:
+            print('Stats cache error: {}'.format(exc))
+
+
+def query_int(name, default=None):
+    """
+        Return a non-negative integer query parameter or the default.
+    """
+    return parse_int(request.args.get(name), name, default)
+
+
+def read_stats(offset, limit, min_count=0, key=REDIS_LOG_KEY_NAME, after=None):
+    """
+        Return one page of API counts in descending count order, and the
+        (count, member) to read the next page after or None.
+
+        The first page starts at offset; later pages start after the last
+        row read, so each costs the same however deep it is.
+    """
+    if after is None:
+        data = counter.top(key, offset, limit, min_count)
+    else:
+        data = top_rows(counter.top_after(key, after, limit, min_count))
+    members = [row[0] for row in data]
+    urls = path_keys.resolve(members) if path_keys else members
+    return stats_rows(data, urls), next_after(data, limit)
+
+
+def stream_stats(offset=0, min_count=0, key=REDIS_LOG_KEY_NAME, after=None):
+    """
+        Generate the full stats JSON array one redis page at a time.
+
+        Counts keep changing while the set is read so a path may move
+        across a page boundary; the stream is a best-effort snapshot.
+    """
+    yield '['
+    first = True
+    while True:
+        try:
+            page, after = read_stats(
+                offset, STATS_PAGE_SIZE, min_count, key, after)
+        except RedisError as exc:
+            # The status line has already been sent so the best we can do
+            # is stop; the truncated array tells the caller it failed.
+            print('Stats stream error: {}'.format(exc))
+            return
+
+        for row in page:
+            yield ('' if first else ',') + json.dumps(row)
+            first = False
+
+        if after is None:
+            break
+    yield ']'
+
 
 @app.route("/test/<int:count>/", methods=["POST"])
 def api_test(count):
     """
-        Generates <count> test URLs and submits them.
+        Starts a load test of <count> generated test URLs.
+
+        Optional query parameters:
+            concurrency  requests in flight (default 10)
+            rps          target requests per second
+
+        The test runs in the background; the response holds the job id
+        to poll at /test/jobs/<job_id>/. Each process runs at most
+        API_TEST_MAX_JOBS tests at once and answers 429 beyond that.
     """
     # Log all API requests
     exception = log_api()
     if exception:
         return jsonify({'error': exception}), HTTPStatus.INTERNAL_SERVER_ERROR
 
-    # Per the spec, path segments are used across all requests within a test
-    path_segments = generate_path_segments()
-    for i in range(0, count):
-        # Randomly determine the number of segments in this request
-        path_count = random.randrange(1, 7)
+    try:
+        concurrency = query_int('concurrency', 10)
+        rps = query_int('rps')
+    except ValueError:
+        return jsonify({'error': 'concurrency and rps must be '
+                        'non-negative integers'}), HTTPStatus.BAD_REQUEST
+    concurrency = max(1, min(concurrency, settings.TEST_MAX_CONCURRENCY))
 
-        # WARNING
-        # host.docker.internal is NOT production safe.
-        # The production domain should be taken from settings
-        # or the environment.
-        url = 'http://host.docker.internal:5000/api'
+    generator = LoadGenerator(
+        settings.TEST_BASE_URL,
+        count=count,
+        concurrency=concurrency,
+        rps=rps or None)
 
-        while path_count > 0:
-            url += '/{}'.format(path_segments[random.randrange(0, 3)])
-            path_count -= 1
-        url += '/'
+    if not test_job_slots.acquire(blocking=False):
+        return jsonify({'error': 'too many load tests running, '
+                        'try again later'}), HTTPStatus.TOO_MANY_REQUESTS
 
-        try:
-            requests.get(url)
-        except requests.exceptions.RequestException:
-            return jsonify({'error': 'request error'}), \
-                HTTPStatus.INTERNAL_SERVER_ERROR
-    return '', HTTPStatus.OK
+    job_id = uuid.uuid4().hex
+    try:
+        save_test_job(job_id, {'status': 'running', 'count': count})
+    except RedisError as exc:
+        test_job_slots.release()
+        return jsonify({'error': exc}), HTTPStatus.INTERNAL_SERVER_ERROR
 
+    threading.Thread(
+        target=run_test_job,
+        args=(job_id, generator),
+        name='test-{}'.format(job_id),
+        daemon=True).start()
+    return jsonify({'job_id': job_id}), HTTPStatus.ACCEPTED
 
-def generate_path_segments():
+
+@app.route("/test/jobs/<job_id>/", methods=["GET"])
+def api_test_job(job_id):
     """
-        Generate and return a list of three random strings.
+        Reports the status, and once finished the results, of a test job.
     """
+    # Log all API requests
+    exception = log_api()
+    if exception:
+        return jsonify({'error': exception}), HTTPStatus.INTERNAL_SERVER_ERROR
 
-    # Constrain path characters to alphanumeric and
-    # skip lookalikes (1, i, l, 0, o)
-    allowed = \
-        'abcdefghjkmnpqrstuvwxyz' \
-        'ABCDEFGHJKMNPQRSTUVWXYZ' \
-        '23456789'
+    try:
+        job = redis.get(test_job_key(job_id))
+    except RedisError as exc:
+        return jsonify({'error': exc}), HTTPStatus.INTERNAL_SERVER_ERROR
+
+    if not job:
+        return jsonify({'error': 'unknown job'}), HTTPStatus.NOT_FOUND
+    return app.response_class(job, mimetype='application/json'), \
+        HTTPStatus.OK
+
+
+def test_job_key(job_id):
+    return '{}:{}'.format(REDIS_TEST_JOB_KEY_PREFIX, job_id)
+
+
+def save_test_job(job_id, job):
+    """
+        Store the job state where any worker can report it.
+    """
+    redis.set(test_job_key(job_id), json.dumps(job), ex=TEST_JOB_TTL)
 
-    segs = []
-    for index in range(3):
-        # I will allow API path segments to be 3-8 characters
-        str_len = random.randrange(3, 9)
-        segs.append(''.join(random.choice(allowed) for i in range(str_len)))
-    return segs
+
+def run_test_job(job_id, generator):
+    """
+        Run the load test and record its report.
+    """
+    try:
+        job = {'status': 'finished', 'report': generator.run()}
+    except Exception as exc:
+        job = {'status': 'failed', 'error': str(exc)}
+    finally:
+        test_job_slots.release()
+
+    try:
+        save_test_job(job_id, job)
+    except RedisError as exc:
+        print('Test job {} result lost: {}'.format(job_id, exc))
 
 
 def log_api():
     """
         Log the API request in redis.
     """
+    counts = request_counts(request.path)
+
+    if write_behind:
+        for (key, member), amount in counts.items():
+            exception = write_behind.add(member, amount, key=key)
+            if exception:
+                return exception
+        return
+
     try:
-        redis.zincrby(REDIS_LOG_KEY_NAME, 1, request.path)
+        pipe = redis.pipeline(transaction=False)
+        new_members = counter.queue(pipe, counts)
+        pipe.execute()
+        counter.confirm(new_members)
     except RedisError as exc:
         return exc
 
@@ -0,0 +1,397 @@
+'''
+    ASGI entry point serving the same routes as app.py.
+
+    Routes run on an event loop with an asyncio redis client sharing one
+    bounded connection pool, so a single process holds many requests in
+    flight while they wait on redis instead of one per uWSGI process.
+
+    Run with:
+        uvicorn asgi:app --host 0.0.0.0 --port 5002
+
+    Counting, normalization, hashed paths, windows, the counter backends
+    and the /stats/ cache behave as they do under uWSGI. Each request
+    writes its counts with one non-blocking pipeline; the write-behind
+    buffer is specific to the uWSGI deployment and is not used here.
+'''
+
+import asyncio
+from http import HTTPStatus
+import json
+import threading
+import time
+import uuid
+
+from quart import Quart, Response, jsonify, request
+from redis import RedisError
+from redis.asyncio import BlockingConnectionPool, Redis
+
+from counting import (
+    REDIS_LOG_KEY_NAME,
+    REDIS_TEST_JOB_KEY_PREFIX,
+    STATS_MAX_LIMIT,
+    STATS_MAX_OFFSET,
+    STATS_PAGE_SIZE,
+    TEST_JOB_TTL,
+    create_counter,
+    create_path_keys,
+    decode_cursor,
+    encode_cursor,
+    next_after,
+    parse_int,
+    request_counts,
+    stats_rows)
+from counters import top_rows
+from loadgen import LoadGenerator
+from path_keys import label
+import settings
+from stats_cache import AsyncStatsCache
+import windows
+
+# Requests wait for a free connection rather than failing when every
+# pooled connection is busy.
+redis = Redis(
+    connection_pool=BlockingConnectionPool(
+        host=settings.REDIS_HOST,
+        db=0,
+        max_connections=settings.ASGI_REDIS_MAX_CONNECTIONS,
+        timeout=2,
+        socket_connect_timeout=2,
+        socket_timeout=2,
+        decode_responses=True))
+
+path_keys = create_path_keys(redis)
+counter = create_counter(redis, path_keys)
+
+stats_cache = None
+if settings.STATS_CACHE_SECONDS:
+    stats_cache = AsyncStatsCache(
+        redis,
+        REDIS_LOG_KEY_NAME,
+        max_age=settings.STATS_CACHE_SECONDS,
+        max_body=settings.STATS_CACHE_MAX_BYTES)
+
+# Keep references to running test jobs so they are not garbage collected
+test_jobs = set()
+# Load tests running in this process; acquired without waiting, so it
+# isn't tied to an event loop
+test_job_slots = threading.BoundedSemaphore(settings.TEST_MAX_JOBS)
+
+app = Quart(__name__)
+
+
+@app.route('/api/<path:path>')
+async def api_record(path):
+    """
+        Tally the API request in redis.
+    """
+    exception = await log_api()
+    if exception:
+        return jsonify({'error': str(exception)}), \
+            HTTPStatus.INTERNAL_SERVER_ERROR
+    return '', HTTPStatus.OK
+
+
+@app.route("/stats/", methods=['GET'])
+async def stats():
+    """
+        Reports API calls in highest to lowest usage order.
+
+        Accepts the same query parameters as app.stats().
+    """
+    # Log all API requests
+    exception = await log_api()
+    if exception:
+        return jsonify({'error': str(exception)}), \
+            HTTPStatus.INTERNAL_SERVER_ERROR
+
+    try:
+        limit = query_int('limit')
+        offset = query_int('offset', 0)
+        min_count = query_int('min_count', 0)
+        after = request.args.get('cursor')
+        if after is not None:
+            after = decode_cursor(after)
+    except ValueError:
+        return jsonify({'error': 'limit, offset and min_count must be '
+                        'non-negative integers and cursor a value of '
+                        'X-Next-Cursor'}), \
+            HTTPStatus.BAD_REQUEST
+    if limit is not None and limit > STATS_MAX_LIMIT:
+        return jsonify({'error': 'limit must be at most {}, leave it out '
+                        'to stream every row'.format(STATS_MAX_LIMIT)}), \
+            HTTPStatus.BAD_REQUEST
+    if offset > STATS_MAX_OFFSET:
+        return jsonify({'error': 'offset must be at most {}, page further '
+                        'with cursor'.format(STATS_MAX_OFFSET)}), \
+            HTTPStatus.BAD_REQUEST
+
+    window = request.args.get('window')
+    if window is not None and not settings.WINDOWS_ENABLED:
+        return jsonify({'error': 'windowed stats are not enabled'}), \
+            HTTPStatus.BAD_REQUEST
+    if window is not None and window not in windows.WINDOWS:
+        return jsonify({'error': 'window must be one of {}'.format(
+            ', '.join(windows.WINDOWS))}), HTTPStatus.BAD_REQUEST
+
+    if stats_cache:
+        try:
+            cached = await stats_cache.get(
+                request.args, request.if_none_match)
+        except RedisError as exc:
+            # Serve uncached rather than fail when the cache is unavailable
+            print('Stats cache error: {}'.format(exc))
+            cached = None
+        if cached:
+            return stats_response(
+                cached.get('body'), cached['etag'], cached.get('cursor'))
+
+    try:
+        key = REDIS_LOG_KEY_NAME
+        if window:
+            key = await window_key(window)
+
+        if limit is None:
+            chunks = stream_stats(offset, min_count, key, after)
+            if stats_cache:
+                chunks = cache_stream(chunks, request.args.copy())
+            return Response(chunks, mimetype='application/json')
+
+        data, after = await read_stats(offset, limit, min_count, key, after)
+    except RedisError as exc:
+        return jsonify({'error': str(exc)}), HTTPStatus.INTERNAL_SERVER_ERROR
+
+    body = json.dumps(data)
+    cursor = encode_cursor(after) if after else None
+    etag = None
+    if stats_cache:
+        try:
+            etag = await stats_cache.put(request.args, body, cursor)
+        except RedisError as exc:
+            print('Stats cache error: {}'.format(exc))
+    return stats_response(body, etag, cursor)
+
+
+@app.route("/test/<int:count>/", methods=["POST"])
+async def api_test(count):
+    """
+        Starts a load test of <count> generated test URLs.
+
+        The load generator's worker threads run off the event loop. At
+        most API_TEST_MAX_JOBS tests run at once; beyond that it's a 429.
+    """
+    # Log all API requests
+    exception = await log_api()
+    if exception:
+        return jsonify({'error': str(exception)}), \
+            HTTPStatus.INTERNAL_SERVER_ERROR
+
+    try:
+        concurrency = query_int('concurrency', 10)
+        rps = query_int('rps')
+    except ValueError:
+        return jsonify({'error': 'concurrency and rps must be '
+                        'non-negative integers'}), HTTPStatus.BAD_REQUEST
+    concurrency = max(1, min(concurrency, settings.TEST_MAX_CONCURRENCY))
+
+    generator = LoadGenerator(
+        settings.TEST_BASE_URL,
+        count=count,
+        concurrency=concurrency,
+        rps=rps or None)
+
+    if not test_job_slots.acquire(blocking=False):
+        return jsonify({'error': 'too many load tests running, '
+                        'try again later'}), HTTPStatus.TOO_MANY_REQUESTS
+
+    job_id = uuid.uuid4().hex
+    try:
+        await save_test_job(job_id, {'status': 'running', 'count': count})
+    except RedisError as exc:
+        test_job_slots.release()
+        return jsonify({'error': str(exc)}), HTTPStatus.INTERNAL_SERVER_ERROR
+
+    task = asyncio.ensure_future(run_test_job(job_id, generator))
+    test_jobs.add(task)
+    task.add_done_callback(test_jobs.discard)
+    return jsonify({'job_id': job_id}), HTTPStatus.ACCEPTED
+
+
+@app.route("/test/jobs/<job_id>/", methods=["GET"])
+async def api_test_job(job_id):
+    """
+        Reports the status, and once finished the results, of a test job.
+    """
+    # Log all API requests
+    exception = await log_api()
+    if exception:
+        return jsonify({'error': str(exception)}), \
+            HTTPStatus.INTERNAL_SERVER_ERROR
+
+    try:
+        job = await redis.get(test_job_key(job_id))
+    except RedisError as exc:
+        return jsonify({'error': str(exc)}), HTTPStatus.INTERNAL_SERVER_ERROR
+
+    if not job:
+        return jsonify({'error': 'unknown job'}), HTTPStatus.NOT_FOUND
+    return Response(job, mimetype='application/json'), HTTPStatus.OK
+
+
+def stats_response(body, etag=None, cursor=None):
+    """
+        Return a stats page, or a 304 when the caller already has it.
+    """
+    if etag and etag in request.if_none_match:
+        response = Response('', status=HTTPStatus.NOT_MODIFIED)
+    else:
+        response = Response(body, mimetype='application/json')
+    if etag:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'max-age={}'.format(
+            settings.STATS_CACHE_SECONDS)
+    if cursor:
+        response.headers['X-Next-Cursor'] = cursor
+    return response
+
+
+async def cache_stream(chunks, args):
+    """
+        Pass a streamed stats response through, caching it once complete
+        if it is small enough.
+    """
+    body = []
+    size = 0
+    async for chunk in chunks:
+        yield chunk
+        if body is not None:
+            body.append(chunk)
+            size += len(chunk)
+            if size > stats_cache.max_body:
+                body = None
+
+    # A truncated stream (redis error) ends without the closing bracket
+    if body and body[-1] == ']':
+        try:
+            await stats_cache.put(args, ''.join(body))
+        except RedisError as exc:
+            print('Stats cache error: {}'.format(exc))
+
+
+def query_int(name, default=None):
+    """
+        Return a non-negative integer query parameter or the default.
+    """
+    return parse_int(request.args.get(name), name, default)
+
+
+async def read_stats(offset, limit, min_count=0, key=REDIS_LOG_KEY_NAME,
+                     after=None):
+    """
+        Return one page of API counts in descending count order, and the
+        (count, member) to read the next page after or None.
+    """
+    if after is None:
+        data = await counter.top(key, offset, limit, min_count)
+    else:
+        data = top_rows(await counter.top_after(key, after, limit, min_count))
+    members = [row[0] for row in data]
+    urls = members
+    if path_keys and members:
+        urls = label(members, await redis.hmget(path_keys.key, members))
+    return stats_rows(data, urls), next_after(data, limit)
+
+
+async def stream_stats(offset=0, min_count=0, key=REDIS_LOG_KEY_NAME, after=None):
+    """
+        Generate the full stats JSON array one redis page at a time.
+    """
+    yield '['
+    first = True
+    while True:
+        try:
+            page, after = await read_stats(
+                offset, STATS_PAGE_SIZE, min_count, key, after)
+        except RedisError as exc:
+            # The status line has already been sent so the best we can do
+            # is stop; the truncated array tells the caller it failed.
+            print('Stats stream error: {}'.format(exc))
+            return
+
+        for row in page:
+            yield ('' if first else ',') + json.dumps(row)
+            first = False
+
+        if after is None:
+            break
+    yield ']'
+
+
+async def window_key(window):
+    """
+        Return the sorted set key holding the counts for the window,
+        building the cached union if needed (see windows.window_key).
+    """
+    key = windows.window_cache_key(REDIS_LOG_KEY_NAME, window)
+    if await redis.exists(key):
+        return key
+
+    now = time.time()
+    length = windows.WINDOWS[window]
+    candidates = windows.window_candidates(REDIS_LOG_KEY_NAME, length, now)
+    pipe = redis.pipeline(transaction=False)
+    for candidate in candidates:
+        pipe.exists(candidate)
+    rolled_up = {candidate for candidate, exists
+                 in zip(candidates, await pipe.execute()) if exists}
+
+    sources = windows.choose_sources(
+        REDIS_LOG_KEY_NAME, length, now, rolled_up)
+    pipe = redis.pipeline(transaction=False)
+    pipe.zunionstore(key, sources)
+    pipe.expire(key, settings.WINDOW_CACHE_SECONDS)
+    await pipe.execute()
+    return key
+
+
+def test_job_key(job_id):
+    return '{}:{}'.format(REDIS_TEST_JOB_KEY_PREFIX, job_id)
+
+
+async def save_test_job(job_id, job):
+    """
+        Store the job state where any process can report it.
+    """
+    await redis.set(test_job_key(job_id), json.dumps(job), ex=TEST_JOB_TTL)
+
+
+async def run_test_job(job_id, generator):
+    """
+        Run the load test in a thread and record its report.
+    """
+    loop = asyncio.get_event_loop()
+    try:
+        job = {'status': 'finished',
+               'report': await loop.run_in_executor(None, generator.run)}
+    except Exception as exc:
+        job = {'status': 'failed', 'error': str(exc)}
+    finally:
+        test_job_slots.release()
+
+    try:
+        await save_test_job(job_id, job)
+    except RedisError as exc:
+        print('Test job {} result lost: {}'.format(job_id, exc))
+
+
+async def log_api():
+    """
+        Log the API request in redis with one non-blocking pipeline.
+    """
+    counts = request_counts(request.path)
+    try:
+        pipe = redis.pipeline(transaction=False)
+        new_members = counter.queue(pipe, counts)
+        await pipe.execute()
+        counter.confirm(new_members)
+    except RedisError as exc:
+        return exc
@@ -0,0 +1,87 @@
+'''
+    Measure the per-request cost of path normalization.
+
+    Times PathNormalizer.normalize over paths shaped like the ones /test/
+    submits, both with a cold cache (every path new) and a warm cache
+    (paths repeating as they do in real traffic).
+
+        python bench_normalize.py --paths 100000 --templates 50
+'''
+
+import argparse
+import random
+import time
+
+from normalize import PathNormalizer
+
+ALLOWED = \
+    'abcdefghjkmnpqrstuvwxyz' \
+    'ABCDEFGHJKMNPQRSTUVWXYZ' \
+    '23456789'
+
+
+def random_segment():
+    return ''.join(random.choice(ALLOWED)
+                   for i in range(random.randrange(3, 9)))
+
+
+def random_path(static_segments):
+    """
+        Mix fixed route segments with random and numeric IDs.
+    """
+    segs = []
+    for index in range(random.randrange(1, 7)):
+        choice = random.random()
+        if choice < 0.5:
+            segs.append(random.choice(static_segments))
+        elif choice < 0.75:
+            segs.append(str(random.randrange(10 ** 9)))
+        else:
+            segs.append(random_segment())
+    return '/api/{}/'.format('/'.join(segs))
+
+
+def random_templates(count, static_segments):
+    templates = []
+    for index in range(count):
+        segs = [random.choice(static_segments + ['*'])
+                for i in range(random.randrange(1, 7))]
+        templates.append('/api/{}/'.format('/'.join(segs)))
+    return templates
+
+
+def time_per_call(normalizer, paths):
+    """
+        Return nanoseconds per normalize() call.
+    """
+    started = time.perf_counter()
+    for path in paths:
+        normalizer.normalize(path)
+    return (time.perf_counter() - started) * 1e9 / len(paths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--paths', type=int, default=100000)
+    parser.add_argument('--templates', type=int, default=50)
+    args = parser.parse_args()
+
+    random.seed(1)
+    static_segments = [random_segment() for i in range(20)]
+    templates = random_templates(args.templates, static_segments)
+    paths = [random_path(static_segments) for i in range(args.paths)]
+
+    # Real traffic repeats: draw a warm workload from 1% of the paths
+    hot = paths[:max(1, len(paths) // 100)]
+    repeated = [random.choice(hot) for i in range(len(paths))]
+
+    for replace_ids in (False, True):
+        normalizer = PathNormalizer(templates, replace_ids=replace_ids)
+        cold = time_per_call(normalizer, paths)
+        warm = time_per_call(normalizer, repeated)
+        print('replace_ids={!s:<5} templates={} cold={:.0f}ns warm={:.0f}ns '
+              'per request'.format(replace_ids, len(templates), cold, warm))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+'''
+    Compare redis memory for raw and hashed sorted set members.
+
+    Loads N distinct random API paths into scratch keys on a local redis
+    and reports MEMORY USAGE for each key with and without path hashing.
+
+    Run against the docker-compose redis with:
+        python bench_path_keys.py --host localhost 1000000 10000000
+
+    The scratch keys are deleted afterwards. 10M paths needs several GB
+    of redis memory.
+'''
+
+import argparse
+import random
+import time
+
+from redis import Redis
+
+from path_keys import path_hash
+
+BATCH_SIZE = 10000
+RAW_KEY = 'bench:api:raw'
+HASHED_KEY = 'bench:api:hashed'
+HASHED_PATHS_KEY = 'bench:api:hashed:paths'
+
+ALLOWED = \
+    'abcdefghjkmnpqrstuvwxyz' \
+    'ABCDEFGHJKMNPQRSTUVWXYZ' \
+    '23456789'
+
+
+def random_path():
+    """
+        Generate a path shaped like the ones /test/ submits.
+    """
+    segs = []
+    for index in range(random.randrange(1, 7)):
+        str_len = random.randrange(3, 9)
+        segs.append(''.join(random.choice(ALLOWED) for i in range(str_len)))
+    return '/api/{}/'.format('/'.join(segs))
+
+
+def load(redis, count, hashed):
+    """
+        Add count distinct paths in pipelined batches.
+    """
+    seen = set()
+    pipe = redis.pipeline(transaction=False)
+    while len(seen) < count:
+        path = random_path()
+        if path in seen:
+            continue
+        seen.add(path)
+        if hashed:
+            member = path_hash(path)
+            pipe.zincrby(HASHED_KEY, 1, member)
+            pipe.hsetnx(HASHED_PATHS_KEY, member, path)
+        else:
+            pipe.zincrby(RAW_KEY, 1, path)
+        if len(seen) % BATCH_SIZE == 0:
+            pipe.execute()
+    pipe.execute()
+
+
+def memory_usage(redis, key):
+    """
+        Return the bytes redis reports for the key, sampling every member.
+    """
+    return redis.memory_usage(key, samples=0) or 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=6379)
+    parser.add_argument('counts', type=int, nargs='*', default=[1000000])
+    args = parser.parse_args()
+
+    redis = Redis(host=args.host, port=args.port, socket_timeout=600)
+
+    print('{:>12} {:>8} {:>14} {:>14} {:>14} {:>8}'.format(
+        'paths', 'mode', 'zset bytes', 'map bytes', 'total bytes', 'secs'))
+    for count in args.counts:
+        for hashed in (False, True):
+            redis.delete(RAW_KEY, HASHED_KEY, HASHED_PATHS_KEY)
+            started = time.time()
+            random.seed(count)
+            load(redis, count, hashed)
+            elapsed = time.time() - started
+
+            zset_bytes = memory_usage(redis, HASHED_KEY if hashed else RAW_KEY)
+            map_bytes = memory_usage(redis, HASHED_PATHS_KEY) if hashed else 0
+            print('{:>12} {:>8} {:>14} {:>14} {:>14} {:>8.1f}'.format(
+                count,
+                'hashed' if hashed else 'raw',
+                zset_bytes,
+                map_bytes,
+                zset_bytes + map_bytes,
+                elapsed))
+    redis.delete(RAW_KEY, HASHED_KEY, HASHED_PATHS_KEY)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+'''
+    Compare the uWSGI and ASGI deployments side by side.
+
+    With the docker-compose stack running, this runs the same load
+    against uWSGI's own HTTP socket (port 5004) and uvicorn (port 5002),
+    both backed by the same local redis, and prints the reports
+    together. Neither goes through nginx (port 5000), so the comparison
+    doesn't include a proxy hop on one side only:
+
+        python bench_serving.py --duration 30 --concurrency 200
+'''
+
+import argparse
+
+from loadgen import LoadGenerator
+
+COLUMNS = ['requests', 'errors', 'throughput', 'p50_ms', 'p95_ms', 'p99_ms',
+           'max_ms']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--uwsgi', default='http://localhost:5004/api')
+    parser.add_argument('--asgi', default='http://localhost:5002/api')
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=[10, 100, 500])
+    args = parser.parse_args()
+
+    print('{:>8} {:>12} '.format('server', 'concurrency') +
+          ' '.join('{:>10}'.format(column) for column in COLUMNS))
+    for concurrency in args.concurrency:
+        for name, url in (('uwsgi', args.uwsgi), ('asgi', args.asgi)):
+            report = LoadGenerator(
+                url,
+                duration=args.duration,
+                concurrency=concurrency).run()
+            print('{:>8} {:>12} '.format(name, concurrency) +
+                  ' '.join('{:>10}'.format(report[column])
+                           for column in COLUMNS))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+'''
+    Request counter backends.
+
+    A backend queues count increments on a redis pipeline and reads the
+    highest counts back. Both backends expose the counts as a sorted set
+    at the logical key, so /stats/, windows and rollups read either one
+    with ZREVRANGEBYSCORE and ZUNIONSTORE.
+
+    zset    Exact counts. One ZINCRBY per path; memory grows with the
+            number of distinct paths.
+
+    sketch  Approximate heavy hitters. A Count-Min Sketch of depth rows
+            by width 32-bit counters is kept in a redis string (<key>:cms)
+            and updated with BITFIELD. The estimate for each incremented
+            path is written to a sorted set at <key> that is trimmed to
+            the top_k highest paths. Memory is 4 * width * depth bytes
+            plus top_k members, however many distinct paths are seen.
+
+            An estimate never undercounts. With N total requests it
+            overcounts by more than N * e / width with probability at
+            most e ** -depth. The default 65536 x 4 sketch (1 MiB) is off
+            by more than 0.0041% of N less than 1.9% of the time.
+            A path evicted from the top-K that returns re-enters with its
+            sketch estimate, so heavy hitters are not lost.
+
+    Pages after the first are read with top_after(), which continues from
+    the last (count, member) read rather than an offset, so every page
+    costs the same however deep it is.
+'''
+
+import hashlib
+
+REDIS_INT64_MAX = 9223372036854775807  # (2 power 63 -1)
+
+SKETCH_UPDATE_SCRIPT = '''
+local amount = ARGV[1]
+local member = ARGV[2]
+local top_k = tonumber(ARGV[3])
+local args = {'OVERFLOW', 'SAT'}
+for i = 4, #ARGV do
+    table.insert(args, 'INCRBY')
+    table.insert(args, 'u32')
+    table.insert(args, '#' .. ARGV[i])
+    table.insert(args, amount)
+end
+local estimate = nil
+for _, value in ipairs(redis.call('BITFIELD', KEYS[1], unpack(args))) do
+    if estimate == nil or value < estimate then
+        estimate = value
+    end
+end
+redis.call('ZADD', KEYS[2], estimate, member)
+local size = redis.call('ZCARD', KEYS[2])
+if size > top_k then
+    redis.call('ZREMRANGEBYRANK', KEYS[2], 0, size - top_k - 1)
+end
+return estimate
+'''
+
+# The page after the last (score, member) read. While the member still has
+# that score its rank is where the page starts, skipping the members tied
+# with it that were already read; ZREVRANK and ZREVRANGE by rank are both
+# O(log N), where ZREVRANGEBYSCORE ... LIMIT walks the offset. A member
+# whose count changed since continues below its old score (an exclusive
+# bound), skipping the rest of its ties.
+TOP_AFTER_SCRIPT = '''
+local score = redis.call('ZSCORE', KEYS[1], ARGV[2])
+local start
+if score and tonumber(score) == tonumber(ARGV[1]) then
+    start = redis.call('ZREVRANK', KEYS[1], ARGV[2]) + 1
+else
+    start = redis.call('ZCOUNT', KEYS[1], ARGV[1], '+inf')
+end
+local min_count = tonumber(ARGV[4])
+local rows = {}
+local page = redis.call('ZREVRANGE', KEYS[1], start, start + tonumber(ARGV[3]) - 1, 'WITHSCORES')
+for i = 1, #page, 2 do
+    if tonumber(page[i + 1]) < min_count then
+        break
+    end
+    table.insert(rows, {page[i], page[i + 1]})
+end
+return rows
+'''
+
+
+class ZSetCounter(object):
+
+    def __init__(self, redis, path_keys=None, ttl_for=None):
+        self.redis = redis
+        self.path_keys = path_keys
+        self.ttl_for = ttl_for
+        self.after = redis.register_script(TOP_AFTER_SCRIPT)
+
+    def queue(self, pipe, counts):
+        """
+            Queue the increments for a {(key, path): amount} dictionary.
+
+            ttl_for(key) may return a TTL in seconds to set on the key.
+            Returns the hashed members whose path mappings were queued;
+            pass them to confirm() once the pipeline has executed.
+        """
+        new_members = []
+        keys = set()
+        for (key, path), amount in counts.items():
+            keys.add(key)
+            member = path
+            if self.path_keys:
+                member, new = self.path_keys.map(pipe, path)
+                if new:
+                    new_members.append(member)
+            self.queue_incr(pipe, key, member, amount)
+
+        if self.ttl_for:
+            for key in keys:
+                ttl = self.ttl_for(key)
+                if ttl:
+                    self.queue_expire(pipe, key, ttl)
+        return new_members
+
+    def confirm(self, new_members):
+        if new_members:
+            self.path_keys.confirm(new_members)
+
+    def queue_incr(self, pipe, key, member, amount):
+        pipe.zincrby(key, amount, member)
+
+    def queue_expire(self, pipe, key, ttl):
+        pipe.expire(key, ttl)
+
+    def top(self, key, offset, limit, min_count=0):
+        """
+            Return [(member, count)] in descending count order.
+        """
+        return self.redis.zrevrangebyscore(
+            key,
+            REDIS_INT64_MAX,
+            min_count,
+            start=offset,
+            num=limit,
+            withscores=True)
+
+    def top_after(self, key, after, limit, min_count=0):
+        """
+            Return the page after the (count, member) of the last row
+            read, in descending count order. Pass the result through
+            top_rows() for the same rows as top().
+        """
+        count, member = after
+        return self.after(keys=[key], args=[repr(count), member, limit, min_count])
+
+
+class SketchCounter(ZSetCounter):
+
+    def __init__(self, redis, path_keys=None, ttl_for=None,
+                 width=65536, depth=4, top_k=1000):
+        super(SketchCounter, self).__init__(redis, path_keys, ttl_for)
+        self.width = width
+        self.depth = depth
+        self.top_k = top_k
+        self.update = redis.register_script(SKETCH_UPDATE_SCRIPT)
+
+    def offsets(self, member):
+        """
+            Return the counter index for member in each sketch row.
+
+            Two 64-bit halves of one hash generate the row hashes
+            (Kirsch-Mitzenmacher), so one digest serves every row.
+        """
+        digest = hashlib.blake2b(member.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [row * self.width + (h1 + row * h2) % self.width
+                for row in range(self.depth)]
+
+    def queue_incr(self, pipe, key, member, amount):
+        # Queue EVALSHA directly, as Script.__call__ does for pipelines,
+        # so the same code works with sync and asyncio pipelines. The
+        # pipeline loads the script first if redis does not have it.
+        pipe.scripts.add(self.update)
+        pipe.evalsha(
+            self.update.sha,
+            2,
+            sketch_key(key),
+            key,
+            int(amount),
+            member,
+            self.top_k,
+            *self.offsets(member))
+
+    def queue_expire(self, pipe, key, ttl):
+        pipe.expire(key, ttl)
+        pipe.expire(sketch_key(key), ttl)
+
+
+def top_rows(rows):
+    """
+        Return top_after() script rows as [(member, count)].
+    """
+    return [(member, float(count)) for member, count in rows]
+
+
+def sketch_key(key):
+    return '{}:cms'.format(key)
+
+
+BACKENDS = {
+    'zset': ZSetCounter,
+    'sketch': SketchCounter,
+}
@@ -0,0 +1,143 @@
+'''
+    Request counting setup shared by the WSGI (app.py) and ASGI
+    (asgi.py) entry points.
+
+    The counter and path key objects only queue commands on a pipeline,
+    so the same objects work with the sync and asyncio redis clients.
+'''
+
+import base64
+import json
+
+from counters import BACKENDS, SketchCounter
+from normalize import PathNormalizer
+from path_keys import PathKeys
+import settings
+import windows
+
+REDIS_LOG_KEY_NAME = 'api'
+REDIS_PATHS_KEY_NAME = 'api:paths'
+REDIS_RAW_LOG_KEY_NAME = 'api:raw'
+REDIS_TEST_JOB_KEY_PREFIX = 'api:test'
+
+# Seconds a finished test job report is kept
+TEST_JOB_TTL = 24 * 60 * 60
+
+# Rows read from redis per round trip when streaming the full stats set
+STATS_PAGE_SIZE = 1000
+
+# Largest /stats/ limit; the full set is streamed by leaving limit out
+STATS_MAX_LIMIT = STATS_PAGE_SIZE
+
+# Largest /stats/ offset; redis walks the offset on every read, so deeper
+# pages are read with the X-Next-Cursor cursor instead
+STATS_MAX_OFFSET = 10000
+
+normalizer = None
+if settings.PATH_TEMPLATES or settings.NORMALIZE_IDS:
+    normalizer = PathNormalizer(
+        settings.PATH_TEMPLATES,
+        replace_ids=settings.NORMALIZE_IDS)
+
+
+def create_path_keys(redis):
+    """
+        Return the configured PathKeys or None.
+    """
+    if settings.HASH_PATHS_ENABLED:
+        return PathKeys(
+            redis,
+            REDIS_PATHS_KEY_NAME,
+            max_seen=settings.HASH_PATHS_MAX_SEEN)
+
+
+def create_counter(redis, path_keys=None):
+    """
+        Return the configured counter backend.
+    """
+    counter_options = {}
+    if BACKENDS[settings.COUNTER_BACKEND] is SketchCounter:
+        counter_options = {
+            'width': settings.SKETCH_WIDTH,
+            'depth': settings.SKETCH_DEPTH,
+            'top_k': settings.SKETCH_TOP_K,
+        }
+    return BACKENDS[settings.COUNTER_BACKEND](
+        redis,
+        path_keys=path_keys,
+        # TTLs for the time bucket keys
+        ttl_for=windows.bucket_ttl if settings.WINDOWS_ENABLED else None,
+        **counter_options)
+
+
+def request_counts(path):
+    """
+        Return the {(key, member): amount} counts for a request path.
+    """
+    member = normalizer.normalize(path) if normalizer else path
+    counts = {(REDIS_LOG_KEY_NAME, member): 1}
+    if normalizer and settings.COUNT_RAW_PATHS:
+        counts[(REDIS_RAW_LOG_KEY_NAME, path)] = 1
+    if settings.WINDOWS_ENABLED:
+        counts[(windows.minute_key(REDIS_LOG_KEY_NAME), member)] = 1
+    return counts
+
+
+def stats_rows(data, urls):
+    """
+        Return the stats response rows for counter.top() data.
+    """
+    # The redis response is an ordered list of lists:
+    #   [["/stats",13.0],["/api/1/2/3/4/5",6.0]]
+    # and I prefer an ordered list of dictionaries so the
+    # caller doesn't need to guess which is which.
+    # Ordering is by descending request count
+    response_data = []
+    for row, url in zip(data, urls):
+        response_data.append({'count': row[1], 'url': url})
+    return response_data
+
+
+def next_after(data, limit):
+    """
+        Return the (count, member) to read the next page after, or None
+        when the counter.top() page is the last.
+    """
+    if len(data) < limit or not data:
+        return None
+    member, count = data[-1]
+    return count, member
+
+
+def encode_cursor(after):
+    """
+        Return the X-Next-Cursor value for a next_after() pair.
+    """
+    return base64.urlsafe_b64encode(
+        json.dumps(after, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(value):
+    """
+        Return the (count, member) of an X-Next-Cursor value.
+        Raises ValueError if it isn't one.
+    """
+    try:
+        count, member = json.loads(base64.urlsafe_b64decode(value.encode('ascii')))
+    except (TypeError, ValueError):
+        raise ValueError('cursor')
+    if not isinstance(count, (int, float)) or not isinstance(member, str):
+        raise ValueError('cursor')
+    return count, member
+
+
+def parse_int(value, name, default=None):
+    """
+        Return a non-negative integer query parameter or the default.
+    """
+    if value is None:
+        return default
+    value = int(value)
+    if value < 0:
+        raise ValueError(name)
+    return value
@@ -0,0 +1,268 @@
+'''
+    Concurrent load generator for the API.
+
+    Requests are sent from a pool of worker threads, each with its own
+    pooled requests.Session so connections are reused. A run stops after
+    a request count or a duration and can be paced to a target rate.
+
+    Example:
+        python loadgen.py http://localhost:5000/api --count 10000 \
+            --concurrency 50
+        python loadgen.py http://localhost:5000/api --duration 30 --rps 2000
+
+    The report includes throughput and a p50/p95/p99 latency histogram.
+'''
+
+import argparse
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+import json
+import math
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def generate_path_segments():
+    """
+        Generate and return a list of three random strings.
+    """
+
+    # Constrain path characters to alphanumeric and
+    # skip lookalikes (1, i, l, 0, o)
+    allowed = \
+        'abcdefghjkmnpqrstuvwxyz' \
+        'ABCDEFGHJKMNPQRSTUVWXYZ' \
+        '23456789'
+
+    segs = []
+    for index in range(3):
+        # I will allow API path segments to be 3-8 characters
+        str_len = random.randrange(3, 9)
+        segs.append(''.join(random.choice(allowed) for i in range(str_len)))
+    return segs
+
+
+def generate_url(base_url, path_segments):
+    """
+        Return a URL of one to six segments drawn from path_segments.
+    """
+    # Randomly determine the number of segments in this request
+    path_count = random.randrange(1, 7)
+    segs = [path_segments[random.randrange(0, 3)] for i in range(path_count)]
+    return '{}/{}/'.format(base_url, '/'.join(segs))
+
+
+class LatencyHistogram(object):
+    """
+        Latencies in log-spaced buckets (5% wide) so memory stays
+        constant however many requests are recorded.
+    """
+
+    GROWTH = 1.05
+    MIN_SECONDS = 1e-5
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.max = 0.0
+
+    def record(self, seconds):
+        index = max(0, int(math.log(max(seconds, self.MIN_SECONDS) /
+                                    self.MIN_SECONDS, self.GROWTH)))
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def upper_bound(self, index):
+        return self.MIN_SECONDS * self.GROWTH ** (index + 1)
+
+    def percentile(self, pct):
+        """
+            Return the latency in seconds at or below which pct percent
+            of requests completed, to within the bucket width.
+        """
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * pct / 100.0)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(self.upper_bound(index), self.max)
+        return self.max
+
+    def rows(self):
+        """
+            Return [(upper bound seconds, count)] for non-empty buckets.
+        """
+        return [(self.upper_bound(index), self.buckets[index])
+                for index in sorted(self.buckets)]
+
+
+class LoadGenerator(object):
+
+    def __init__(self, base_url, count=None, duration=None, concurrency=10,
+                 rps=None, timeout=10):
+        if count is None and duration is None:
+            raise ValueError('A count or a duration is required')
+        self.base_url = base_url.rstrip('/')
+        self.count = count
+        self.duration = duration
+        self.concurrency = concurrency
+        self.rps = rps
+        self.timeout = timeout
+
+        # Per the spec, path segments are used across all requests in a test
+        self.path_segments = generate_path_segments()
+
+        self.lock = threading.Lock()
+        self.issued = 0
+        self.sent = 0
+        self.errors = 0
+        self.histogram = LatencyHistogram()
+        self.started = None
+        self.stopped = threading.Event()
+
+    def next_slot(self):
+        """
+            Claim the next request and return when it should be sent,
+            or None once the run is complete.
+        """
+        with self.lock:
+            if self.stopped.is_set():
+                return None
+            if self.count is not None and self.issued >= self.count:
+                return None
+            slot = self.issued
+            self.issued += 1
+
+        if self.rps:
+            send_at = self.started + slot / float(self.rps)
+        else:
+            send_at = time.time()
+        if self.duration is not None and \
+                send_at >= self.started + self.duration:
+            return None
+        return send_at
+
+    def worker(self):
+        """
+            Send requests on one pooled session until the run completes.
+        """
+        session = requests.Session()
+        session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        histogram = LatencyHistogram()
+        sent = errors = 0
+
+        while True:
+            send_at = self.next_slot()
+            if send_at is None:
+                break
+            delay = send_at - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+            url = generate_url(self.base_url, self.path_segments)
+            started = time.perf_counter()
+            try:
+                response = session.get(url, timeout=self.timeout)
+                if response.status_code >= 400:
+                    errors += 1
+            except requests.exceptions.RequestException:
+                errors += 1
+            histogram.record(time.perf_counter() - started)
+            sent += 1
+
+        session.close()
+        with self.lock:
+            self.histogram.merge(histogram)
+            self.sent += sent
+            self.errors += errors
+
+    def run(self):
+        """
+            Run the load and return the report.
+
+            If a worker raises, the others are stopped and the exception
+            is raised rather than reporting on fewer requests.
+        """
+        self.started = time.time()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = [executor.submit(self.worker)
+                       for i in range(self.concurrency)]
+            done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+            if pending:
+                self.stop()
+        for future in futures:
+            future.result()
+        return self.report(time.time() - self.started)
+
+    def stop(self):
+        self.stopped.set()
+
+    def report(self, elapsed):
+        return {
+            'requests': self.sent,
+            'errors': self.errors,
+            'seconds': round(elapsed, 3),
+            'throughput': round(self.sent / elapsed, 1) if elapsed else 0,
+            'concurrency': self.concurrency,
+            'target_rps': self.rps,
+            'p50_ms': round(self.histogram.percentile(50) * 1000, 2),
+            'p95_ms': round(self.histogram.percentile(95) * 1000, 2),
+            'p99_ms': round(self.histogram.percentile(99) * 1000, 2),
+            'max_ms': round(self.histogram.max * 1000, 2),
+            'histogram': [[round(bound * 1000, 3), count]
+                          for bound, count in self.histogram.rows()],
+        }
+
+
+def print_report(report):
+    print('{requests} requests, {errors} errors in {seconds}s '
+          '({throughput} req/s, concurrency {concurrency})'.format(**report))
+    print('latency p50 {p50_ms}ms  p95 {p95_ms}ms  p99 {p99_ms}ms  '
+          'max {max_ms}ms'.format(**report))
+    print('{:>12}  {}'.format('<= ms', 'count'))
+    for bound, count in report['histogram']:
+        print('{:>12}  {}'.format(bound, count))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate API load.')
+    parser.add_argument('base_url', help='e.g. http://localhost:5000/api')
+    parser.add_argument('--count', type=int, help='requests to send')
+    parser.add_argument('--duration', type=float, help='seconds to run')
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--rps', type=float, help='target requests/second')
+    parser.add_argument('--json', action='store_true',
+                        help='print the report as JSON')
+    args = parser.parse_args()
+
+    if args.count is None and args.duration is None:
+        parser.error('one of --count or --duration is required')
+
+    report = LoadGenerator(
+        args.base_url,
+        count=args.count,
+        duration=args.duration,
+        concurrency=args.concurrency,
+        rps=args.rps).run()
+
+    if args.json:
+        print(json.dumps(report))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
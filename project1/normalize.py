@@ -0,0 +1,105 @@
+'''
+    Collapse concrete API paths into route templates.
+
+    Templates are written with '*' for any segment, for example
+        /api/*/def/
+    counts /api/abc/def/ and /api/xyz/def/ as the single member
+    '/api/*/def/'. The templates are compiled into a trie over path
+    segments so matching costs one dictionary lookup per segment.
+
+    Paths that match no template can optionally have ID-like segments
+    (numbers, UUIDs and long hex strings) replaced with '<id>'.
+
+    Results are memoized because the same paths repeat heavily.
+'''
+
+from functools import lru_cache
+import re
+
+WILDCARD = '*'
+ID_PLACEHOLDER = '<id>'
+
+ID_SEGMENT = re.compile(
+    r'^(?:\d+'
+    r'|[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?'
+    r'[0-9a-fA-F]{4}-?[0-9a-fA-F]{12}'
+    r'|[0-9a-fA-F]{16,})$')
+
+
+class TrieNode(object):
+    __slots__ = ('children', 'wildcard', 'template')
+
+    def __init__(self):
+        self.children = {}
+        self.wildcard = None
+        self.template = None
+
+
+class PathNormalizer(object):
+
+    def __init__(self, templates=(), replace_ids=False, cache_size=65536):
+        self.root = TrieNode()
+        self.replace_ids = replace_ids
+        for template in templates:
+            self.add_template(template)
+        self.normalize = lru_cache(maxsize=cache_size)(self._normalize)
+
+    def add_template(self, template):
+        """
+            Compile a template into the trie.
+        """
+        node = self.root
+        for segment in split_path(template):
+            if segment == WILDCARD:
+                if node.wildcard is None:
+                    node.wildcard = TrieNode()
+                node = node.wildcard
+            else:
+                node = node.children.setdefault(segment, TrieNode())
+        node.template = template
+
+    def match(self, segments, index=0, node=None):
+        """
+            Return the template matching the segments, preferring
+            literal segments over wildcards.
+        """
+        node = node or self.root
+        if index == len(segments):
+            return node.template
+
+        child = node.children.get(segments[index])
+        if child is not None:
+            template = self.match(segments, index + 1, child)
+            if template is not None:
+                return template
+
+        if node.wildcard is not None:
+            return self.match(segments, index + 1, node.wildcard)
+
+    def _normalize(self, path):
+        """
+            Return the template for the path, the path with ID-like
+            segments replaced, or the path itself.
+        """
+        segments = split_path(path)
+        template = self.match(segments)
+        if template is not None:
+            return template
+
+        if self.replace_ids:
+            replaced = [ID_PLACEHOLDER if ID_SEGMENT.match(segment) else segment
+                        for segment in segments]
+            if replaced != segments:
+                return join_path(replaced, path.endswith('/'))
+        return path
+
+
+def split_path(path):
+    """
+        Return the non-empty segments of the path.
+    """
+    return [segment for segment in path.split('/') if segment]
+
+
+def join_path(segments, trailing_slash):
+    return '/{}{}'.format('/'.join(segments), '/' if trailing_slash else '')
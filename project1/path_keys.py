@@ -0,0 +1,79 @@
+'''
+    Hashed sorted set members for API paths.
+
+    Instead of storing the request path as the sorted set member, a
+    fixed-width hash of the path is stored and the hash to path mapping
+    is kept in a separate redis hash. The mapping is written with HSETNX
+    only the first time a worker sees a path, so the steady state cost
+    per request is the same single ZINCRBY.
+'''
+
+import base64
+import hashlib
+
+
+def path_hash(path):
+    """
+        Return an 11 character URL-safe hash of the path.
+
+        64 bits keeps the chance of a collision below one in a million
+        until several million distinct paths have been recorded.
+    """
+    digest = hashlib.blake2b(path.encode('utf-8'), digest_size=8).digest()
+    return base64.urlsafe_b64encode(digest).decode('ascii').rstrip('=')
+
+
+class PathKeys(object):
+
+    def __init__(self, redis, key, max_seen=100000):
+        self.redis = redis
+        self.key = key
+        self.max_seen = max_seen
+        self.seen = set()
+
+    def member(self, path):
+        """
+            Return the sorted set member for the path.
+        """
+        return path_hash(path)
+
+    def map(self, pipe, path):
+        """
+            Return (member, new) for the path.
+
+            When the worker has not seen the path before its mapping is
+            queued on the pipeline and new is True; pass such members to
+            confirm() once the pipeline has executed.
+        """
+        member = self.member(path)
+        if member in self.seen:
+            return member, False
+        pipe.hsetnx(self.key, member, path)
+        return member, True
+
+    def confirm(self, members):
+        """
+            Record mappings that are known to be written to redis.
+        """
+        # The seen set only saves redundant HSETNX calls so it is
+        # cleared rather than allowed to grow without bound.
+        if len(self.seen) + len(members) > self.max_seen:
+            self.seen.clear()
+        self.seen.update(members)
+
+    def resolve(self, members):
+        """
+            Return the paths for the members with one HMGET.
+
+            A member with no mapping is returned as is.
+        """
+        if not members:
+            return []
+        return label(members, self.redis.hmget(self.key, members))
+
+
+def label(members, paths):
+    """
+        Pair HMGET results with their members, keeping unmapped members.
+    """
+    return [path or member for member, path in zip(members, paths)]
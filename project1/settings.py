@@ -0,0 +1,105 @@
+'''
+    Application settings.
+
+    Values are read from the environment so the same image can be
+    deployed with different behavior from docker-compose.yml.
+'''
+
+import os
+
+
+def env_flag(name, default=False):
+    """
+        Return True if the environment variable is set to a true value.
+    """
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def env_int(name, default):
+    """
+        Return the environment variable as an int or the default.
+    """
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def env_float(name, default):
+    """
+        Return the environment variable as a float or the default.
+    """
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+REDIS_HOST = os.environ.get('REDIS_HOST', 'redis')
+
+# Write-behind request counting. When enabled each worker buffers counts
+# in memory and flushes them to redis with one pipeline of ZINCRBYs.
+WRITE_BEHIND_ENABLED = env_flag('API_WRITE_BEHIND')
+
+# Flush once this many requests have been buffered...
+WRITE_BEHIND_FLUSH_SIZE = env_int('API_WRITE_BEHIND_FLUSH_SIZE', 500)
+
+# ...or once this many seconds have passed since the last flush.
+WRITE_BEHIND_FLUSH_INTERVAL = env_float('API_WRITE_BEHIND_FLUSH_INTERVAL', 1.0)
+
+# Upper bound on the distinct paths held in memory per worker.
+WRITE_BEHIND_MAX_KEYS = env_int('API_WRITE_BEHIND_MAX_KEYS', 10000)
+
+# Store a fixed-width hash of each path as the sorted set member and keep
+# the hash to path mapping in a separate redis hash.
+HASH_PATHS_ENABLED = env_flag('API_HASH_PATHS')
+
+# Paths each worker remembers as already mapped before it resets.
+HASH_PATHS_MAX_SEEN = env_int('API_HASH_PATHS_MAX_SEEN', 100000)
+
+# Route templates, comma separated, that concrete paths are counted as.
+# Use '*' for a variable segment, for example '/api/*/def/'.
+PATH_TEMPLATES = [template.strip() for template in
+                  os.environ.get('API_PATH_TEMPLATES', '').split(',')
+                  if template.strip()]
+
+# Replace numeric, UUID and long hex path segments with '<id>'.
+NORMALIZE_IDS = env_flag('API_NORMALIZE_IDS')
+
+# Also count the concrete paths in 'api:raw' while normalizing.
+COUNT_RAW_PATHS = env_flag('API_COUNT_RAW_PATHS')
+
+# Also count requests in per-minute buckets so /stats/?window=5m|1h|24h
+# can report recent traffic. Run windows.py to roll buckets up.
+WINDOWS_ENABLED = env_flag('API_WINDOWS')
+
+# Seconds a window union is reused before it is rebuilt.
+WINDOW_CACHE_SECONDS = env_int('API_WINDOW_CACHE_SECONDS', 5)
+
+# Counter backend: 'zset' for exact counts or 'sketch' for approximate
+# heavy hitters in constant memory (see counters.py).
+COUNTER_BACKEND = os.environ.get('API_COUNTER_BACKEND', 'zset')
+
+# Count-Min Sketch counters per row, rows, and paths kept in the top-K.
+SKETCH_WIDTH = env_int('API_SKETCH_WIDTH', 65536)
+SKETCH_DEPTH = env_int('API_SKETCH_DEPTH', 4)
+SKETCH_TOP_K = env_int('API_SKETCH_TOP_K', 1000)
+
+# WARNING
+# host.docker.internal is NOT production safe.
+# Set API_TEST_BASE_URL to the production domain.
+TEST_BASE_URL = os.environ.get(
+    'API_TEST_BASE_URL', 'http://host.docker.internal:5000/api')
+
+# Upper bound on the concurrency a /test/ request may ask for.
+TEST_MAX_CONCURRENCY = env_int('API_TEST_MAX_CONCURRENCY', 100)
+
+# Load tests a process runs at once; further /test/ requests get a 429.
+TEST_MAX_JOBS = env_int('API_TEST_MAX_JOBS', 2)
+
+# Redis connections shared by all requests in an ASGI (asgi.py) process.
+ASGI_REDIS_MAX_CONNECTIONS = env_int('API_ASGI_REDIS_MAX_CONNECTIONS', 50)
+
+# Max staleness in seconds of cached /stats/ responses; 0 disables the
+# cache. Responses larger than the byte limit are not cached.
+STATS_CACHE_SECONDS = env_int('API_STATS_CACHE_SECONDS', 0)
+STATS_CACHE_MAX_BYTES = env_int('API_STATS_CACHE_MAX_BYTES', 1024 * 1024)
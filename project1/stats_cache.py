@@ -0,0 +1,103 @@
+'''
+    Shared /stats/ response cache.
+
+    Rendered /stats/ responses are stored in redis so every worker and
+    process reuses them, keyed by the query string:
+        api:stats:cache:<hash of query parameters>
+    Each entry is a hash of the response body, its ETag and the
+    X-Next-Cursor value for paged responses. It expires after the
+    configured max staleness, which bounds how out of date a cached
+    count can be. Counts change with every request, /stats/ included,
+    so the TTL is the invalidation.
+
+    A poller that sends If-None-Match with the current ETag gets a 304
+    after a single HGET of the ETag, without the body being read.
+'''
+
+import hashlib
+
+
+def cache_key(prefix, args):
+    """
+        Return the cache key for the query parameters.
+    """
+    query = '&'.join('{}={}'.format(name, value)
+                     for name, value in sorted(args.items()))
+    digest = hashlib.sha1(query.encode('utf-8')).hexdigest()
+    return '{}:stats:cache:{}'.format(prefix, digest)
+
+
+def make_etag(body):
+    return hashlib.sha1(body.encode('utf-8')).hexdigest()[:20]
+
+
+class StatsCache(object):
+
+    def __init__(self, redis, prefix, max_age=5, max_body=1024 * 1024):
+        self.redis = redis
+        self.prefix = prefix
+        self.max_age = max_age
+        self.max_body = max_body
+
+    def get(self, args, if_none_match=None):
+        """
+            Return the cached entry {'etag', 'body', 'cursor'} or None.
+
+            When the cached ETag is in if_none_match the body is not read
+            and only {'etag'} is returned.
+        """
+        key = cache_key(self.prefix, args)
+        if if_none_match:
+            etag = self.redis.hget(key, 'etag')
+            if etag is None:
+                return None
+            if etag in if_none_match:
+                return {'etag': etag}
+        return self.redis.hgetall(key) or None
+
+    def put(self, args, body, cursor=None):
+        """
+            Cache the body and return its ETag. Bodies larger than
+            max_body are not cached.
+        """
+        etag = make_etag(body)
+        if len(body) <= self.max_body:
+            # MULTI so readers never see a half-written entry
+            pipe = self.redis.pipeline()
+            self.queue_put(pipe, args, etag, body, cursor)
+            pipe.execute()
+        return etag
+
+    def queue_put(self, pipe, args, etag, body, cursor):
+        key = cache_key(self.prefix, args)
+        entry = {'etag': etag, 'body': body}
+        if cursor is not None:
+            entry['cursor'] = cursor
+        pipe.delete(key)
+        pipe.hset(key, mapping=entry)
+        pipe.expire(key, self.max_age)
+
+
+class AsyncStatsCache(StatsCache):
+    """
+        StatsCache for the asyncio redis client used by asgi.py.
+    """
+
+    async def get(self, args, if_none_match=None):
+        key = cache_key(self.prefix, args)
+        if if_none_match:
+            etag = await self.redis.hget(key, 'etag')
+            if etag is None:
+                return None
+            if etag in if_none_match:
+                return {'etag': etag}
+        return await self.redis.hgetall(key) or None
+
+    async def put(self, args, body, cursor=None):
+        etag = make_etag(body)
+        if len(body) <= self.max_body:
+            # MULTI so readers never see a half-written entry
+            pipe = self.redis.pipeline()
+            self.queue_put(pipe, args, etag, body, cursor)
+            await pipe.execute()
+        return etag
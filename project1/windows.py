@@ -0,0 +1,220 @@
+'''
+    Time-windowed API request counts.
+
+    Besides the all-time 'api' sorted set, each request is counted in a
+    per-minute bucket:
+        api:m:<epoch minute>
+    A background rollup compacts completed minutes into hour buckets and
+    completed hours into day buckets:
+        api:h:<epoch hour>
+        api:d:<epoch day>
+    Every bucket has a TTL so memory stays bounded.
+
+    A window such as the last 24 hours is answered by ZUNIONSTORE over
+    the coarsest buckets that cover it (day, then hour, then minute) into
+    a short-lived cache key, so repeated queries reuse one union.
+
+    Run the rollup loop with:
+        python windows.py
+'''
+
+import argparse
+import time
+
+from redis import Redis, RedisError
+
+import settings
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+# Window name to length in seconds
+WINDOWS = {
+    '5m': 5 * MINUTE,
+    '15m': 15 * MINUTE,
+    '1h': HOUR,
+    '24h': DAY,
+    '7d': 7 * DAY,
+}
+
+# Bucket granularities, coarsest first: (name, seconds, ttl seconds).
+# Each TTL outlives the rollup that reads the bucket.
+BUCKETS = (
+    ('d', DAY, 8 * DAY),
+    ('h', HOUR, 2 * DAY),
+    ('m', MINUTE, 3 * HOUR),
+)
+BUCKET_TTLS = {name: ttl for name, seconds, ttl in BUCKETS}
+
+# A bucket is rolled up this long after it closes so write-behind
+# flushes for the bucket have landed.
+ROLLUP_GRACE = 2 * MINUTE
+
+
+def bucket_key(prefix, name, seconds, timestamp):
+    """
+        Return the key of the bucket holding timestamp.
+    """
+    return '{}:{}:{}'.format(prefix, name, int(timestamp // seconds))
+
+
+def minute_key(prefix, timestamp=None):
+    """
+        Return the minute bucket for timestamp (now by default).
+    """
+    return bucket_key(prefix, 'm', MINUTE,
+                      time.time() if timestamp is None else timestamp)
+
+
+def bucket_ttl(key):
+    """
+        Return the TTL for a bucket key or None for any other key.
+    """
+    parts = key.rsplit(':', 2)
+    if len(parts) == 3 and parts[2].isdigit():
+        return BUCKET_TTLS.get(parts[1])
+
+
+def window_candidates(prefix, window, now):
+    """
+        Return the day and hour buckets that could cover part of the
+        window; window_sources() checks which of them exist.
+    """
+    start = now - window
+    candidates = []
+    for name, seconds, ttl in BUCKETS[:-1]:
+        t = (int(start) // seconds + 1) * seconds
+        while t + seconds <= now:
+            candidates.append(bucket_key(prefix, name, seconds, t))
+            t += seconds
+    return candidates
+
+
+def choose_sources(prefix, window, now, rolled_up):
+    """
+        Return the bucket keys that cover the window given the set of
+        coarse buckets that have been rolled up.
+
+        Coarse buckets are used only where they cover whole intervals
+        and have already been rolled up; otherwise the window falls back
+        to the next finer granularity.
+    """
+    start = now - window
+    sources = []
+    t = int(start) // MINUTE * MINUTE + MINUTE
+    end = int(now) // MINUTE * MINUTE
+    while t <= end:
+        for index, (name, seconds, ttl) in enumerate(BUCKETS):
+            key = bucket_key(prefix, name, seconds, t)
+            if seconds == MINUTE:
+                usable = True
+            else:
+                # Once the finer buckets have expired the coarse bucket is
+                # all there is, even if it is missing for lack of traffic.
+                finer_ttl = BUCKETS[index + 1][2]
+                usable = t % seconds == 0 and t + seconds <= now and (
+                    key in rolled_up or t + seconds < now - finer_ttl)
+            if usable:
+                sources.append(key)
+                t += seconds
+                break
+    return sources
+
+
+def window_sources(redis, prefix, window, now=None):
+    """
+        Return the bucket keys that cover the last window seconds.
+    """
+    now = time.time() if now is None else now
+
+    # One EXISTS round trip for every candidate day and hour bucket
+    candidates = window_candidates(prefix, window, now)
+    pipe = redis.pipeline(transaction=False)
+    for key in candidates:
+        pipe.exists(key)
+    rolled_up = {key for key, exists in zip(candidates, pipe.execute())
+                 if exists}
+    return choose_sources(prefix, window, now, rolled_up)
+
+
+def window_cache_key(prefix, window_name):
+    return '{}:window:{}'.format(prefix, window_name)
+
+
+def window_key(redis, prefix, window_name, cache_seconds=5):
+    """
+        Return a sorted set key holding the counts for the named window.
+
+        The union is cached under api:window:<name> for cache_seconds.
+    """
+    key = window_cache_key(prefix, window_name)
+    if redis.exists(key):
+        return key
+
+    sources = window_sources(redis, prefix, WINDOWS[window_name])
+    pipe = redis.pipeline(transaction=False)
+    pipe.zunionstore(key, sources)
+    pipe.expire(key, cache_seconds)
+    pipe.execute()
+    return key
+
+
+def rollup(redis, prefix, now=None):
+    """
+        Compact closed minute buckets into hours and hours into days.
+
+        Only buckets that are missing are built, so the rollup can run
+        as often as needed. Returns the keys written.
+    """
+    now = time.time() if now is None else now
+    written = []
+
+    # Finest first so a new hour is available to the day rollup
+    for (name, seconds, ttl), (source_name, source_seconds, source_ttl) in \
+            zip(reversed(BUCKETS[:-1]), reversed(BUCKETS[1:])):
+        # Only buckets whose sources have not yet expired can be built
+        first = int(now - source_ttl) // seconds * seconds + seconds
+        t = first
+        while t + seconds + ROLLUP_GRACE <= now:
+            key = bucket_key(prefix, name, seconds, t)
+            if not redis.exists(key):
+                sources = [
+                    bucket_key(prefix, source_name, source_seconds, s)
+                    for s in range(t, t + seconds, source_seconds)]
+                pipe = redis.pipeline(transaction=False)
+                pipe.zunionstore(key, sources)
+                pipe.expire(key, ttl)
+                count, expired = pipe.execute()
+                if count:
+                    written.append(key)
+            t += seconds
+    return written
+
+
+def main():
+    """
+        Run the rollup once a minute.
+    """
+    parser = argparse.ArgumentParser(description='Roll up API count buckets.')
+    parser.add_argument('--prefix', default='api')
+    args = parser.parse_args()
+
+    redis = Redis(
+        host=settings.REDIS_HOST,
+        db=0,
+        socket_connect_timeout=2,
+        socket_timeout=30,
+        decode_responses=True)
+    while True:
+        try:
+            written = rollup(redis, args.prefix)
+            if written:
+                print('Rolled up {}'.format(', '.join(written)))
+        except RedisError as exc:
+            print('Rollup error: {}'.format(exc))
+        time.sleep(MINUTE)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+'''
+    Write-behind buffer for API request counts.
+
+    Each uWSGI worker adds counts to an in-process dictionary and flushes
+    them to redis with one pipeline of counter updates (ZINCRBY for the
+    default backend) once the buffer reaches a size or age threshold.
+    This removes the redis round trip from the request path at the cost
+    of losing buffered counts if the worker process crashes.
+
+    Counts are keyed by (sorted set, member) so one buffer can feed
+    several sorted sets.
+
+    Per-worker metrics are written to a redis hash by each flush, in its
+    pipeline after the counts, so they describe the buffer once the
+    flushed counts are in redis:
+        pending      counts buffered since (lost if the worker dies now)
+        max_pending  high-water mark of pending counts at flush time
+        flushed      counts written to redis
+        dropped      counts discarded because the buffer was full
+                     and redis was unavailable
+        flush_errors failed flush attempts
+    The worker removes its entry on a clean shutdown, so an entry left
+    behind by a dead worker bounds the counts lost by its max_pending.
+'''
+
+import atexit
+import json
+import os
+import socket
+import threading
+import time
+
+from redis import RedisError
+
+from counters import ZSetCounter
+
+
+class WriteBehindBuffer(object):
+
+    def __init__(self, redis, key, flush_size=500, flush_interval=1.0,
+                 max_keys=10000, metrics_key=None, counter=None):
+        self.redis = redis
+        self.counter = counter or ZSetCounter(redis)
+        self.key = key
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_keys = max_keys
+        self.metrics_key = metrics_key or '{}:write_behind'.format(key)
+
+        self.counts = {}
+        self.pending = 0
+        self.max_pending = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.flush_errors = 0
+        self.last_flush = time.time()
+
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+
+        # The flush thread is started lazily by the worker that uses the
+        # buffer since threads started before uWSGI forks do not survive.
+        self.pid = None
+        self.thread = None
+        self.stopped = threading.Event()
+
+    @property
+    def worker_id(self):
+        return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+    def add(self, member, amount=1, key=None):
+        """
+            Buffer a count for member of the sorted set key (the buffer's
+            own key by default), flushing when a threshold is hit.
+
+            Returns a RedisError only when the count had to be dropped.
+        """
+        self.start()
+        entry = (key or self.key, member)
+
+        with self.lock:
+            full = entry not in self.counts and \
+                len(self.counts) >= self.max_keys
+            if not full:
+                self.counts[entry] = self.counts.get(entry, 0) + amount
+                self.pending += amount
+            due = self.pending >= self.flush_size or \
+                time.time() - self.last_flush >= self.flush_interval
+
+        if full:
+            # Make room synchronously; if redis is down the count is dropped
+            # rather than letting the buffer grow without bound.
+            exception = self.flush()
+            with self.lock:
+                if len(self.counts) < self.max_keys:
+                    self.counts[entry] = self.counts.get(entry, 0) + amount
+                    self.pending += amount
+                    return
+                self.dropped += amount
+            return exception
+
+        # A failed flush keeps its counts buffered so the request itself
+        # still succeeds; the failure shows up in flush_errors.
+        if due:
+            self.flush()
+
+    def flush(self):
+        """
+            Write all buffered counts to redis in one pipeline.
+
+            Returns the RedisError on failure, matching log_api().
+        """
+        with self.flush_lock:
+            with self.lock:
+                counts = self.counts
+                pending = self.pending
+                self.counts = {}
+                self.pending = 0
+                self.last_flush = time.time()
+                self.max_pending = max(self.max_pending, pending)
+
+            if not counts:
+                return
+
+            pipe = self.redis.pipeline(transaction=False)
+            new_members = self.counter.queue(pipe, counts)
+            pipe.hset(self.metrics_key, self.worker_id,
+                      json.dumps(self.metrics(flushed=pending)))
+            try:
+                pipe.execute()
+            except RedisError as exc:
+                self.restore(counts)
+                return exc
+
+            self.counter.confirm(new_members)
+            with self.lock:
+                self.flushed += pending
+
+    def restore(self, counts):
+        """
+            Merge counts from a failed flush back into the buffer,
+            dropping whatever no longer fits.
+        """
+        with self.lock:
+            self.flush_errors += 1
+            for entry, amount in counts.items():
+                if entry in self.counts or len(self.counts) < self.max_keys:
+                    self.counts[entry] = self.counts.get(entry, 0) + amount
+                    self.pending += amount
+                else:
+                    self.dropped += amount
+
+    def metrics(self, flushed=0):
+        """
+            Return the buffer metrics for this worker, counting the
+            flushed counts being written along with them as written.
+        """
+        return {
+            'pending': self.pending,
+            'max_pending': self.max_pending,
+            'flushed': self.flushed + flushed,
+            'dropped': self.dropped,
+            'flush_errors': self.flush_errors,
+            'last_flush': self.last_flush,
+        }
+
+    def start(self):
+        """
+            Start the background flush thread once per worker process.
+        """
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.stopped.clear()
+            self.thread = threading.Thread(
+                target=self.run,
+                name='write-behind-flush',
+                daemon=True)
+            self.thread.start()
+            register_shutdown(self.shutdown)
+
+    def run(self):
+        """
+            Flush idle buffers so counts never wait longer than the interval.
+        """
+        while not self.stopped.wait(self.flush_interval):
+            if time.time() - self.last_flush >= self.flush_interval:
+                self.flush()
+
+    def shutdown(self):
+        """
+            Flush remaining counts and remove this worker's metrics entry.
+        """
+        self.stopped.set()
+        exception = self.flush()
+        if exception or self.pending:
+            print('Write-behind shutdown lost {} counts: {}'.format(
+                self.pending, exception))
+            return
+        try:
+            self.redis.hdel(self.metrics_key, self.worker_id)
+        except RedisError:
+            pass
+
+
+def register_shutdown(func):
+    """
+        Run func when the worker exits.
+
+        uWSGI workers do not always run the interpreter's atexit handlers
+        so the uwsgi hook is chained as well when running under uWSGI.
+    """
+    atexit.register(func)
+    try:
+        import uwsgi
+    except ImportError:
+        return
+
+    previous = getattr(uwsgi, 'atexit', None)
+
+    def chained():
+        func()
+        if previous:
+            previous()
+    uwsgi.atexit = chained
@@ -2,25 +2,59 @@
     Acquire, score and record GDELT quarter hour updates.
 """
 
-import base64
 import boto3
 import datetime
-from io import BytesIO
+import itertools
 import json
 import os
 import pytz
+import threading
+import time
 from urllib.request import urlopen
-from zipfile import ZipFile
-import requests
+
+from event_format import EVENT_FORMATS, PARTS_MARKER_SUFFIX, encode_events, partition_path
+from gdelt_parser import EventParser, format_date
+from gdelt_stream import download_event_file, iter_event_lines
+from pipeline import Pipeline
+from score_cache import ScoreCache, SQLiteStore
+from scoring_client import ScoringClient
 
 AWS_PROFILE = 'sp_global'
 AWS_REGION = 'us-east-1'
 AWS_S3_EVENT_BUCKET = 'sp-global-events'
 AWS_S3_EVENT_PATH = 'dated-events'
 AWS_S3_TSV_PATH = 'tsv-events'
+# Scored events are written as 'json' or gzipped 'tsv' (see event_format.py)
+AWS_S3_EVENT_FORMAT = 'json'
+AWS_S3_FORMAT_PATHS = {'json': AWS_S3_EVENT_PATH, 'tsv': AWS_S3_TSV_PATH}
+# Write under date=YYYY-MM-DD/hour=HH/ partitions (see event_format.py)
+AWS_S3_PARTITIONED = True
 
 SPG_MODEL_URL = 'https://app-models.dominodatalab.com:443/models/5bd0856346e0fb0008d06d74/latest/model'
 SPG_AUTH = 'XXXX'
+# Scoring requests in flight, and records per request (1 unless the
+# model endpoint accepts a list of records, see scoring_client.py)
+SPG_CONCURRENCY = 16
+SPG_BATCH_SIZE = 1
+# Scores are cached by scoring record in memory and, when a path is set,
+# in a SQLite file (see score_cache.py). Both are kept for every file the
+# process scores, and the file between runs.
+SPG_CACHE_SIZE = 100000
+SPG_CACHE_PATH = None
+SPG_CACHE_TTL = 7 * 24 * 3600
+
+# Items held between pipeline stages (see pipeline.py), rows per parsed
+# batch, records per S3 file written and S3 writes at once. The parts of
+# a file land in any order, so a marker is written after the last one
+# (see write_parts_marker()).
+PIPELINE_QUEUE_SIZE = 8
+PIPELINE_PARSE_BATCH = 1000
+PIPELINE_WRITE_CHUNK = 5000
+PIPELINE_WRITERS = 4
+# A part whose write fails is retried (with exponential backoff from
+# PIPELINE_WRITE_BACKOFF seconds), then the file fails without a marker
+PIPELINE_WRITE_RETRIES = 3
+PIPELINE_WRITE_BACKOFF = 0.5
 
 GDELT_LATEST = 'http://data.gdeltproject.org/gdeltv2/lastupdate.txt'
 
@@ -33,69 +67,15 @@ GDELT_EVENT_INDEX_Actor1Geo_Lat = 40
 GDELT_EVENT_INDEX_Actor1Geo_Long = 41
 GDELT_EVENT_INDEX_DATEADDED = 59
 
-GDELT_RECORD_LABLES = [
-    'GLOBALEVENTID',
-    'SQLDATE',
-    'MonthYear',
-    'Year',
-    'FractionDate',
-    'Actor1Code',
-    'Actor1Name',
-    'Actor1CountryCode',
-    'Actor1KnownGroupCode',
-    'Actor1EthnicCode',
-    'Actor1Religion1Code',
-    'Actor1Religion2Code',
-    'Actor1Type1Code',
-    'Actor1Type2Code',
-    'Actor1Type3Code',
-    'Actor2Code',
-    'Actor2Name',
-    'Actor2CountryCode',
-    'Actor2KnownGroupCode',
-    'Actor2EthnicCode',
-    'Actor2Religion1Code',
-    'Actor2Religion2Code',
-    'Actor2Type1Code',
-    'Actor2Type2Code',
-    'Actor2Type3Code',
-    'IsRootEvent',
-    'EventCode',
-    'EventBaseCode',
-    'EventRootCode',
-    'QuadClass',
-    'GoldsteinScale',
-    'NumMentions',
-    'NumSources',
-    'NumArticles',
-    'AvgTone',
-    'Actor1Geo_Type',
-    'Actor1Geo_FullName',
-    'Actor1Geo_CountryCode',
-    'Actor1Geo_ADM1Code',
-    'Actor1Geo_ADM2Code',
-    'Actor1Geo_Lat',
-    'Actor1Geo_Long',
-    'Actor1Geo_FeatureID',
-    'Actor2Geo_Type',
-    'Actor2Geo_FullName',
-    'Actor2Geo_CountryCode',
-    'Actor2Geo_ADM1Code',
-    'Actor2Geo_ADM2Code',
-    'Actor2Geo_Lat',
-    'Actor2Geo_Long',
-    'Actor2Geo_FeatureID',
-    'ActionGeo_Type',
-    'ActionGeo_FullName',
-    'ActionGeo_CountryCode',
-    'ActionGeo_ADM1Code',
-    'ActionGeo_ADM2Code',
-    'ActionGeo_Lat',
-    'ActionGeo_Long',
-    'ActionGeo_FeatureID',
-    'DATEADDED',
-    'SOURCEURL'
-]
+# The columns scoring_items() reads, see gdelt_parser.py
+SCORING_PARSER = EventParser([
+    GDELT_EVENT_INDEX_Actor1Type1Code,
+    GDELT_EVENT_INDEX_GoldsteinScale,
+    GDELT_EVENT_INDEX_AvgTone,
+    GDELT_EVENT_INDEX_Actor1Geo_Lat,
+    GDELT_EVENT_INDEX_Actor1Geo_Long,
+    GDELT_EVENT_INDEX_DATEADDED,
+])
 
 
 def get_latest_event_file_url():
@@ -117,120 +97,219 @@ def get_latest_event_file_url():
             return file_url
 
 
-def format_date(d):
+def create_score_cache():
+    """ Create the score cache """
+    store = None
+    if SPG_CACHE_PATH:
+        store = SQLiteStore(SPG_CACHE_PATH, ttl=SPG_CACHE_TTL)
+        store.evict()
+    return ScoreCache(max_size=SPG_CACHE_SIZE, store=store)
+
+
+score_cache = create_score_cache()
+
+
+def create_scoring_client():
+    """ Create the pooled model API client """
+    return ScoringClient(
+        SPG_MODEL_URL,
+        SPG_AUTH,
+        concurrency=SPG_CONCURRENCY,
+        batch_size=SPG_BATCH_SIZE,
+        cache=score_cache)
+
+
+# Kept, with its threads and their connections, for every file scored
+scoring_client = create_scoring_client()
+
+
+def scoring_items(lines):
     """
-        GDELT dates are YYYYMMDDHHMMSS.
-        The model API requires YYYY-MM-DD HH:MM:SS.
+        Yield (event_hour, scoring_record) for each event line.
+        Some event records do not have an Actor1Type1Code,
+        we will skip these.
     """
-    dt = datetime.datetime.strptime(d, '%Y%m%d%H%M%S')
-    return datetime.datetime.strftime(dt, '%Y-%m-%d %H:%M:%s'), dt.hour
+    for actor_code, goldstein, avg_tone, lat, lon, dateadded in SCORING_PARSER.parse_lines(lines):
+        if not actor_code:
+            continue
 
+        gdate, ghour = format_date(dateadded)
+        scoring_parts = {
+            'actor_code': actor_code,
+            'goldstein': goldstein,
+            'avg_tone': avg_tone,
+            'lat': lat,
+            'lon': lon,
+            'date': gdate,
+        }
+        yield ghour, scoring_parts
 
-def generate_gdelt_record(parts):
-    """ Emit a JSON reflection of the labled GDELT record """
-    d = {}
-    for index in range(len(GDELT_RECORD_LABLES)):
-        d[GDELT_RECORD_LABLES[index]] = parts[index]
-    return d
 
+def s3_key(filename, suffix, event_format=AWS_S3_EVENT_FORMAT):
+    """ Return the key of a file named by GDELT update timestamp """
+    path = AWS_S3_FORMAT_PATHS[event_format]
+    if AWS_S3_PARTITIONED:
+        path = partition_path(path, filename)
+    return '{}/{}{}'.format(path, filename, suffix)
 
-def score(gdelt_record, scoring_record):
-    """ Score the record. """
 
-    user_pass = base64.b64encode('{}:{}'.format(
-        SPG_AUTH,
-        SPG_AUTH).encode('utf-8')).decode('utf-8')
-    data = json.dumps({'data': scoring_record})
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': 'Basic {}'.format(user_pass)}
+def write_s3_file(filename, s3_data, event_format=AWS_S3_EVENT_FORMAT):
+    """
+        Post the data file to the S3 bucket in the configured format.
+        The filename is the GDELT update timestamp, YYYYMMDDHHMMSS.
+    """
+    this_key = s3_key(filename, EVENT_FORMATS[event_format]['suffix'], event_format)
+
     try:
-        response = requests.post(SPG_MODEL_URL, data=data, headers=headers)
+        s3_client = boto3.client('s3')
+        response = s3_client.put_object(
+            Bucket=AWS_S3_EVENT_BUCKET,
+            Body=encode_events(s3_data, event_format),
+            Key=this_key,
+            ContentType=EVENT_FORMATS[event_format]['content_type']
+        )
     except Exception as exc:
         print(exc)
         return
 
-    spg_score = response.json()
-    return spg_score['result']['class1'], spg_score['result']['class2'], spg_score['timing']
-
+    return False if response['ResponseMetadata']['HTTPStatusCode'] != 200 else True
 
-def write_s3_file(filename, s3_data):
-    """ Post the data file to the S3 bucket """
-    this_key = '{}/{}.json'.format(AWS_S3_EVENT_PATH, filename)
 
+def parse_stage(spools):
+    """ Yield batches of (event_hour, scoring_record) from each download """
+    for filename, spool in spools:
+        with spool:
+            items = scoring_items(iter_event_lines(spool, filename))
+            while True:
+                batch = list(itertools.islice(items, PIPELINE_PARSE_BATCH))
+                if not batch:
+                    break
+                yield batch
+
+
+def score_stage(client):
+    """ Return the stage scoring batches into chunks of records to write """
+    def score(batches):
+        items = itertools.chain.from_iterable(batches)
+        chunk = []
+        for ghour, scoring_parts, result in client.score_all(items):
+            if result is None:
+                continue
+
+            chunk.append({
+                'event_date': scoring_parts['date'],
+                'event_hour': ghour,
+                'actor1_type1_code': scoring_parts['actor_code'],
+                'goldstein': scoring_parts['goldstein'],
+                'tone': scoring_parts['avg_tone'],
+                'latitude': scoring_parts['lat'],
+                'longitude': scoring_parts['lon'],
+                'score_class1': result['class1'],
+                'score_class2': result['class2'],
+                'score_timing': result['timing'],
+            })
+            if len(chunk) == PIPELINE_WRITE_CHUNK:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    return score
+
+
+def write_parts_marker(filename, parts, count, event_format=AWS_S3_EVENT_FORMAT):
+    """
+        Post the marker showing every part of the event file is written.
+        chart_by_hour doesn't count the parts, or anything after them,
+        until it is there.
+    """
     try:
         s3_client = boto3.client('s3')
-        response = s3_client.put_object(
+        s3_client.put_object(
             Bucket=AWS_S3_EVENT_BUCKET,
-            Body=json.dumps(s3_data),
-            Key=this_key,
+            Body=json.dumps({'parts': parts, 'records': count}),
+            Key=s3_key(filename, PARTS_MARKER_SUFFIX, event_format),
             ContentType='application/json'
         )
     except Exception as exc:
         print(exc)
-        return
 
-    return False if response['ResponseMetadata']['HTTPStatusCode'] != 200 else True
+
+def write_part(filename, chunk):
+    """
+        Post one part, retrying a failed write. Raises IOError if every
+        attempt fails.
+    """
+    for attempt in range(PIPELINE_WRITE_RETRIES + 1):
+        if attempt:
+            time.sleep(PIPELINE_WRITE_BACKOFF * 2 ** (attempt - 1))
+        if write_s3_file(filename, chunk):
+            return
+    raise IOError('Failed to write {} in {} attempts'.format(
+        filename, PIPELINE_WRITE_RETRIES + 1))
+
+
+def write_stage(s3_filename):
+    """
+        Return the stage writing each chunk of records to its own S3 file,
+        <timestamp>-<part>, and yielding the number of records written.
+        A part that can't be written fails the pipeline, so the file
+        gets no parts marker.
+    """
+    parts = itertools.count()
+    lock = threading.Lock()
+
+    def write(chunks):
+        for chunk in chunks:
+            with lock:
+                part = next(parts)
+            write_part('{}-{:04d}'.format(s3_filename, part), chunk)
+            yield len(chunk)
+    return write
 
 
 def process_event_file(file_url):
     """
         Get the event file.
         Each line with a Actor1Type1Code gets scored.
-        One file is written to S3 with the record set.
+        The record set is written to S3 in chunks as it is scored.
+
+        Download, parsing, scoring and writing run as concurrent stages
+        with bounded queues between them (see pipeline.py). The file is
+        streamed a line at a time (see gdelt_stream.py), only the scored
+        columns are parsed (see gdelt_parser.py) and records are scored
+        concurrently (see scoring_client.py). The parts marker is
+        written once the pipeline finishes without an error.
     """
 
-    count = 0
-    try:
-        response = urlopen(file_url)
-    except Exception as exc:
-        print(exc)
-        return
+    def download(file_urls):
+        for url in file_urls:
+            yield os.path.basename(url[:-4]), download_event_file(url)
 
-    zipfile = ZipFile(BytesIO(response.read()))
     filename = os.path.basename(file_url[:-4])
-    data = []
-    for line in zipfile.open(filename).readlines():
-        parts = line.decode('utf-8').strip('\n').split('\t')
+    timestamp = filename[:-11]
 
-        # Some event records to not have an Actor1Type1Code
-        # we will skip these
-        if not parts[GDELT_EVENT_INDEX_Actor1Type1Code]:
-            continue
+    pipeline = Pipeline(queue_size=PIPELINE_QUEUE_SIZE)
+    pipeline.add('download', download)
+    pipeline.add('parse', parse_stage)
+    pipeline.add('score', score_stage(scoring_client))
+    pipeline.add('write', write_stage(timestamp), workers=PIPELINE_WRITERS)
 
-        gdelt_record = generate_gdelt_record(parts)
-        gdate, ghour = format_date(parts[GDELT_EVENT_INDEX_DATEADDED])
-
-        scoring_parts = {
-            'actor_code': parts[GDELT_EVENT_INDEX_Actor1Type1Code],
-            'goldstein': parts[GDELT_EVENT_INDEX_GoldsteinScale],
-            'avg_tone': parts[GDELT_EVENT_INDEX_AvgTone],
-            'lat': parts[GDELT_EVENT_INDEX_Actor1Geo_Lat],
-            'lon': parts[GDELT_EVENT_INDEX_Actor1Geo_Long],
-            'date': gdate,
-        }
-        class1, class2, timing = score(gdelt_record, scoring_parts)
-
-        record = {
-            'event_date': gdate,
-            'event_hour': ghour,
-            'actor1_type1_code': scoring_parts['actor_code'],
-            'goldstein': scoring_parts['goldstein'],
-            'tone': scoring_parts['avg_tone'],
-            'latitude': scoring_parts['lat'],
-            'longitude': scoring_parts['lon'],
-            'score_class1': class1,
-            'score_class2': class2,
-            'score_timing': timing,
-        }
-        data.append(record)
-        count += 1
+    count = 0
+    parts = 0
+    try:
+        for written in pipeline.run([file_url]):
+            count += written
+            parts += 1
+    except Exception as exc:
+        print(exc)
+    else:
+        write_parts_marker(timestamp, parts, count)
 
-    s3_filename = filename[:-11]
-    write_s3_file(s3_filename, data)
     print('{}: created {} S3 records'.format(
        datetime.datetime.now(pytz.utc),
        count))
+    print('Stage timings:\n{}'.format(pipeline.report()))
+    print('Score cache: {}'.format(score_cache.stats()))
 
 
 def main():
@@ -0,0 +1,112 @@
+"""
+    Measure the event file fetch and count speedup in chart_by_hour.
+
+    Writes thousands of synthetic scored event files into a temporary
+    directory and serves them through a filesystem-backed stand-in for
+    the S3 client, which adds a fixed latency to every download. The
+    counts are then built at each concurrency:
+
+        python bench_chart_by_hour.py --files 2000 --records 200 \\
+            --latency-ms 20 --concurrency 1 4 16 64
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+import chart_by_hour
+
+
+class FakeS3(object):
+    """
+        Just enough of the boto3 S3 client for chart_by_hour, backed by
+        a directory where each file is an object.
+    """
+
+    def __init__(self, root, latency):
+        self.root = root
+        self.latency = latency
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, Bucket, Prefix='', StartAfter=''):
+        keys = sorted(key for key in self.keys()
+                      if key.startswith(Prefix) and key > StartAfter)
+        for index in range(0, len(keys), 1000):
+            yield {'Contents': [{'Key': key} for key in keys[index:index + 1000]]}
+
+    def keys(self):
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                yield os.path.relpath(path, self.root).replace(os.sep, '/')
+
+    def download_fileobj(self, Bucket, Key, Fileobj):
+        time.sleep(self.latency)
+        with open(os.path.join(self.root, Key), 'rb') as f:
+            Fileobj.write(f.read())
+
+
+def make_record(rng):
+    return {
+        'event_date': '2019-10-01 00:00:1569888000',
+        'event_hour': rng.randrange(24),
+        'actor1_type1_code': rng.choice(['GOV', 'MIL', 'BUS', 'CVL', 'EDU', 'MED']),
+        'goldstein': '1.9',
+        'tone': '-0.41379310344828',
+        'latitude': '31.106',
+        'longitude': '-97.6475',
+        'score_class1': rng.random() < 0.3,
+        'score_class2': rng.randrange(5),
+        'score_timing': rng.uniform(0.05, 0.5),
+    }
+
+
+def build_event_files(root, files, records):
+    rng = random.Random(0)
+    os.makedirs(os.path.join(root, chart_by_hour.AWS_S3_EVENT_PATH))
+    for index in range(files):
+        key = '{}/{:014d}.json'.format(chart_by_hour.AWS_S3_EVENT_PATH, index)
+        with open(os.path.join(root, key), 'w') as f:
+            json.dump([make_record(rng) for i in range(records)], f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--files', type=int, default=2000)
+    parser.add_argument('--records', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=[1, 4, 16, 64])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        build_event_files(root, args.files, args.records)
+        fake_s3 = FakeS3(root, args.latency_ms / 1000)
+        chart_by_hour.boto3.client = lambda *args, **kwargs: fake_s3
+
+        print('{:>12} {:>10} {:>10} {:>10}'.format(
+            'concurrency', 'seconds', 'files/s', 'speedup'))
+        baseline = None
+        first = None
+        for concurrency in args.concurrency:
+            state = chart_by_hour.new_state()
+            start = time.time()
+            chart_by_hour.update_state(state, concurrency)
+            seconds = time.time() - start
+
+            baseline = baseline or seconds
+            if first is None:
+                first = state
+            elif state != first:
+                print('Counts differ at concurrency {}'.format(concurrency))
+            print('{:>12} {:>10.2f} {:>10.1f} {:>9.1f}x'.format(
+                concurrency, seconds, args.files / seconds, baseline / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+    Compare the size and read time of the scored event file formats.
+
+    Synthetic records shaped like those acquire_and_score writes are
+    encoded in each format of event_format.py, then decoded back whole
+    and with only the columns chart_by_hour reads:
+
+        python bench_event_format.py --records 20000
+"""
+
+import argparse
+import random
+import time
+
+from chart_by_hour import REPORT_COLUMNS
+from event_format import EVENT_FORMATS, decode_events, encode_events
+
+ACTORS = ['GOV', 'MIL', 'BUS', 'CVL', 'EDU', 'MED', 'COP', 'JUD', 'LEG', 'OPP']
+
+
+def make_record(rng):
+    """ A scored record as written by acquire_and_score.process_event_file() """
+    return {
+        'event_date': '2019-10-01 12:30:1569933000',
+        'event_hour': 12,
+        'actor1_type1_code': rng.choice(ACTORS),
+        'goldstein': str(rng.choice([-10.0, -5.0, -2.0, 0.0, 1.0, 1.9, 3.4, 7.0])),
+        'tone': str(rng.uniform(-10, 10)),
+        'latitude': '{:.4f}'.format(rng.uniform(-90, 90)) if rng.random() < 0.9 else '',
+        'longitude': '{:.4f}'.format(rng.uniform(-180, 180)) if rng.random() < 0.9 else '',
+        'score_class1': rng.random() < 0.3,
+        'score_class2': rng.randrange(5),
+        'score_timing': rng.uniform(0.05, 0.5),
+    }
+
+
+def best_of(repeat, func):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    records = [make_record(rng) for i in range(args.records)]
+
+    print('{:>8} {:>12} {:>8} {:>12} {:>12} {:>16}'.format(
+        'format', 'bytes', 'ratio', 'write_ms', 'read_ms', 'read_report_ms'))
+    json_size = None
+    for event_format in EVENT_FORMATS:
+        write_seconds, body = best_of(
+            args.repeat, lambda: encode_events(records, event_format))
+        read_seconds, decoded = best_of(
+            args.repeat, lambda: decode_events(body, event_format))
+        report_seconds, decoded = best_of(
+            args.repeat, lambda: decode_events(body, event_format, REPORT_COLUMNS))
+        assert len(decoded) == len(records)
+
+        json_size = json_size or len(body)
+        print('{:>8} {:>12} {:>8.2f} {:>12.1f} {:>12.1f} {:>16.1f}'.format(
+            event_format,
+            len(body),
+            len(body) / json_size,
+            write_seconds * 1000,
+            read_seconds * 1000,
+            report_seconds * 1000))
+
+
+if __name__ == '__main__':
+    main()
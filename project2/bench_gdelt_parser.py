@@ -0,0 +1,87 @@
+"""
+    Measure GDELT export rows parsed per second.
+
+    Synthetic export lines (see bench_gdelt_stream.py) are held in memory
+    and turned into scoring records by the previous per-line parse (split
+    every column, build the labelled record, strptime/strftime the date)
+    and by acquire_and_score.scoring_items() with gdelt_parser.py; the
+    records of both are checked to be identical:
+
+        python bench_gdelt_parser.py --rows 500000
+"""
+
+import argparse
+import datetime
+import random
+import time
+
+from acquire_and_score import (
+    GDELT_EVENT_INDEX_Actor1Geo_Lat,
+    GDELT_EVENT_INDEX_Actor1Geo_Long,
+    GDELT_EVENT_INDEX_Actor1Type1Code,
+    GDELT_EVENT_INDEX_AvgTone,
+    GDELT_EVENT_INDEX_DATEADDED,
+    GDELT_EVENT_INDEX_GoldsteinScale,
+    scoring_items)
+from bench_gdelt_stream import make_row
+from gdelt_parser import GDELT_RECORD_LABLES
+
+
+def previous_format_date(d):
+    dt = datetime.datetime.strptime(d, '%Y%m%d%H%M%S')
+    return datetime.datetime.strftime(dt, '%Y-%m-%d %H:%M:%s'), dt.hour
+
+
+def previous_scoring_items(lines):
+    """ The per line parse from the previous process_event_file() """
+    for line in lines:
+        parts = line.strip('\n').split('\t')
+        if not parts[GDELT_EVENT_INDEX_Actor1Type1Code]:
+            continue
+
+        gdelt_record = {}
+        for index in range(len(GDELT_RECORD_LABLES)):
+            gdelt_record[GDELT_RECORD_LABLES[index]] = parts[index]
+        gdate, ghour = previous_format_date(parts[GDELT_EVENT_INDEX_DATEADDED])
+
+        scoring_parts = {
+            'actor_code': parts[GDELT_EVENT_INDEX_Actor1Type1Code],
+            'goldstein': parts[GDELT_EVENT_INDEX_GoldsteinScale],
+            'avg_tone': parts[GDELT_EVENT_INDEX_AvgTone],
+            'lat': parts[GDELT_EVENT_INDEX_Actor1Geo_Lat],
+            'lon': parts[GDELT_EVENT_INDEX_Actor1Geo_Long],
+            'date': gdate,
+        }
+        yield ghour, scoring_parts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    lines = [make_row(rng, event_id).rstrip('\n') for event_id in range(args.rows)]
+
+    print('{:>10} {:>10} {:>12} {:>8}'.format('parser', 'seconds', 'rows/s', 'speedup'))
+    results = []
+    baseline = None
+    for name, items in (('previous', previous_scoring_items),
+                        ('projected', scoring_items)):
+        best = None
+        for i in range(args.repeat):
+            start = time.perf_counter()
+            result = list(items(lines))
+            seconds = time.perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+        baseline = baseline or best
+        results.append(result)
+        print('{:>10} {:>10.3f} {:>12.0f} {:>7.1f}x'.format(
+            name, best, args.rows / best, baseline / best))
+
+    print('Records identical: {}'.format(results[0] == results[1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+    Compare peak memory of reading a GDELT export with readlines() and
+    with the streaming reader in gdelt_stream.py.
+
+    Builds a synthetic export zip of 61 column rows (about 500MB
+    uncompressed by default), then reads it in a fresh process with each
+    reader and prints the peak RSS of each:
+
+        python bench_gdelt_stream.py --size-mb 500
+"""
+
+import argparse
+from io import BytesIO
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.request import urlopen
+from zipfile import ZIP_DEFLATED, ZipFile
+
+from gdelt_stream import download_event_file, iter_event_rows
+
+GDELT_EVENT_COLUMNS = 61
+MEMBER_NAME = '20180101000000.export.CSV'
+
+
+def make_row(rng, event_id):
+    parts = [''] * GDELT_EVENT_COLUMNS
+    parts[0] = str(event_id)
+    parts[1] = '20180101'
+    parts[6] = rng.choice(['UNITED STATES', 'RUSSIA', 'CHINA', 'FRANCE'])
+    parts[12] = rng.choice(['', 'GOV', 'MIL', 'BUS', 'CVL'])
+    parts[30] = '{:.1f}'.format(rng.uniform(-10, 10))
+    parts[34] = '{:.6f}'.format(rng.uniform(-20, 20))
+    parts[40] = '{:.4f}'.format(rng.uniform(-90, 90))
+    parts[41] = '{:.4f}'.format(rng.uniform(-180, 180))
+    parts[59] = '20180101000000'
+    parts[60] = 'http://example.com/news/{}'.format(event_id)
+    return '\t'.join(parts) + '\n'
+
+
+def build_export(path, size_mb):
+    """
+        Write a zip holding roughly size_mb of synthetic export rows.
+    """
+    rng = random.Random(0)
+    target = size_mb * 1024 * 1024
+    written = 0
+    event_id = 0
+    with ZipFile(path, 'w', ZIP_DEFLATED) as zipfile:
+        with zipfile.open(MEMBER_NAME, 'w', force_zip64=True) as member:
+            while written < target:
+                lines = ''.join(make_row(rng, event_id + i) for i in range(1000))
+                member.write(lines.encode('utf-8'))
+                written += len(lines)
+                event_id += 1000
+    return event_id
+
+
+def read_with_readlines(file_url):
+    response = urlopen(file_url)
+    zipfile = ZipFile(BytesIO(response.read()))
+    rows = 0
+    for line in zipfile.open(MEMBER_NAME).readlines():
+        parts = line.decode('utf-8').strip('\n').split('\t')
+        if parts[12]:
+            rows += 1
+    return rows
+
+
+def read_with_stream(file_url):
+    rows = 0
+    with download_event_file(file_url) as spool:
+        for parts in iter_event_rows(spool, MEMBER_NAME):
+            if parts[12]:
+                rows += 1
+    return rows
+
+
+READERS = {
+    'readlines': read_with_readlines,
+    'stream': read_with_stream,
+}
+
+
+def run_reader(name, file_url):
+    """
+        Run one reader in this process and print rows, seconds and peak
+        RSS in MB (ru_maxrss is in KB on Linux).
+    """
+    start = time.time()
+    rows = READERS[name](file_url)
+    seconds = time.time() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print('{:>10} {:>12} {:>10.1f} {:>12.1f}'.format(name, rows, seconds, peak))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--size-mb', type=int, default=500)
+    parser.add_argument('--reader', choices=READERS, help=argparse.SUPPRESS)
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.reader:
+        run_reader(args.reader, args.url)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, MEMBER_NAME + '.zip')
+        events = build_export(path, args.size_mb)
+        print('{} events, {:.1f}MB zipped'.format(
+            events, os.path.getsize(path) / 1024 / 1024))
+
+        print('{:>10} {:>12} {:>10} {:>12}'.format(
+            'reader', 'rows', 'seconds', 'peak_rss_mb'))
+        file_url = 'file://' + path
+        # Each reader gets a fresh process so the peaks don't mix
+        for name in READERS:
+            subprocess.run(
+                [sys.executable, __file__, '--reader', name, '--url', file_url],
+                check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+    Compare the Python and NumPy report aggregation engines.
+
+    Synthetic scored records are generated in chunks (10M records by
+    default) and each chunk is encoded as an event file in --format (TSV
+    by default). Each file is counted from its bytes by both engines,
+    decoding included, as chart_by_hour.file_counts() counts it, and by
+    score_columns.aggregate() from columns that are already loaded. The
+    chunk results are merged as chart_by_hour merges files and the final
+    reports of all three are checked to be identical:
+
+        python bench_score_columns.py --records 10000000
+        python bench_score_columns.py --records 10000000 --format json
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+import chart_by_hour
+from event_format import encode_events
+import score_columns
+
+ACTORS = ['GOV', 'MIL', 'BUS', 'CVL', 'EDU', 'MED', 'COP', 'JUD', 'LEG', 'OPP']
+
+
+def make_columns(rng, size):
+    actors = list(ACTORS)
+    c2_values = [str(v) for v in range(5)]
+    return score_columns.ScoreColumns(
+        hour=rng.integers(0, 24, size),
+        actor=rng.integers(0, len(actors), size),
+        timing=rng.uniform(0.05, 0.5, size),
+        class1=rng.random(size) < 0.3,
+        c2=rng.integers(0, len(c2_values), size),
+        actors=actors,
+        c2_values=c2_values)
+
+
+def make_records(columns):
+    return [{
+        'event_hour': hour,
+        'actor1_type1_code': columns.actors[actor],
+        'score_class1': class1,
+        'score_class2': int(columns.c2_values[c2]),
+        'score_timing': timing,
+    } for hour, actor, timing, class1, c2 in zip(
+        columns.hour.tolist(),
+        columns.actor.tolist(),
+        columns.timing.tolist(),
+        columns.class1.tolist(),
+        columns.c2.tolist())]
+
+
+def columns_add(state, columns):
+    """ Aggregate already loaded columns into a partial, then merge """
+    hours, actors = score_columns.aggregate(columns)
+    partial = chart_by_hour.new_state()
+    partial['hours'] = hours
+    partial['actors'] = actors
+    chart_by_hour.merge_state(state, partial)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--records', type=int, default=10000000)
+    parser.add_argument('--chunk', type=int, default=500000)
+    parser.add_argument('--format', choices=['tsv', 'json'], default='tsv')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    engines = ['python', 'numpy', 'numpy-columns']
+    states = {name: chart_by_hour.new_state() for name in engines}
+    seconds = {name: 0.0 for name in engines}
+    count_python = chart_by_hour.engine_count_file('python')
+    count_numpy = chart_by_hour.engine_count_file('numpy')
+
+    for offset in range(0, args.records, args.chunk):
+        columns = make_columns(rng, min(args.chunk, args.records - offset))
+        body = encode_events(make_records(columns), args.format)
+
+        for name, aggregate in (
+                ('python', lambda: count_python(partial, body, args.format)),
+                ('numpy', lambda: count_numpy(partial, body, args.format)),
+                ('numpy-columns', lambda: columns_add(partial, columns))):
+            partial = chart_by_hour.new_state()
+            start = time.perf_counter()
+            aggregate()
+            seconds[name] += time.perf_counter() - start
+            chart_by_hour.merge_state(states[name], partial)
+
+    print('{:>14} {:>10} {:>12} {:>10}'.format(
+        'engine', 'seconds', 'records/s', 'speedup'))
+    for name in engines:
+        print('{:>14} {:>10.2f} {:>12.0f} {:>9.1f}x'.format(
+            name,
+            seconds[name],
+            args.records / seconds[name],
+            seconds['python'] / seconds[name]))
+
+    reports = [chart_by_hour.finish(states[name]) for name in engines]
+    print('Reports identical: {}'.format(all(r == reports[0] for r in reports)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+    Measure the per record cost of building the report counts.
+
+    Compares the previous nested dict accumulators (deep copied from a
+    template and updated with several dict lookups per record) with the
+    ScoreStats accumulators used by chart_by_hour.add_records():
+
+        python bench_score_stats.py --records 1000000
+"""
+
+import argparse
+import copy
+import random
+import time
+
+import chart_by_hour
+from bench_chart_by_hour import make_record
+
+
+def add_records_dicts(data):
+    """ The previous aggregation loop from chart_by_hour.generate_counts() """
+    c2_values = set()
+    stats = []
+    template = {
+        'gdelt_count': 0,
+        'min_timing': 0,
+        'max_timing': 0,
+        'avg_timing': 0,
+        'timing_sum': 0,
+        'c1_true': 0,
+        'c1_true_pct': 0,
+        'c1_false': 0,
+        'c2': {}}
+    for i in range(24):
+        d = copy.deepcopy(template)
+        stats.append(d)
+
+    actors = {}
+
+    for record in data:
+        v = str(record['score_class2'])
+
+        # actor stats
+        actor = record['actor1_type1_code']
+        if actor in actors:
+            actors[actor]['gdelt_count'] += 1
+            if record['score_timing'] < actors[actor]['min_timing']:
+                actors[actor]['min_timing'] = record['score_timing']
+            if record['score_timing'] > actors[actor]['max_timing']:
+                actors[actor]['max_timing'] = record['score_timing']
+            actors[actor]['timing_sum'] += record['score_timing']
+            actors[actor]['c1_true'] += 1 if record['score_class1'] else 0
+            if v in actors[actor]['c2']:
+                actors[actor]['c2'][v] += 1
+            else:
+                c2_values.add(v)
+                actors[actor]['c2'][v] = 1
+        else:
+            actors[actor] = {}
+            actors[actor]['gdelt_count'] = 1
+            actors[actor]['min_timing'] = record['score_timing']
+            actors[actor]['max_timing'] = record['score_timing']
+            actors[actor]['timing_sum'] = record['score_timing']
+            actors[actor]['c1_true'] = 1 if record['score_class1'] else 0
+            actors[actor]['c2'] = {}
+            actors[actor]['c2'][v] = 1
+
+        # hourly stats
+        h = record['event_hour']
+
+        stats[h]['gdelt_count'] += 1
+
+        if (stats[h]['min_timing'] == 0 or
+                record['score_timing'] < stats[h]['min_timing']):
+            stats[h]['min_timing'] = record['score_timing']
+
+        if record['score_timing'] > stats[h]['max_timing']:
+            stats[h]['max_timing'] = record['score_timing']
+
+        stats[h]['timing_sum'] += record['score_timing']
+
+        if record['score_class1']:
+            stats[h]['c1_true'] += 1
+        else:
+            stats[h]['c1_false'] += 1
+
+        if v in stats[h]['c2']:
+            stats[h]['c2'][v] += 1
+        else:
+            c2_values.add(v)
+            stats[h]['c2'][v] = 1
+    return stats, actors
+
+
+def add_records_score_stats(data):
+    state = chart_by_hour.new_state()
+    chart_by_hour.add_records(state, data)
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--records', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    data = [make_record(rng) for i in range(args.records)]
+
+    print('{:>12} {:>10} {:>12}'.format('accumulator', 'seconds', 'ns/record'))
+    for name, aggregate in (('dicts', add_records_dicts),
+                            ('ScoreStats', add_records_score_stats)):
+        best = None
+        for i in range(args.repeat):
+            start = time.perf_counter()
+            aggregate(data)
+            seconds = time.perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+        print('{:>12} {:>10.3f} {:>12.0f}'.format(
+            name, best, best * 1e9 / args.records))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+    Measure scoring throughput against a local stub of the model API.
+
+    The stub answers like the model endpoint after a fixed latency, and
+    accepts a list of records for batch mode. The old one request at a
+    time score() is run first, then ScoringClient at each concurrency
+    and batch size:
+
+        python bench_scoring.py --records 500 --latency-ms 50 \\
+            --concurrency 1 16 64 --batch-size 1 20
+"""
+
+import argparse
+import base64
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+
+import requests
+
+from scoring_client import ScoringClient
+
+SPG_AUTH = 'XXXX'
+
+
+def stub_server(latency):
+    """
+        Start a model API stub on a free local port.
+    """
+
+    class StubModelHandler(BaseHTTPRequestHandler):
+        # Keep-alive, as the real endpoint does, so pooling shows up
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers['Content-Length']))
+            data = json.loads(body)['data']
+            time.sleep(latency)
+            if isinstance(data, list):
+                result = [{'class1': True, 'class2': 1} for record in data]
+            else:
+                result = {'class1': True, 'class2': 1}
+            response = json.dumps({'result': result, 'timing': latency * 1000})
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(response)))
+            self.end_headers()
+            self.wfile.write(response.encode('utf-8'))
+
+        def log_message(self, format, *args):
+            pass
+
+    class StubModelServer(ThreadingHTTPServer):
+        daemon_threads = True
+        request_queue_size = 128
+
+    server = StubModelServer(('127.0.0.1', 0), StubModelHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_records(count):
+    return [{
+        'actor_code': 'GOV',
+        'goldstein': '1.0',
+        'avg_tone': '-2.5',
+        'lat': '38.8951',
+        'lon': '-77.0364',
+        'date': '2018-01-01 00:00:00',
+    } for index in range(count)]
+
+
+def score_serial(url, records):
+    """
+        The previous approach: a new connection and auth header per record.
+    """
+    scored = 0
+    for scoring_record in records:
+        user_pass = base64.b64encode('{}:{}'.format(
+            SPG_AUTH,
+            SPG_AUTH).encode('utf-8')).decode('utf-8')
+        data = json.dumps({'data': scoring_record})
+        headers = {
+            'Content-Type': 'application/json',
+            'Authorization': 'Basic {}'.format(user_pass)}
+        response = requests.post(url, data=data, headers=headers)
+        if response.json()['result']:
+            scored += 1
+    return scored
+
+
+def score_client(url, records, concurrency, batch_size):
+    client = ScoringClient(
+        url,
+        SPG_AUTH,
+        concurrency=concurrency,
+        batch_size=batch_size)
+    items = enumerate(records)
+    try:
+        return sum(1 for index, record, result in client.score_all(items)
+                   if result is not None)
+    finally:
+        client.close()
+
+
+def report(name, concurrency, batch_size, scored, seconds):
+    print('{:>8} {:>12} {:>10} {:>8} {:>10.2f} {:>12.1f}'.format(
+        name, concurrency, batch_size, scored, seconds, scored / seconds))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--records', type=int, default=500)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=[1, 16, 64])
+    parser.add_argument('--batch-size', type=int, nargs='+', default=[1, 20])
+    args = parser.parse_args()
+
+    server = stub_server(args.latency_ms / 1000)
+    url = 'http://127.0.0.1:{}/model'.format(server.server_address[1])
+    records = make_records(args.records)
+
+    print('{:>8} {:>12} {:>10} {:>8} {:>10} {:>12}'.format(
+        'client', 'concurrency', 'batch', 'scored', 'seconds', 'records/s'))
+
+    start = time.time()
+    scored = score_serial(url, records)
+    report('serial', 1, 1, scored, time.time() - start)
+
+    for batch_size in args.batch_size:
+        for concurrency in args.concurrency:
+            start = time.time()
+            scored = score_client(url, records, concurrency, batch_size)
+            report('pooled', concurrency, batch_size, scored,
+                   time.time() - start)
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
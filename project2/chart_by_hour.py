@@ -3,24 +3,58 @@
     interesting statistics about scoring behavior.
 """
 
+import argparse
 import boto3
-import copy
+from botocore.config import Config
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import datetime
 import io
+import itertools
 import json
 import pytz
 
+from event_format import (EVENT_FORMATS, PARTS_MARKER_SUFFIX, decode_events, event_file_stem, key_format,
+                          partition_prefixes)
+from score_stats import ScoreStats
+
+try:
+    import score_columns
+except ImportError:
+    # NumPy is only needed for the numpy aggregation engine
+    score_columns = None
+
 AWS_PROFILE = 'sp_global'
 AWS_REGION = 'us-east-1'
 AWS_S3_EVENT_BUCKET = 'sp-global-events'
 AWS_S3_EVENT_PATH = 'dated-events'
 AWS_S3_TSV_PATH = 'tsv-events'
+# Scored events are read as 'json' or gzipped 'tsv' (see event_format.py)
+AWS_S3_EVENT_FORMAT = 'json'
+AWS_S3_FORMAT_PATHS = {'json': AWS_S3_EVENT_PATH, 'tsv': AWS_S3_TSV_PATH}
+# The record fields the reports use
+REPORT_COLUMNS = ['event_hour', 'actor1_type1_code', 'score_class1',
+                  'score_class2', 'score_timing']
 AWS_S3_REPORTS_PATH = 'reports'
+# Reports over a date range go under their own prefix, see generate_window_counts()
+AWS_S3_WINDOW_REPORTS_PATH = '{}/windows'.format(AWS_S3_REPORTS_PATH)
+# Raw accumulators and watermark kept between runs, see generate_counts()
+AWS_S3_STATE_KEY = '{}/state.json'.format(AWS_S3_REPORTS_PATH)
+STATE_VERSION = 5
+# The parts of an event file are counted once its marker is written, or
+# once the newest part is this many seconds old if the writer never
+# finished (see complete_event_keys())
+AWS_S3_PARTS_TIMEOUT = 3600
+# Event files fetched and counted at once
+FETCH_CONCURRENCY = 16
+# Count records with a Python loop ('python') or NumPy arrays ('numpy',
+# see score_columns.py); both give identical reports
+AGGREGATION_ENGINE = 'python'
 
 
 # get_matching_s3_objects is
 # copyright https://alexwlchan.net/2019/07/listing-s3-keys/
-def get_matching_s3_objects(bucket, prefix="", suffix=""):
+def get_matching_s3_objects(bucket, prefix="", suffix="", start_after=""):
     """
     Generate objects in an S3 bucket.
 
@@ -29,11 +63,15 @@ def get_matching_s3_objects(bucket, prefix="", suffix=""):
         this prefix (optional).
     :param suffix: Only fetch objects whose keys end with
         this suffix (optional).
+    :param start_after: Only fetch objects whose keys sort after
+        this key (optional).
     """
     s3 = boto3.client("s3")
     paginator = s3.get_paginator("list_objects_v2")
 
     kwargs = {'Bucket': bucket}
+    if start_after:
+        kwargs['StartAfter'] = start_after
 
     # We can pass the prefix directly to the S3 API.  If the user has passed
     # a tuple or list of prefixes, we go through them one by one.
@@ -49,7 +87,8 @@ def get_matching_s3_objects(bucket, prefix="", suffix=""):
             try:
                 contents = page["Contents"]
             except KeyError:
-                return
+                # Nothing (more) under this prefix
+                break
 
             for obj in contents:
                 key = obj["Key"]
@@ -57,152 +96,378 @@ def get_matching_s3_objects(bucket, prefix="", suffix=""):
                     yield obj
 
 
-def get_matching_s3_keys(bucket, prefix="", suffix=""):
+def get_matching_s3_keys(bucket, prefix="", suffix="", start_after=""):
     """
     Generate the keys in an S3 bucket.
 
     :param bucket: Name of the S3 bucket.
     :param prefix: Only fetch keys that start with this prefix (optional).
     :param suffix: Only fetch keys that end with this suffix (optional).
+    :param start_after: Only fetch keys that sort after this key (optional).
     """
-    for obj in get_matching_s3_objects(bucket, prefix, suffix):
+    for obj in get_matching_s3_objects(bucket, prefix, suffix, start_after):
         yield obj["Key"]
 
 
-def generate_counts():
-    s3 = boto3.client("s3")
+def new_state(event_format=AWS_S3_EVENT_FORMAT):
+    """
+        Return empty accumulators for each hour and actor, see
+        score_stats.py.
+    """
+    return {
+        'version': STATE_VERSION,
+        'format': event_format,
+        'watermark': '',
+        'hours': [ScoreStats() for h in range(24)],
+        'actors': {},
+    }
+
+
+def read_s3_object(s3, key):
+    """ Get the S3 file """
+    bytes_buffer = io.BytesIO()
+    s3.download_fileobj(
+        Bucket=AWS_S3_EVENT_BUCKET,
+        Key=key,
+        Fileobj=bytes_buffer)
+    return bytes_buffer.getvalue()
+
+
+def event_keys(event_format, start_after=''):
+    """ Generate the keys of the event files in a format, in order """
+    return get_matching_s3_keys(
+        bucket=AWS_S3_EVENT_BUCKET,
+        prefix='{}/'.format(AWS_S3_FORMAT_PATHS[event_format]),
+        suffix=EVENT_FORMATS[event_format]['suffix'],
+        start_after=start_after)
+
+
+def complete_event_keys(event_format, start_after='', now=None):
+    """
+        Generate the keys of the event files in a format after
+        start_after, in order, stopping before the first file whose
+        parts aren't all written.
+
+        acquire_and_score uploads a file's parts concurrently, so a
+        lower part can land after a higher one. The parts are held back
+        until the file's marker is listed, which keeps the watermark
+        below a part still being uploaded.
+    """
+    suffix = EVENT_FORMATS[event_format]['suffix']
+    now = now or datetime.datetime.now(pytz.utc)
+    timeout = datetime.timedelta(seconds=AWS_S3_PARTS_TIMEOUT)
+    stem = None
+    parts = []
+    newest = None
+
+    def timed_out():
+        if now - newest < timeout:
+            print('Waiting for the parts of {} to be written'.format(stem))
+            return False
+        print('No parts marker for {} after {}s, counting its {} parts'.format(
+            stem, AWS_S3_PARTS_TIMEOUT, len(parts)))
+        return True
+
+    objects = get_matching_s3_objects(
+        bucket=AWS_S3_EVENT_BUCKET,
+        prefix='{}/'.format(AWS_S3_FORMAT_PATHS[event_format]),
+        start_after=start_after)
+    for obj in objects:
+        key = obj['Key']
+        if key.endswith(PARTS_MARKER_SUFFIX):
+            if parts and event_file_stem(key)[0] == stem:
+                yield from parts
+                parts = []
+            continue
+        if not key.endswith(suffix):
+            continue
+
+        key_stem, is_part = event_file_stem(key)
+        if parts and key_stem != stem:
+            if not timed_out():
+                return
+            yield from parts
+            parts = []
+        if not is_part:
+            yield key
+            continue
+        if not parts:
+            stem = key_stem
+            newest = obj['LastModified']
+        parts.append(key)
+        newest = max(newest, obj['LastModified'])
+
+    if parts and timed_out():
+        yield from parts
+
+
+def window_keys(event_format, start, end):
+    """
+        Generate the keys of the event files in a format written from
+        start up to end, in order. Only the date and hour partitions in
+        the range are listed, so files in the older flat layout are not
+        included.
+    """
+    return get_matching_s3_keys(
+        bucket=AWS_S3_EVENT_BUCKET,
+        prefix=partition_prefixes(AWS_S3_FORMAT_PATHS[event_format], start, end),
+        suffix=EVENT_FORMATS[event_format]['suffix'])
+
+
+def add_records(state, data):
+    """ Fold a file of scored records into the accumulators """
+    hours = state['hours']
+    actors = state['actors']
+
+    # iterate over each record
+    # {'event_date': '2019-08-31 12:30:1567254600',
+    # 'event_hour': 12,
+    # 'actor1_type1_code': 'GOV',
+    # 'goldstein': '1.9',
+    # 'tone': '-0.41379310344828',
+    # 'latitude': '31.106',
+    # 'longitude': '-97.6475',
+    # 'score_class1': True,
+    # 'score_class2': 3,
+    # 'score_timing': 0.09399999999004649}
+
+    for record in data:
+        timing = record['score_timing']
+        class1 = record['score_class1']
+        v = str(record['score_class2'])
+
+        # actor stats
+        actor = actors.get(record['actor1_type1_code'])
+        if actor is None:
+            actor = actors[record['actor1_type1_code']] = ScoreStats()
+        actor.add(timing, class1, v)
+
+        # hourly stats
+        hours[record['event_hour']].add(timing, class1, v)
+
+
+def merge_state(state, other):
+    """ Fold another set of accumulators into state """
+    for h, counts in enumerate(other['hours']):
+        state['hours'][h].merge(counts)
+    for actor, counts in other['actors'].items():
+        if actor not in state['actors']:
+            state['actors'][actor] = ScoreStats()
+        state['actors'][actor].merge(counts)
+
+
+def finish(state):
+    """
+        Return the report values (stats, actors, c2_values) from the
+        accumulators.
+    """
+    stats = [counts.hour_report() for counts in state['hours']]
+    actors = {actor: counts.actor_report()
+              for actor, counts in state['actors'].items()}
 
-    # initialize stats data structure (list
-    # of dictionaries where each list entry represents the hour)
     c2_values = set()
-    stats = []
-    template = {
-        'gdelt_count': 0,
-        'min_timing': 0,
-        'max_timing': 0,
-        'avg_timing': 0,
-        'timing_sum': 0,
-        'c1_true': 0,
-        'c1_true_pct': 0,
-        'c1_false': 0,
-        'c2': {}}
-    for i in range(24):
-        d = copy.deepcopy(template)
-        stats.append(d)
-
-    actors = {}
-
-    for key in get_matching_s3_keys(
-            bucket=AWS_S3_EVENT_BUCKET,
-            prefix='{}/'.format(AWS_S3_EVENT_PATH),
-            suffix='.json'):
-
-        # Get the S3 file
-        bytes_buffer = io.BytesIO()
-        s3.download_fileobj(
+    for counts in itertools.chain(state['hours'], state['actors'].values()):
+        c2_values.update(counts.c2)
+    return stats, actors, c2_values
+
+
+def load_state(event_format=None):
+    """
+        Get the saved accumulators, or None if there are none, they were
+        written by an incompatible version or, when event_format is
+        given, they were counted from files in another format.
+    """
+    try:
+        saved = json.loads(read_s3_object(boto3.client('s3'), AWS_S3_STATE_KEY))
+    except Exception as exc:
+        print('No saved counts, rebuilding: {}'.format(exc))
+        return
+    if saved.get('version') != STATE_VERSION:
+        print('Saved counts are version {}, rebuilding'.format(saved.get('version')))
+        return
+    if event_format and saved['format'] != event_format:
+        print('Saved counts are from {} files, rebuilding'.format(saved['format']))
+        return
+
+    return {
+        'version': STATE_VERSION,
+        'format': saved['format'],
+        'watermark': saved['watermark'],
+        'hours': [ScoreStats.load(values) for values in saved['hours']],
+        'actors': {actor: ScoreStats.load(values)
+                   for actor, values in saved['actors'].items()},
+    }
+
+
+def save_state(state):
+    """ Post the accumulators to the S3 bucket """
+    saved = {
+        'version': STATE_VERSION,
+        'format': state['format'],
+        'watermark': state['watermark'],
+        'hours': [counts.dump() for counts in state['hours']],
+        'actors': {actor: counts.dump()
+                   for actor, counts in state['actors'].items()},
+    }
+    try:
+        s3_client = boto3.client('s3')
+        s3_client.put_object(
             Bucket=AWS_S3_EVENT_BUCKET,
-            Key=key,
-            Fileobj=bytes_buffer)
-        byte_value = bytes_buffer.getvalue()
-        str_value = byte_value.decode('utf-8')
-        data = json.loads(str_value)
-
-        # iterate over each record
-        # {'event_date': '2019-08-31 12:30:1567254600',
-        # 'event_hour': 12,
-        # 'actor1_type1_code': 'GOV',
-        # 'goldstein': '1.9',
-        # 'tone': '-0.41379310344828',
-        # 'latitude': '31.106',
-        # 'longitude': '-97.6475',
-        # 'score_class1': True,
-        # 'score_class2': 3,
-        # 'score_timing': 0.09399999999004649}
-
-        for record in data:
-            v = str(record['score_class2'])
-
-            # actor stats
-            actor = record['actor1_type1_code']
-            if actor in actors:
-                actors[actor]['gdelt_count'] += 1
-                if record['score_timing'] < actors[actor]['min_timing']:
-                    actors[actor]['min_timing'] = record['score_timing']
-                if record['score_timing'] > actors[actor]['max_timing']:
-                    actors[actor]['max_timing'] = record['score_timing']
-                actors[actor]['timing_sum'] += record['score_timing']
-                actors[actor]['c1_true'] += 1 if record['score_class1'] else 0
-                if v in actors[actor]['c2']:
-                    actors[actor]['c2'][v] += 1
-                else:
-                    c2_values.add(v)
-                    actors[actor]['c2'][v] = 1
-            else:
-                actors[actor] = {}
-                actors[actor]['gdelt_count'] = 1
-                actors[actor]['min_timing'] = record['score_timing']
-                actors[actor]['max_timing'] = record['score_timing']
-                actors[actor]['timing_sum'] = record['score_timing']
-                actors[actor]['c1_true'] = 1 if record['score_class1'] else 0
-                actors[actor]['c2'] = {}
-                actors[actor]['c2'][v] = 1
-
-            # hourly stats
-            h = record['event_hour']
-
-            stats[h]['gdelt_count'] += 1
-
-            if (stats[h]['min_timing'] == 0 or
-                    record['score_timing'] < stats[h]['min_timing']):
-                stats[h]['min_timing'] = record['score_timing']
-
-            if record['score_timing'] > stats[h]['max_timing']:
-                stats[h]['max_timing'] = record['score_timing']
-
-            stats[h]['timing_sum'] += record['score_timing']
-
-            if record['score_class1']:
-                stats[h]['c1_true'] += 1
-            else:
-                stats[h]['c1_false'] += 1
-
-            if v in stats[h]['c2']:
-                stats[h]['c2'][v] += 1
-            else:
-                c2_values.add(v)
-                stats[h]['c2'][v] = 1
-
-    # Generate calculated actor values
-    for actor in actors:
-        if actors[actor]['gdelt_count']:
-            actors[actor]['avg_timing'] = \
-                actors[actor]['timing_sum'] / actors[actor]['gdelt_count']
-            actors[actor]['c1_true_pct'] = float("%.2f" % (
-                100 * actors[actor]['c1_true'] / actors[actor]['gdelt_count']))
-            actors[actor]['c1_true_pct'] = '{}%'.format(actors[actor]['c1_true_pct'])
-            for key in actors[actor]['c2'].keys():
-                actors[actor]['c2'][key] = float("%.2f" % (
-                    100 * actors[actor]['c2'][key] / actors[actor]['gdelt_count']))
-                actors[actor]['c2'][key] = '{}%'.format(actors[actor]['c2'][key])
-
-    # Generate calculated stats values
-    for h in range(24):
-        if stats[h]['gdelt_count']:
-            stats[h]['avg_timing'] = \
-                stats[h]['timing_sum'] / stats[h]['gdelt_count']
-            stats[h]['c1_true_pct'] = float("%.2f" % (
-                100 * stats[h]['c1_true'] / stats[h]['gdelt_count']))
-            stats[h]['c1_true_pct'] = '{}%'.format(stats[h]['c1_true_pct'])
-            for key in stats[h]['c2'].keys():
-                stats[h]['c2'][key] = float("%.2f" % (
-                    100 * stats[h]['c2'][key] / stats[h]['gdelt_count']))
-                stats[h]['c2'][key] = '{}%'.format(stats[h]['c2'][key])
+            Body=json.dumps(saved),
+            Key=AWS_S3_STATE_KEY,
+            ContentType='application/json'
+        )
+    except Exception as exc:
+        print(exc)
+
+
+def engine_count_file(engine):
+    """
+        Return the function(state, body, event_format) that counts an
+        event file with the aggregation engine. The numpy engine reads
+        the file straight into columns.
+    """
+    if engine == 'numpy':
+        if score_columns is None:
+            raise RuntimeError('The numpy aggregation engine requires NumPy')
+        return lambda state, body, event_format: score_columns.add_columns(
+            state, score_columns.ScoreColumns.from_file(body, event_format, REPORT_COLUMNS))
+    return lambda state, body, event_format: add_records(
+        state, decode_events(body, event_format, REPORT_COLUMNS))
+
+
+def file_counts(s3, key, engine=AGGREGATION_ENGINE):
+    """ Fetch, parse and count one event file (run in a worker) """
+    state = new_state()
+    engine_count_file(engine)(state, read_s3_object(s3, key), key_format(key))
+    return state
+
+
+def fetch_counts(keys, concurrency=FETCH_CONCURRENCY, engine=AGGREGATION_ENGINE):
+    """
+        Generate (key, accumulators) for each event file, in key order.
+
+        Up to `concurrency` files are fetched and counted at once, with a
+        few more queued, so the listing is consumed only as workers free
+        up. Each file gets its own partial accumulators, merged by the
+        caller in key order, so the result doesn't depend on which
+        worker handled which file.
+    """
+    s3 = boto3.client('s3', config=Config(max_pool_connections=concurrency))
+    keys = iter(keys)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = deque()
+        while True:
+            for key in itertools.islice(keys, concurrency * 2 - len(pending)):
+                pending.append((key, executor.submit(file_counts, s3, key, engine)))
+            if not pending:
+                break
+
+            key, future = pending.popleft()
+            yield key, future.result()
+
+
+def update_state(state, concurrency=FETCH_CONCURRENCY, engine=AGGREGATION_ENGINE):
+    """
+        Fold every event file after the state's watermark into it.
+        Returns the number of files added.
+    """
+    count = 0
+    keys = complete_event_keys(state['format'], start_after=state['watermark'])
+    for key, counts in fetch_counts(keys, concurrency, engine):
+        merge_state(state, counts)
+        state['watermark'] = key
+        count += 1
+    return count
+
+
+def generate_counts(rebuild=False, concurrency=FETCH_CONCURRENCY, engine=AGGREGATION_ENGINE,
+                    event_format=AWS_S3_EVENT_FORMAT):
+    """
+        Update the accumulators with the event files written since the
+        last run, or from scratch when rebuild is set, and write the
+        reports.
+
+        Event files are named by GDELT timestamp so they are listed in
+        the order they were written and the watermark is the last key
+        folded in; a file still being written in parts stops it (see
+        complete_event_keys()). Files added below the watermark (a
+        backfill) are only picked up by a rebuild.
+    """
+    state = None if rebuild else load_state(event_format)
+    if state is None:
+        state = new_state(event_format)
+
+    count = update_state(state, concurrency, engine)
+    print('Added {} event files up to {}'.format(count, state['watermark']))
+    if count:
+        save_state(state)
+
+    write_reports(state)
+
+
+def generate_window_counts(start, end, report_path, concurrency=FETCH_CONCURRENCY,
+                           engine=AGGREGATION_ENGINE, event_format=AWS_S3_EVENT_FORMAT):
+    """
+        Count the event files written from start up to end (UTC hours)
+        and write the reports under report_path.
+
+        Only the partitions in the range are listed and fetched, so the
+        cost follows the length of the range rather than the history.
+        The incremental accumulators are not used or changed.
+    """
+    state = new_state(event_format)
+    count = 0
+    for key, counts in fetch_counts(window_keys(event_format, start, end), concurrency, engine):
+        merge_state(state, counts)
+        count += 1
+    print('Counted {} event files from {:%Y-%m-%d %H}:00 to {:%Y-%m-%d %H}:00'.format(count, start, end))
+
+    write_reports(state, report_path)
+
+
+def window_report_path(start, end, hours=None):
+    """ Return the reports prefix for a date range """
+    if hours:
+        name = 'last-{}h'.format(hours)
+    else:
+        name = '{:%Y-%m-%dT%H}_{:%Y-%m-%dT%H}'.format(start, end)
+    return '{}/{}'.format(AWS_S3_WINDOW_REPORTS_PATH, name)
+
+
+def write_reports(state, report_path=AWS_S3_REPORTS_PATH):
+    """ Write the JSON and HTML reports for the accumulators """
+    stats, actors, c2_values = finish(state)
 
     # write stats to JSON file
-    write_json_report(stats, actors)
+    write_json_report(stats, actors, report_path)
 
     # write stats to HTML file
-    write_html_report(create_stats_html(stats, actors, c2_values))
+    write_html_report(create_stats_html(stats, actors, c2_values), report_path)
+
+
+def verify_counts(concurrency=FETCH_CONCURRENCY, engine=AGGREGATION_ENGINE):
+    """
+        Check the saved incremental accumulators match a full recompute
+        up to the same watermark.
+    """
+    state = load_state()
+    if state is None:
+        print('No saved counts to verify')
+        return False
+
+    full = new_state(state['format'])
+    keys = itertools.takewhile(
+        lambda key: key <= state['watermark'],
+        event_keys(state['format']))
+    for key, counts in fetch_counts(keys, concurrency, engine):
+        merge_state(full, counts)
+        full['watermark'] = key
+
+    matches = full == state
+    print('Incremental counts {} the full recompute'.format(
+        'match' if matches else 'DO NOT match'))
+    return matches
 
 
 def create_stats_html(stats, actors, c2_values):
@@ -317,7 +582,7 @@ def actors_html_scoring_performance(actors, c2_values):
     return pg
 
 
-def write_json_report(stats, actors):
+def write_json_report(stats, actors, report_path=AWS_S3_REPORTS_PATH):
     """ Post the data file to the S3 bucket """
     def write_key(this_key, data):
         try:
@@ -331,16 +596,16 @@ def write_json_report(stats, actors):
         except Exception as exc:
             print(exc)
 
-    this_key = '{}/stats.json'.format(AWS_S3_REPORTS_PATH)
+    this_key = '{}/stats.json'.format(report_path)
     write_key(this_key, stats)
 
-    this_key = '{}/actors.json'.format(AWS_S3_REPORTS_PATH)
+    this_key = '{}/actors.json'.format(report_path)
     write_key(this_key, actors)
 
 
-def write_html_report(s3_data):
+def write_html_report(s3_data, report_path=AWS_S3_REPORTS_PATH):
     """ Post the data file to the S3 bucket """
-    this_key = '{}/stats.html'.format(AWS_S3_REPORTS_PATH)
+    this_key = '{}/stats.html'.format(report_path)
 
     try:
         s3_client = boto3.client('s3')
@@ -357,21 +622,76 @@ def write_html_report(s3_data):
     return False if response['ResponseMetadata']['HTTPStatusCode'] != 200 else True
 
 
-def main():
+def parse_hour(value):
+    """ Parse a UTC date, YYYY-MM-DD, or date and hour, YYYY-MM-DDTHH """
+    for date_format in ('%Y-%m-%dT%H', '%Y-%m-%d'):
+        try:
+            return datetime.datetime.strptime(value, date_format)
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError('expected YYYY-MM-DD or YYYY-MM-DDTHH: {}'.format(value))
+
+
+def main(rebuild=False, verify=False, concurrency=FETCH_CONCURRENCY,
+         engine=AGGREGATION_ENGINE, event_format=AWS_S3_EVENT_FORMAT,
+         start=None, end=None, hours=None):
     """ Processing controller """
-    # Iterate over the scoring data in the S3 bucket
-    generate_counts()
+    if verify:
+        verify_counts(concurrency, engine)
+        return
+
+    # Report over a date range, or the last few hours up to now
+    if hours or start:
+        if hours:
+            end = datetime.datetime.utcnow()
+            start = end - datetime.timedelta(hours=hours)
+        elif end is None:
+            end = datetime.datetime.utcnow()
+        generate_window_counts(start, end, window_report_path(start, end, hours),
+                               concurrency=concurrency, engine=engine,
+                               event_format=event_format)
+        return
+
+    # Iterate over the new scoring data in the S3 bucket
+    generate_counts(rebuild=rebuild, concurrency=concurrency, engine=engine,
+                    event_format=event_format)
 
 
 def lambda_handler(event, context):
     # Within Lambda, boto initialization uses the IAM role available
     boto3.setup_default_session(region_name=AWS_REGION)
-    main()
+    event = event or {}
+    main(rebuild=bool(event.get('rebuild')), hours=event.get('hours'))
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate the scoring reports.')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='recompute the counts from every event file')
+    parser.add_argument('--verify', action='store_true',
+                        help='check the saved counts match a full recompute')
+    parser.add_argument('--concurrency', type=int, default=FETCH_CONCURRENCY,
+                        help='event files fetched at once')
+    parser.add_argument('--engine', choices=['python', 'numpy'],
+                        default=AGGREGATION_ENGINE,
+                        help='record aggregation engine')
+    parser.add_argument('--format', choices=sorted(EVENT_FORMATS),
+                        default=AWS_S3_EVENT_FORMAT,
+                        help='format of the event files to read')
+    parser.add_argument('--hours', type=int,
+                        help='report on only the last HOURS hours of event files')
+    parser.add_argument('--start', type=parse_hour,
+                        help='report on only the event files from this UTC date or hour, YYYY-MM-DD[THH]')
+    parser.add_argument('--end', type=parse_hour,
+                        help='... up to (not including) this UTC date or hour, default now')
+    args = parser.parse_args()
+    if args.end and not args.start:
+        parser.error('--end requires --start')
+
     # Outside Lambda, boto uses AWS credentials
     boto3.setup_default_session(
         region_name=AWS_REGION,
         profile_name=AWS_PROFILE)
-    main()
+    main(rebuild=args.rebuild, verify=args.verify, concurrency=args.concurrency,
+         engine=args.engine, event_format=args.format, start=args.start,
+         end=args.end, hours=args.hours)
@@ -0,0 +1,187 @@
+"""
+    Encode, decode and lay out files of scored events.
+
+    Two formats are understood by acquire_and_score (writer) and
+    chart_by_hour (reader):
+
+        json  one JSON array of record objects (the original format)
+        tsv   gzipped tab separated values with a header line and the
+              fixed, typed schema below; key names are not repeated on
+              every record and QuickSight reads it directly (see
+              quicksight_tsv_events_manifest.json)
+
+    Numeric TSV columns decode to int/float (None when empty) rather than
+    the strings the JSON files carry for goldstein, tone, latitude and
+    longitude.
+
+    Files are partitioned by the date and hour of their GDELT update,
+        dated-events/date=YYYY-MM-DD/hour=HH/<YYYYMMDDHHMMSS>.json
+    so a report over a date range only lists the prefixes in the range.
+    Keys still sort in the order the files were written, after any
+    files from the older flat layout (dated-events/<YYYYMMDDHHMMSS>.json).
+
+    A file written in parts, <YYYYMMDDHHMMSS>-<part>.json, is complete
+    once its marker, <YYYYMMDDHHMMSS>.done, is written; the marker sorts
+    after the parts.
+"""
+
+import datetime
+import gzip
+import io
+import json
+import re
+
+# Column name and type, in file order
+EVENT_SCHEMA = [
+    ('event_date', str),
+    ('event_hour', int),
+    ('actor1_type1_code', str),
+    ('goldstein', float),
+    ('tone', float),
+    ('latitude', float),
+    ('longitude', float),
+    ('score_class1', bool),
+    ('score_class2', int),
+    ('score_timing', float),
+]
+EVENT_COLUMNS = [name for name, kind in EVENT_SCHEMA]
+
+EVENT_FORMATS = {
+    'json': {'suffix': '.json', 'content_type': 'application/json'},
+    'tsv': {'suffix': '.tsv.gz', 'content_type': 'application/gzip'},
+}
+
+TSV_COMPRESS_LEVEL = 6
+
+PARTS_MARKER_SUFFIX = '.done'
+PART_NUMBER = re.compile(r'-\d{4}$')
+
+
+def partition_path(path, timestamp):
+    """
+        Return the partition prefix for a GDELT YYYYMMDDHHMMSS timestamp.
+    """
+    return '{}/date={}-{}-{}/hour={}'.format(
+        path, timestamp[0:4], timestamp[4:6], timestamp[6:8], timestamp[8:10])
+
+
+def partition_prefixes(path, start, end):
+    """
+        Return the prefixes of the partitions for the hours from start up
+        to (not including) end, in order. Whole days use one day prefix.
+    """
+    prefixes = []
+    hour = start.replace(minute=0, second=0, microsecond=0)
+    while hour < end:
+        next_day = hour + datetime.timedelta(days=1)
+        if hour.hour == 0 and next_day <= end:
+            prefixes.append('{}/date={:%Y-%m-%d}/'.format(path, hour))
+            hour = next_day
+        else:
+            prefixes.append('{}/date={:%Y-%m-%d}/hour={:%H}/'.format(path, hour, hour))
+            hour += datetime.timedelta(hours=1)
+    return prefixes
+
+
+def key_format(key):
+    """ Return the format of an event file from its key """
+    for event_format, details in EVENT_FORMATS.items():
+        if key.endswith(details['suffix']):
+            return event_format
+    raise ValueError('Unknown event file format: {}'.format(key))
+
+
+def event_file_stem(key):
+    """
+        Return the key of an event file, part or parts marker without
+        its suffix and part number, and whether it is a part.
+    """
+    for suffix in [PARTS_MARKER_SUFFIX] + [details['suffix'] for details in EVENT_FORMATS.values()]:
+        if key.endswith(suffix):
+            key = key[:-len(suffix)]
+            break
+    stem = PART_NUMBER.sub('', key)
+    return stem, stem != key
+
+
+def encode_value(value, kind):
+    if value is None or value == '':
+        return ''
+    if kind is bool:
+        return '1' if value else '0'
+    if kind is float:
+        return repr(float(value))
+    # Tabs and line breaks can't appear inside a field, so lines and
+    # fields are split without any quoting
+    return str(value).replace('\t', ' ').replace('\r', ' ').replace('\n', ' ')
+
+
+def encode_events(records, event_format):
+    """ Return the records as the bytes of an event file """
+    if event_format == 'json':
+        return json.dumps(records).encode('utf-8')
+
+    lines = ['\t'.join(EVENT_COLUMNS)]
+    for record in records:
+        lines.append('\t'.join([encode_value(record.get(name), kind)
+                                for name, kind in EVENT_SCHEMA]))
+    lines.append('')
+
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=TSV_COMPRESS_LEVEL, mtime=0) as gz:
+        gz.write('\n'.join(lines).encode('utf-8'))
+    return buffer.getvalue()
+
+
+def decode_tsv_columns(body, columns=None):
+    """
+        Return {name: [field, ...]} for a TSV event file, the fields
+        left as the strings in the file, for the given columns (all of
+        them by default).
+
+        The rows are split into fields in one pass over the whole file
+        and each column is taken as a slice of those, so reading a file
+        into columns (see score_columns.py) costs no Python loop per row.
+    """
+    text = gzip.decompress(body).decode('utf-8')
+    header, _, rows = text.partition('\n')
+    names = header.split('\t')
+    if rows.endswith('\n'):
+        rows = rows[:-1]
+    fields = rows.replace('\n', '\t').split('\t') if rows else []
+    width = len(names)
+    if len(fields) % width:
+        raise ValueError('Rows of the TSV event file do not match its header')
+    return {name: fields[index::width]
+            for index, name in enumerate(names)
+            if columns is None or name in columns}
+
+
+def decode_events(body, event_format, columns=None):
+    """
+        Return the list of records in an event file.
+
+        When columns is given TSV records only hold those columns, which
+        skips converting the rest; JSON records are returned whole.
+    """
+    if event_format == 'json':
+        return json.loads(body.decode('utf-8'))
+
+    fields = decode_tsv_columns(body, columns)
+
+    # Convert a column at a time, mapping by the header so files keep
+    # reading if columns are added
+    kinds = dict(EVENT_SCHEMA)
+    names = []
+    values = []
+    for name, column in fields.items():
+        kind = kinds.get(name, str)
+        if kind is float:
+            column = [float(v) if v else None for v in column]
+        elif kind is int:
+            column = [int(v) if v else None for v in column]
+        elif kind is bool:
+            column = [v == '1' if v else None for v in column]
+        names.append(name)
+        values.append(column)
+    return [dict(zip(names, row)) for row in zip(*values)]
@@ -0,0 +1,54 @@
+"""
+    Stream rows out of a zipped GDELT export file.
+
+    The download is spooled to a temporary file (kept in memory only
+    while it is small) and the zip member is decompressed and split one
+    line at a time, so peak memory stays roughly constant however large
+    the export is.
+"""
+
+import io
+import shutil
+import tempfile
+from urllib.request import urlopen
+from zipfile import ZipFile
+
+# Downloads larger than this are spooled to disk (/tmp on Lambda)
+SPOOL_MEMORY_LIMIT = 8 * 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def download_event_file(file_url):
+    """
+        Download the zip file into a spooled temporary file.
+
+        Exceptions from the download propagate to the caller.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_LIMIT)
+    try:
+        with urlopen(file_url) as response:
+            shutil.copyfileobj(response, spool, DOWNLOAD_CHUNK_SIZE)
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def iter_event_lines(spool, member_name):
+    """
+        Yield each line of the zip member, without its line ending.
+    """
+    with ZipFile(spool) as zipfile:
+        with zipfile.open(member_name) as member:
+            for line in io.TextIOWrapper(member, encoding='utf-8', newline='\n'):
+                yield line.rstrip('\n')
+
+
+def iter_event_rows(spool, member_name):
+    """
+        Yield each line of the zip member as a list of tab separated fields.
+        To read only some columns, see gdelt_parser.py.
+    """
+    for line in iter_event_lines(spool, member_name):
+        yield line.split('\t')
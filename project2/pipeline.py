@@ -0,0 +1,157 @@
+"""
+    Run processing stages concurrently, connected by bounded queues.
+
+    Each stage is a function from an iterable of input items to an
+    iterable of output items (usually a generator) and runs in its own
+    thread(s):
+
+        pipeline = Pipeline(queue_size=8)
+        pipeline.add('parse', parse_file)
+        pipeline.add('score', score_rows)
+        pipeline.add('write', write_chunks, workers=4)
+        for result in pipeline.run(file_urls):
+            ...
+
+    A stage blocks when the queue to the next stage is full, so a slow
+    stage holds back the ones before it and at most queue_size items wait
+    between any two stages. A stage with several workers shares its input
+    queue between them, so its output is in no particular order.
+
+    Each stage records the time it spent working, waiting for input and
+    blocked on a full output queue; see Pipeline.report().
+"""
+
+import queue
+import threading
+import time
+
+# Marks the end of a stage's input
+DONE = object()
+
+
+class StageStats(object):
+    """
+        Item counts and timings of one pipeline stage; the times of a
+        stage with several workers are summed over the workers.
+    """
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.items_in = 0
+        self.items_out = 0
+        self.seconds = 0.0
+        self.input_wait = 0.0
+        self.output_wait = 0.0
+        self.lock = threading.Lock()
+
+    def busy(self):
+        """ Worker seconds spent in the stage function """
+        return self.seconds - self.input_wait - self.output_wait
+
+    def report(self):
+        return '{:<10} workers {:>3} in {:>8} out {:>8} busy {:>8.2f}s waiting {:>8.2f}s blocked {:>8.2f}s'.format(
+            self.name, self.workers, self.items_in, self.items_out,
+            self.busy(), self.input_wait, self.output_wait)
+
+
+class Stage(object):
+
+    def __init__(self, name, func, workers, inbox, outbox):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.inbox = inbox
+        self.outbox = outbox
+        self.stats = StageStats(name, self.workers)
+        self.running = self.workers
+        self.error = None
+
+    def inputs(self):
+        """ Yield items from the inbox until the end marker """
+        while True:
+            start = time.perf_counter()
+            item = self.inbox.get()
+            with self.stats.lock:
+                self.stats.input_wait += time.perf_counter() - start
+            if item is DONE:
+                # Leave the marker for the stage's other workers
+                self.inbox.put(DONE)
+                return
+            with self.stats.lock:
+                self.stats.items_in += 1
+            yield item
+
+    def work(self):
+        start = time.perf_counter()
+        try:
+            for item in self.func(self.inputs()):
+                wait = time.perf_counter()
+                self.outbox.put(item)
+                with self.stats.lock:
+                    self.stats.output_wait += time.perf_counter() - wait
+                    self.stats.items_out += 1
+        except Exception as exc:
+            self.error = exc
+            # Keep consuming so the stages before this one can finish
+            for item in self.inputs():
+                pass
+        finally:
+            with self.stats.lock:
+                self.stats.seconds += time.perf_counter() - start
+                self.running -= 1
+                last = self.running == 0
+            if last:
+                self.outbox.put(DONE)
+
+
+class Pipeline(object):
+
+    def __init__(self, queue_size=8):
+        self.queue_size = queue_size
+        self.stages = []
+
+    def add(self, name, func, workers=1):
+        """ Append a stage, fed by the previous stage's output """
+        inbox = self.stages[-1].outbox if self.stages else queue.Queue(self.queue_size)
+        self.stages.append(Stage(name, func, workers, inbox, queue.Queue(self.queue_size)))
+
+    def run(self, items):
+        """
+            Feed the items to the first stage and yield the outputs of
+            the last one. A stage's exception is raised once every stage
+            has finished.
+        """
+        threads = [threading.Thread(target=stage.work, name=stage.name, daemon=True)
+                   for stage in self.stages for i in range(stage.workers)]
+        for thread in threads:
+            thread.start()
+
+        feeder = threading.Thread(target=self.feed, args=(items, ), daemon=True)
+        feeder.start()
+
+        outbox = self.stages[-1].outbox
+        while True:
+            item = outbox.get()
+            if item is DONE:
+                break
+            yield item
+
+        feeder.join()
+        for thread in threads:
+            thread.join()
+        for stage in self.stages:
+            if stage.error is not None:
+                raise stage.error
+
+    def feed(self, items):
+        inbox = self.stages[0].inbox
+        try:
+            for item in items:
+                inbox.put(item)
+        finally:
+            inbox.put(DONE)
+
+    def report(self):
+        """ Return the stage timings, one line per stage """
+        return '\n'.join(stage.stats.report() for stage in self.stages)
@@ -0,0 +1,102 @@
+"""
+    Report the score cache hit rate over a replayed day of GDELT events.
+
+    Each quarter hour export of the day is streamed in order and its
+    scoring records are looked up in a ScoreCache as process_event_file
+    would, without calling the model (a miss stores a placeholder score).
+    The running hit rate is printed after each file, along with the share
+    of the file's records answered by scores cached from earlier files,
+    which only a cache kept between files (or the persistent tier) gets:
+
+        python report_score_cache.py --date 20191001
+        python report_score_cache.py --files 20191001000000.export.CSV.zip ...
+
+    Pass --store to replay through a SQLite tier as well, e.g. to see
+    what a second day gains from the first.
+"""
+
+import argparse
+import datetime
+import os
+from urllib.request import pathname2url
+
+from acquire_and_score import SPG_CACHE_SIZE, SPG_CACHE_TTL, scoring_items
+from gdelt_stream import download_event_file, iter_event_lines
+from score_cache import ScoreCache, SQLiteStore
+
+GDELT_EVENT_FILE_URL = 'http://data.gdeltproject.org/gdeltv2/{}.export.CSV.zip'
+
+
+def day_urls(date):
+    """
+        Return the URLs of the 96 quarter hour exports of a YYYYMMDD day.
+    """
+    start = datetime.datetime.strptime(date, '%Y%m%d')
+    return [GDELT_EVENT_FILE_URL.format(
+        (start + datetime.timedelta(minutes=15 * index)).strftime('%Y%m%d%H%M%S'))
+        for index in range(96)]
+
+
+def replay(cache, file_url):
+    """
+        Look up every scoring record of the file, caching the misses.
+        Returns the records and the hits on scores cached by an earlier
+        file.
+    """
+    filename = os.path.basename(file_url[:-4])
+    records = 0
+    earlier = 0
+    with download_event_file(file_url) as spool:
+        for ghour, scoring_parts in scoring_items(iter_event_lines(spool, filename)):
+            cached = cache.get(scoring_parts)
+            if cached is None:
+                cache.put(scoring_parts, {'class1': None, 'class2': None, 'file': filename})
+            elif cached.get('file') != filename:
+                earlier += 1
+            records += 1
+    return records, earlier
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--date', help='YYYYMMDD day to download from GDELT')
+    source.add_argument('--files', nargs='+', help='local export zip files')
+    parser.add_argument('--store', help='SQLite file for the persistent tier')
+    parser.add_argument('--size', type=int, default=SPG_CACHE_SIZE)
+    args = parser.parse_args()
+
+    if args.date:
+        file_urls = day_urls(args.date)
+    else:
+        file_urls = ['file:' + pathname2url(os.path.abspath(path))
+                     for path in args.files]
+
+    store = SQLiteStore(args.store, ttl=SPG_CACHE_TTL) if args.store else None
+    cache = ScoreCache(max_size=args.size, store=store)
+
+    print('{:>24} {:>10} {:>10} {:>10} {:>10} {:>10}'.format(
+        'file', 'records', 'hits', 'misses', 'hit_rate', 'earlier'))
+    for file_url in file_urls:
+        try:
+            records, earlier = replay(cache, file_url)
+        except Exception as exc:
+            print('{}: {}'.format(file_url, exc))
+            continue
+
+        stats = cache.stats()
+        print('{:>24} {:>10} {:>10} {:>10} {:>10.2%} {:>10.2%}'.format(
+            os.path.basename(file_url)[:14],
+            records,
+            stats['hits'] + stats['store_hits'],
+            stats['misses'],
+            stats['hit_rate'],
+            earlier / records if records else 0))
+
+    print(cache.stats())
+    if store:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+    Mergeable accumulators for the scoring report.
+
+    A ScoreStats holds the raw counts and sums for one hour or one actor:
+    record count, min/max/sum of the scoring time over the records that
+    have one (scores from the cache don't), class1 true and false counts
+    and a class2 histogram. Accumulators for separate files,
+    workers or runs are combined with merge(); percentages and averages
+    are only formatted by report(), so an accumulator can keep having
+    records added after a report has been made from it.
+"""
+
+
+def percent(count, total):
+    """ Format count / total the way the reports always have, e.g. '12.34%' """
+    return '{}%'.format(float("%.2f" % (100 * count / total)))
+
+
+class ScoreStats(object):
+
+    __slots__ = ('count', 'min_timing', 'max_timing', 'timing_sum',
+                 'c1_true', 'c1_false', 'c2', 'timed')
+
+    def __init__(self):
+        self.count = 0
+        # Records with a timing, which the timing stats cover
+        self.timed = 0
+        self.min_timing = 0
+        self.max_timing = 0
+        self.timing_sum = 0
+        self.c1_true = 0
+        self.c1_false = 0
+        # str(class2 value) -> count, in order of first appearance
+        self.c2 = {}
+
+    def add(self, timing, class1, class2):
+        """ Add one scored record, with a timing of None if it was cached """
+        if timing is not None:
+            if not self.timed:
+                self.min_timing = timing
+                self.max_timing = timing
+            elif timing < self.min_timing:
+                self.min_timing = timing
+            elif timing > self.max_timing:
+                self.max_timing = timing
+            self.timed += 1
+            self.timing_sum += timing
+        self.count += 1
+        if class1:
+            self.c1_true += 1
+        else:
+            self.c1_false += 1
+        c2 = self.c2
+        c2[class2] = c2.get(class2, 0) + 1
+
+    def merge(self, other):
+        """ Fold another accumulator into this one """
+        if not other.count:
+            return self
+        if other.timed and not self.timed:
+            self.min_timing = other.min_timing
+            self.max_timing = other.max_timing
+        elif other.timed:
+            if other.min_timing < self.min_timing:
+                self.min_timing = other.min_timing
+            if other.max_timing > self.max_timing:
+                self.max_timing = other.max_timing
+        self.count += other.count
+        self.timed += other.timed
+        self.timing_sum += other.timing_sum
+        self.c1_true += other.c1_true
+        self.c1_false += other.c1_false
+        for v, count in other.c2.items():
+            self.c2[v] = self.c2.get(v, 0) + count
+        return self
+
+    def dump(self):
+        """ Return the accumulator as a JSON serializable list """
+        return [self.count, self.min_timing, self.max_timing, self.timing_sum,
+                self.c1_true, self.c1_false, self.c2, self.timed]
+
+    @classmethod
+    def load(cls, values):
+        stats = cls()
+        (stats.count, stats.min_timing, stats.max_timing, stats.timing_sum,
+         stats.c1_true, stats.c1_false, stats.c2, stats.timed) = values
+        return stats
+
+    def __eq__(self, other):
+        return isinstance(other, ScoreStats) and self.dump() == other.dump()
+
+    def hour_report(self):
+        """ Return the report values for an hour """
+        report = {
+            'gdelt_count': self.count,
+            'min_timing': self.min_timing,
+            'max_timing': self.max_timing,
+            'avg_timing': 0,
+            'timing_sum': self.timing_sum,
+            'c1_true': self.c1_true,
+            'c1_true_pct': 0,
+            'c1_false': self.c1_false,
+            'c2': {}}
+        if self.timed:
+            report['avg_timing'] = self.timing_sum / self.timed
+        if self.count:
+            report['c1_true_pct'] = percent(self.c1_true, self.count)
+            report['c2'] = {v: percent(count, self.count)
+                            for v, count in self.c2.items()}
+        return report
+
+    def actor_report(self):
+        """ Return the report values for an actor """
+        return {
+            'gdelt_count': self.count,
+            'min_timing': self.min_timing,
+            'max_timing': self.max_timing,
+            'timing_sum': self.timing_sum,
+            'c1_true': self.c1_true,
+            'c2': {v: percent(count, self.count)
+                   for v, count in self.c2.items()},
+            'avg_timing': self.timing_sum / self.timed if self.timed else 0,
+            'c1_true_pct': percent(self.c1_true, self.count)}
@@ -0,0 +1,184 @@
+"""
+    Score GDELT events against the S&P Global model API.
+
+    One client is created per process and kept for its lifetime (in
+    Lambda, across warm invocations). Its scoring threads live in one
+    executor, and each keeps its own requests.Session, so connections
+    (and TLS handshakes) are reused from call to call. The Basic auth
+    header is built once, and at most `concurrency` requests are in
+    flight at a time.
+
+    With batch_size > 1 several records are sent per request as
+        {"data": [record, ...]}
+    and the endpoint is expected to answer with a list of results in the
+    same order, {"result": [{"class1": ..., "class2": ...}, ...],
+    "timing": ...}. Leave batch_size at 1 for endpoints that only score a
+    single record per call.
+
+    Given a ScoreCache (see score_cache.py) records already scored are
+    answered from the cache and only the misses are sent to the model.
+    Only the classes are cached; a score from the cache has a timing of
+    None, as no model call was timed for it.
+"""
+
+import base64
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import json
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class ScoringClient(object):
+
+    def __init__(self, url, auth, concurrency=16, batch_size=1, timeout=30,
+                 cache=None):
+        self.url = url
+        self.concurrency = max(1, concurrency)
+        self.batch_size = max(1, batch_size)
+        self.timeout = timeout
+        self.cache = cache
+
+        user_pass = base64.b64encode('{}:{}'.format(
+            auth,
+            auth).encode('utf-8')).decode('utf-8')
+        self.headers = {
+            'Content-Type': 'application/json',
+            'Authorization': 'Basic {}'.format(user_pass)}
+        self.local = threading.local()
+        # Threads are started as they are needed, and kept
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+
+    def close(self):
+        """
+            Stop the scoring threads once their work is done.
+        """
+        self.executor.shutdown()
+
+    def session(self):
+        """
+            Return this thread's session, creating it on first use.
+        """
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(self.headers)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self.local.session = session
+        return session
+
+    def post(self, data):
+        response = self.session().post(
+            self.url,
+            data=json.dumps({'data': data}),
+            timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def score(self, scoring_record):
+        """
+            Score one record.
+            Returns {'class1', 'class2', 'timing'} or None on failure.
+        """
+        try:
+            spg_score = self.post(scoring_record)
+            return {
+                'class1': spg_score['result']['class1'],
+                'class2': spg_score['result']['class2'],
+                'timing': spg_score['timing'],
+            }
+        except Exception as exc:
+            print(exc)
+            return
+
+    def score_batch(self, scoring_records):
+        """
+            Score a list of records, from the cache where possible and
+            otherwise in one request.
+            Returns a list of results, None for records that failed.
+        """
+        results = [None] * len(scoring_records)
+        misses = []
+        for index, scoring_record in enumerate(scoring_records):
+            cached = self.cache.get(scoring_record) if self.cache else None
+            if cached is None:
+                misses.append(index)
+            else:
+                results[index] = {
+                    'class1': cached['class1'],
+                    'class2': cached['class2'],
+                    'timing': None,
+                }
+        if not misses:
+            return results
+
+        scored = self.request_batch([scoring_records[index] for index in misses])
+        for index, result in zip(misses, scored):
+            results[index] = result
+            if self.cache and result is not None:
+                self.cache.put(scoring_records[index], {
+                    'class1': result['class1'],
+                    'class2': result['class2'],
+                })
+        return results
+
+    def request_batch(self, scoring_records):
+        """
+            Score a list of records in one request.
+            Returns a list of results, all None if the request failed.
+        """
+        if len(scoring_records) == 1:
+            return [self.score(scoring_records[0])]
+        try:
+            spg_score = self.post(scoring_records)
+            results = spg_score['result']
+            if len(results) != len(scoring_records):
+                raise ValueError('Expected {} scores, got {}'.format(
+                    len(scoring_records), len(results)))
+            return [{
+                'class1': result['class1'],
+                'class2': result['class2'],
+                'timing': spg_score['timing'],
+            } for result in results]
+        except Exception as exc:
+            print(exc)
+            return [None] * len(scoring_records)
+
+    def score_all(self, items):
+        """
+            Score an iterable of (tag, scoring_record) pairs, yielding
+            (tag, scoring_record, result) in input order. Failed records
+            have a result of None.
+
+            Records are read from items only as capacity frees up, so a
+            lazy iterable (e.g. rows streamed from an event file) is never
+            held in memory all at once.
+        """
+        items = iter(items)
+        pending = deque()
+        try:
+            while True:
+                # Keep a few batches queued behind the busy workers
+                while len(pending) < self.concurrency * 2:
+                    batch = list(itertools.islice(items, self.batch_size))
+                    if not batch:
+                        break
+                    records = [record for tag, record in batch]
+                    pending.append(
+                        (batch, self.executor.submit(self.score_batch, records)))
+                if not pending:
+                    break
+
+                batch, future = pending.popleft()
+                for (tag, record), result in zip(batch, future.result()):
+                    yield tag, record, result
+        finally:
+            # Don't leave the shared threads scoring for a caller that
+            # stopped reading
+            for batch, future in pending:
+                future.cancel()
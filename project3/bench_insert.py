@@ -0,0 +1,184 @@
+"""
+    Measure rows per second inserted into api1 by gdelt_score_events.
+
+    Compares the previous insert (a new connection per invocation and one
+    INSERT built by joining formatted value strings) with insert() (a
+    connection kept between invocations and a parameterized executemany
+    upserting on event_id) for a range of batch sizes. Run it against a scratch database, as
+    api1 is emptied before each measurement, e.g. a local container:
+
+        docker run -d --name gdelt-mysql -p 3306:3306 -e MYSQL_ROOT_PASSWORD=bench mysql:5.7
+        mysql -h 127.0.0.1 -u root -pbench -e 'CREATE DATABASE gdelt'
+        mysql -h 127.0.0.1 -u root -pbench < db_schema.sql
+        python bench_insert.py --host 127.0.0.1 --user root --password bench
+
+    It prints the server's max_allowed_packet and the max_stmt_length
+    insert() splits its statements at, and for each batch size the
+    INSERT statements insert() issued (the session's Com_insert) and
+    whether api1 then holds every row. --max-allowed-packet lowers the
+    server's limit first (SET GLOBAL, so it needs SUPER), so that the
+    larger batches have to be split to be accepted at all.
+"""
+
+import argparse
+import random
+import time
+
+import pymysql
+
+import gdelt_score_events
+
+ACTORS = ['GOV', 'MIL', 'BUS', 'CVL', 'EDU', 'MED', 'COP', 'JUD', 'LEG', 'OPP']
+
+
+def make_scored(rng, event_id):
+    """ An (event_id, scoring_record, spg_score) triple as main() sees it """
+    scoring_record = {
+        'actor_code': rng.choice(ACTORS),
+        'goldstein': '{:.1f}'.format(rng.uniform(-10, 10)),
+        'avg_tone': '{:.6f}'.format(rng.uniform(-20, 20)),
+        'lat': '{:.4f}'.format(rng.uniform(-90, 90)) if rng.random() < 0.9 else '',
+        'lon': '{:.4f}'.format(rng.uniform(-180, 180)) if rng.random() < 0.9 else '',
+        'date': '20191001123000',
+    }
+    spg_score = {
+        'class1': rng.random() < 0.3,
+        'class2': rng.randrange(5),
+        'timing': rng.uniform(50, 500),
+    }
+    return event_id, scoring_record, spg_score
+
+
+def previous_format_value(event_id, scoring_record, spg_score):
+    return """('{0}', {1}, {2}, {3}, {4}, '{5}', {6}, {7}, {8})""".format(
+        scoring_record['actor_code'],
+        scoring_record['goldstein'],
+        scoring_record['avg_tone'],
+        scoring_record['lat'] if scoring_record['lat'] else 0,
+        scoring_record['lon'] if scoring_record['lon'] else 0,
+        gdelt_score_events.format_date(scoring_record['date']),
+        1 if spg_score['class1'] else 0,
+        spg_score['class2'],
+        spg_score['timing'])
+
+
+def previous_insert(values):
+    """ The previous insert(): connect, join the values, execute, close """
+    conn = pymysql.connect(
+        host=gdelt_score_events.RDS_HOST,
+        user=gdelt_score_events.RDS_USER,
+        password=gdelt_score_events.RDS_PASS,
+        database=gdelt_score_events.RDS_DB,
+        port=gdelt_score_events.RDS_PORT,
+        connect_timeout=5,
+        autocommit=1)
+    cursor = conn.cursor()
+    sql = """
+INSERT INTO api1
+(actor1_code, goldstein, avg_tone, lat, lon, event_date,
+class1, class2, timing)
+VALUES """
+    cursor.execute(sql + ', '.join(values))
+    conn.close()
+
+
+def execute(sql):
+    conn = gdelt_score_events.get_connection()
+    with conn.cursor() as cursor:
+        cursor.execute(sql)
+        return cursor.fetchone()
+
+
+def query_value(sql):
+    """ The value of a one row query, the last column for SHOW STATUS """
+    return execute(sql)[-1]
+
+
+def set_max_allowed_packet(size):
+    """ Set the server's limit and reconnect, as it applies to new sessions """
+    execute('SET GLOBAL max_allowed_packet = {:d}'.format(size))
+    gdelt_score_events.connection.close()
+    gdelt_score_events.connection = None
+
+
+def empty_table():
+    execute('TRUNCATE TABLE api1')
+
+
+def measure(insert, batches):
+    """
+        Return the seconds taken, the INSERT statements issued on the
+        kept connection and the rows in api1 afterwards.
+    """
+    empty_table()
+    statements = int(query_value("SHOW SESSION STATUS LIKE 'Com_insert'"))
+    start = time.perf_counter()
+    for batch in batches:
+        if not insert(batch) and insert is gdelt_score_events.insert:
+            raise RuntimeError('insert() failed, see the error above')
+    seconds = time.perf_counter() - start
+    statements = int(query_value("SHOW SESSION STATUS LIKE 'Com_insert'")) - statements
+    return seconds, statements, query_value('SELECT COUNT(*) FROM api1')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3306)
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--password', default='')
+    parser.add_argument('--db', default='gdelt')
+    parser.add_argument('--rows', type=int, default=20000,
+                        help='rows inserted for each batch size')
+    parser.add_argument('--batch-sizes', type=int, nargs='+',
+                        default=[10, 100, 1000, 10000])
+    parser.add_argument('--max-allowed-packet', type=int,
+                        help='set the server\'s max_allowed_packet first, e.g. 65536')
+    args = parser.parse_args()
+
+    gdelt_score_events.RDS_HOST = args.host
+    gdelt_score_events.RDS_PORT = args.port
+    gdelt_score_events.RDS_USER = args.user
+    gdelt_score_events.RDS_PASS = args.password
+    gdelt_score_events.RDS_DB = args.db
+
+    rng = random.Random(0)
+    scored = [make_scored(rng, 850000000 + i) for i in range(args.rows)]
+
+    if gdelt_score_events.get_connection() is None:
+        return
+    if args.max_allowed_packet:
+        set_max_allowed_packet(args.max_allowed_packet)
+    print('max_allowed_packet {} max_stmt_length {}'.format(
+        query_value('SELECT @@max_allowed_packet'),
+        gdelt_score_events.max_stmt_length))
+
+    print('{:>8} {:>12} {:>12} {:>8} {:>11} {:>7}'.format(
+        'batch', 'previous/s', 'insert/s', 'speedup', 'statements', 'rows'))
+    for batch_size in args.batch_sizes:
+        previous_batches = []
+        batches = []
+        for offset in range(0, len(scored), batch_size):
+            chunk = scored[offset:offset + batch_size]
+            previous_batches.append([previous_format_value(*scored_record) for scored_record in chunk])
+            batches.append([gdelt_score_events.format_value(*scored_record) for scored_record in chunk])
+
+        # The previous insert sends each batch as one statement, so it
+        # fails once a batch outgrows max_allowed_packet
+        try:
+            previous_seconds = measure(previous_insert, previous_batches)[0]
+        except pymysql.MySQLError as e:
+            print('Previous insert failed at batch size {}: {}'.format(batch_size, e))
+            previous_seconds = None
+        seconds, statements, rows = measure(gdelt_score_events.insert, batches)
+        print('{:>8} {:>12} {:>12.0f} {:>8} {:>11} {:>7}'.format(
+            batch_size,
+            '{:.0f}'.format(args.rows / previous_seconds) if previous_seconds else '-',
+            args.rows / seconds,
+            '{:.1f}x'.format(previous_seconds / seconds) if previous_seconds else '-',
+            statements,
+            'ok' if rows == args.rows else rows))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+    Count the SQS requests needed to publish and score an event file.
+
+    The scoring records of a synthetic event file are published one per
+    message, as before, and packed many to a message by
+    gdelt_publish_events.publish_records(), then drained by
+    gdelt_score_events.main(). The queue is the in-memory stand-in from
+    bench_sqs_drain.py, which adds a fixed latency to every request;
+    scores come from a pre-filled cache and the insert only counts rows:
+
+        python bench_packing.py --records 3000 --latency-ms 10
+"""
+
+import argparse
+import json
+import random
+import time
+
+import boto3
+
+from bench_sqs_drain import FakeQueue, FakeSQS, cache_scores, count_insert, inserted, make_record
+from event_envelope import batch_bodies
+import gdelt_publish_events
+import gdelt_score_events
+from processed_index import ProcessedIndex
+
+
+def previous_publish(pub_queue, records):
+    """ One record per message, 10 messages per request """
+    bodies = (json.dumps(record) for record in records)
+    for entries in batch_bodies(bodies):
+        pub_queue.send_messages(Entries=entries)
+
+
+def measure(name, publish, queue, records):
+    queue.requests = 0
+    start = time.perf_counter()
+    publish(queue, records)
+    publish_requests = queue.requests
+    published = len(queue.available)
+
+    before = inserted[0]
+    while inserted[0] - before < len(records):
+        gdelt_score_events.main(drain=True)
+    seconds = time.perf_counter() - start
+
+    print('{:>10} {:>10} {:>10} {:>10} {:>10} {:>10.2f}'.format(
+        name, published, publish_requests, queue.requests - publish_requests,
+        queue.requests, seconds))
+    return queue.requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--records', type=int, default=3000)
+    parser.add_argument('--latency-ms', type=float, default=10)
+    args = parser.parse_args()
+
+    queue = FakeQueue(args.latency_ms / 1000)
+    boto3.resource = lambda *args, **kwargs: FakeSQS(queue)
+    gdelt_score_events.SQS_DRAIN_WAIT_SECONDS = 0
+    gdelt_score_events.insert = count_insert
+    gdelt_score_events.processed_index = ProcessedIndex()
+
+    rng = random.Random(0)
+    records = [make_record(rng) for i in range(args.records)]
+    cache_scores(records)
+
+    print('{:>10} {:>10} {:>10} {:>10} {:>10} {:>10}'.format(
+        'messages', 'count', 'publish', 'consume', 'requests', 'seconds'))
+    previous = measure('single', previous_publish, queue, records)
+    packed = measure('packed', gdelt_publish_events.publish_records, queue, records)
+    print('{:.1f}x fewer SQS requests'.format(previous / packed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+    Measure publish throughput of a GDELT file's scoring records.
+
+    The records of a synthetic event file are sent one per message and
+    packed many to a message (see event_envelope.py), both by the
+    previous publish() (one batch at a time, exceptions printed, Failed
+    entries dropped) and by sqs_publisher.Publisher at several
+    concurrencies. The queue is the in-memory stand-in from
+    bench_sqs_drain.py, adding a fixed latency to every request and
+    failing a share of the entries sent:
+
+        python bench_publisher.py --records 3000 --latency-ms 20 --fail-rate 0.01 \\
+            --concurrency 1 4 16
+"""
+
+import argparse
+import json
+import random
+import time
+
+from bench_sqs_drain import FakeQueue, make_record
+from event_envelope import batch_bodies, pack_records
+from sqs_publisher import Publisher
+
+
+def previous_publish(queue, batches):
+    for entries in batches:
+        try:
+            queue.send_messages(Entries=entries)
+        except Exception as exc:
+            print('Exception sending message: {}'.format(exc))
+
+
+def publisher_publish(concurrency):
+    def publish(queue, batches):
+        publisher = Publisher(queue, concurrency=concurrency, backoff=0.05)
+        publisher.publish(batches)
+        return publisher.stats()
+    return publish
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--records', type=int, default=3000)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--fail-rate', type=float, default=0.01)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    records = [make_record(rng) for i in range(args.records)]
+    messages = {
+        'single': [json.dumps(record) for record in records],
+        'packed': list(pack_records(records)),
+    }
+
+    publishers = [('previous', previous_publish)]
+    publishers += [('publisher/{}'.format(concurrency), publisher_publish(concurrency))
+                   for concurrency in args.concurrency]
+
+    print('{:>8} {:>14} {:>10} {:>10} {:>10} {:>10} {:>12}'.format(
+        'messages', 'publisher', 'requests', 'delivered', 'seconds', 'records/s', 'retried'))
+    for kind, bodies in messages.items():
+        for name, publish in publishers:
+            queue = FakeQueue(args.latency_ms / 1000, fail_rate=args.fail_rate)
+            start = time.perf_counter()
+            stats = publish(queue, batch_bodies(bodies))
+            seconds = time.perf_counter() - start
+            print('{:>8} {:>14} {:>10} {:>10} {:>10.2f} {:>10.0f} {:>12}'.format(
+                kind, name, queue.requests,
+                '{}/{}'.format(len(queue.available), len(bodies)),
+                seconds, len(records) / seconds,
+                stats['retried'] if stats else '-'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+"""
+    Measure scoring queue throughput of gdelt_score_events.main().
+
+    The gdelt_score queue is filled with scoring messages, then emptied by
+    repeated invocations of the previous main() (one receive of 10
+    messages and a delete call per message) and of main() in drain mode.
+    Scores come from a pre-filled score cache, the insert only counts
+    rows and the processed index is off, so only the queue handling is
+    measured.
+
+    By default the queue is an in-memory stand-in for SQS that adds a
+    fixed latency to every request. Pass --endpoint to use a running
+    stand-in instead, e.g. ElasticMQ:
+
+        python bench_sqs_drain.py --messages 5000 --latency-ms 10
+        docker run -d -p 9324:9324 softwaremill/elasticmq
+        python bench_sqs_drain.py --endpoint http://localhost:9324
+"""
+
+import argparse
+from collections import OrderedDict
+import itertools
+import json
+import random
+import threading
+import time
+
+import boto3
+
+from event_envelope import SQS_MAX_BATCH_MESSAGES, SQS_MAX_MESSAGE_BYTES
+import gdelt_score_events
+from processed_index import ProcessedIndex
+
+ACTORS = ['GOV', 'MIL', 'BUS', 'CVL', 'EDU', 'MED', 'COP', 'JUD', 'LEG', 'OPP']
+
+
+class FakeMessage(object):
+
+    def __init__(self, queue, receipt_handle, body):
+        self.queue = queue
+        self.receipt_handle = receipt_handle
+        self.body = body
+
+    def delete(self):
+        self.queue.delete_messages(Entries=[{'Id': '0', 'ReceiptHandle': self.receipt_handle}])
+
+
+class FakeQueue(object):
+    """
+        Just enough of a boto3 SQS queue resource for gdelt_score_events
+        and gdelt_publish_events. Received messages stay in flight until
+        deleted, and batches over the SQS size limits are refused. With a
+        fail_rate, that share of sent entries is reported as Failed.
+    """
+
+    def __init__(self, latency, fail_rate=0, seed=0):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.rng = random.Random(seed)
+        self.available = OrderedDict()
+        self.in_flight = {}
+        self.handles = itertools.count()
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def request(self):
+        with self.lock:
+            self.requests += 1
+        time.sleep(self.latency)
+
+    def send_messages(self, Entries):
+        self.request()
+        sizes = [len(entry['MessageBody'].encode('utf-8')) for entry in Entries]
+        if len(Entries) > SQS_MAX_BATCH_MESSAGES or sum(sizes) > SQS_MAX_MESSAGE_BYTES:
+            raise ValueError('Batch over the SQS limits: {} messages, {} bytes'.format(len(sizes), sum(sizes)))
+        response = {'Successful': [], 'Failed': []}
+        with self.lock:
+            for entry in Entries:
+                if self.rng.random() < self.fail_rate:
+                    response['Failed'].append({'Id': entry['Id'], 'SenderFault': False, 'Code': 'InternalError'})
+                else:
+                    self.available[next(self.handles)] = entry['MessageBody']
+                    response['Successful'].append({'Id': entry['Id']})
+        return response
+
+    def receive_messages(self, MaxNumberOfMessages=1, WaitTimeSeconds=0, **kwargs):
+        self.request()
+        if not self.available:
+            time.sleep(WaitTimeSeconds)
+            return []
+        messages = []
+        while self.available and len(messages) < MaxNumberOfMessages:
+            handle, body = self.available.popitem(last=False)
+            self.in_flight[handle] = body
+            messages.append(FakeMessage(self, handle, body))
+        return messages
+
+    def delete_messages(self, Entries):
+        self.request()
+        for entry in Entries:
+            del self.in_flight[entry['ReceiptHandle']]
+        return {'Successful': [{'Id': entry['Id']} for entry in Entries]}
+
+
+class FakeSQS(object):
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    def get_queue_by_name(self, QueueName):
+        return self.queue
+
+
+event_ids = itertools.count(850000000)
+
+
+def make_record(rng):
+    """ A scoring record as published by gdelt_publish_events """
+    return {
+        'event_id': str(next(event_ids)),
+        'actor_code': rng.choice(ACTORS),
+        'goldstein': '{:.1f}'.format(rng.choice([-10, -5, -2, 0, 1, 1.9, 3.4, 7])),
+        'avg_tone': '{:.1f}'.format(rng.uniform(-10, 10)),
+        'lat': '',
+        'lon': '',
+        'date': '20191001123000',
+    }
+
+
+def cache_scores(records):
+    """ Pre-fill the score cache, which is keyed without the event id """
+    for record in records:
+        scoring_record = dict(record)
+        del scoring_record['event_id']
+        gdelt_score_events.score_cache.put(scoring_record, {'class1': True, 'class2': 1, 'timing': 100.0})
+
+
+def fill_queue(queue, records):
+    for offset in range(0, len(records), 10):
+        queue.send_messages(Entries=[
+            {'Id': str(index), 'MessageBody': json.dumps(record)}
+            for index, record in enumerate(records[offset:offset + 10])])
+
+
+def previous_main():
+    """ The previous main(): 10 messages, deleted one at a time """
+    sqs = boto3.resource('sqs')
+    sub_queue = sqs.get_queue_by_name(QueueName=gdelt_score_events.AWS_SQS_GDELT_SCORE)
+
+    messages = sub_queue.receive_messages(
+        AttributeNames=['All'],
+        MaxNumberOfMessages=10)
+
+    values = []
+    records = ((message, json.loads(message.body)) for message in messages)
+    items = (((message, record.pop('event_id')), record) for message, record in records)
+    for (message, event_id), scoring_record, spg_score in gdelt_score_events.scoring_client.score_all(items):
+        if spg_score:
+            values.append(gdelt_score_events.format_value(event_id, scoring_record, spg_score))
+        message.delete()
+
+    gdelt_score_events.insert(values)
+    return len(messages)
+
+
+inserted = [0]
+
+
+def count_insert(values):
+    inserted[0] += len(values)
+    return True
+
+
+def drain_main():
+    before = inserted[0]
+    gdelt_score_events.main(drain=True)
+    return inserted[0] - before
+
+
+def measure(name, invoke, queue, records, requests):
+    """ Invoke the consumer until every message has been handled """
+    fill_queue(queue, records)
+    before = requests()
+    invocations = 0
+    handled = 0
+    start = time.perf_counter()
+    while handled < len(records):
+        invocations += 1
+        handled += invoke()
+    seconds = time.perf_counter() - start
+    print('{:>10} {:>10} {:>10.2f} {:>10.0f} {:>12} {:>10}'.format(
+        name, len(records), seconds, len(records) / seconds, invocations,
+        requests() - before))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--latency-ms', type=float, default=10)
+    parser.add_argument('--wait-seconds', type=int, default=1)
+    parser.add_argument('--endpoint', help='URL of a running SQS stand-in')
+    args = parser.parse_args()
+
+    if args.endpoint:
+        boto3.setup_default_session(
+            region_name='us-east-1',
+            aws_access_key_id='bench',
+            aws_secret_access_key='bench')
+        resource = boto3.DEFAULT_SESSION.resource
+        boto3.resource = lambda name, **kwargs: resource(name, endpoint_url=args.endpoint, **kwargs)
+        queue = boto3.resource('sqs').create_queue(QueueName=gdelt_score_events.AWS_SQS_GDELT_SCORE)
+
+        # Count the SQS API requests made
+        calls = [0]
+
+        def count_call(**kwargs):
+            calls[0] += 1
+        boto3.DEFAULT_SESSION.events.register('before-call.sqs', count_call)
+        requests = lambda: calls[0]  # noqa: E731
+    else:
+        queue = FakeQueue(args.latency_ms / 1000)
+        boto3.resource = lambda *args, **kwargs: FakeSQS(queue)
+        requests = lambda: queue.requests  # noqa: E731
+
+    gdelt_score_events.SQS_DRAIN_WAIT_SECONDS = args.wait_seconds
+    gdelt_score_events.insert = count_insert
+    gdelt_score_events.processed_index = ProcessedIndex()
+
+    rng = random.Random(0)
+    records = [make_record(rng) for i in range(args.messages)]
+    cache_scores(records)
+
+    print('{:>10} {:>10} {:>10} {:>10} {:>12} {:>10}'.format(
+        'consumer', 'messages', 'seconds', 'msgs/s', 'invocations', 'requests'))
+    measure('previous', previous_main, queue, records, requests)
+    measure('drain', drain_main, queue, records, requests)
+
+
+if __name__ == '__main__':
+    main()
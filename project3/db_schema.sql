@@ -1,6 +1,7 @@
 USE gdelt;
 
 CREATE TABLE api1 (
+    event_id bigint,
     actor1_code varchar(256) NOT NULL,
     goldstein float NOT NULL,
     avg_tone float NOT NULL,
@@ -9,5 +10,22 @@ CREATE TABLE api1 (
     event_date datetime NOT NULL,
     class1 bool,
     class2 tinyint,
-    timing float
+    timing float,
+    UNIQUE KEY event_id (event_id)
+)ENGINE=InnoDB;
+
+-- An existing api1 table, whose rows have no event_id, is migrated with
+-- ALTER TABLE api1 ADD COLUMN event_id bigint FIRST, ADD UNIQUE KEY event_id (event_id);
+-- The existing rows keep a NULL event_id, and the unique key allows any number
+-- of NULLs, so records from messages published before the migration (which
+-- carry no event id) are still inserted again when they are repeated.
+-- gdelt_score_events.py logs how many records it inserts without an id.
+
+-- Files and events already processed, see processed_index.py
+CREATE TABLE processed_keys (
+    kind varchar(32) NOT NULL,
+    processed_key varchar(255) NOT NULL,
+    expires datetime NOT NULL,
+    PRIMARY KEY (kind, processed_key),
+    KEY expires (expires)
 )ENGINE=InnoDB;
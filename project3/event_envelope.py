@@ -0,0 +1,84 @@
+"""
+    Pack many scoring records into each SQS message.
+
+    gdelt_publish_events packs the scoring records of an event file into
+    as few message bodies as the SQS size limit and ENVELOPE_MAX_RECORDS
+    allow, and gdelt_score_events unpacks them. A body is compact JSON holding the
+    field names once and a list of values per record:
+
+        {"v":1,"fields":["actor_code",...],"records":[["GOV","1.9",...],...]}
+
+    Bodies without a "v" are single records, as published before, so
+    messages already on the queue still unpack. The fields are read from
+    each body, so records published before event_id was added unpack
+    without one.
+"""
+
+import json
+
+ENVELOPE_VERSION = 1
+ENVELOPE_FIELDS = ['event_id', 'actor_code', 'goldstein', 'avg_tone', 'lat', 'lon', 'date']
+
+# Records per body. gdelt_score_events sizes its receives by this, so a
+# full receive of 10 bodies stays within its record budget; 256KB would
+# otherwise hold about 2,500 records.
+ENVELOPE_MAX_RECORDS = 500
+
+# SQS limits a message, and a send_messages batch as a whole, to 256KB
+SQS_MAX_MESSAGE_BYTES = 256 * 1024
+SQS_MAX_BATCH_MESSAGES = 10
+
+
+def encode(value):
+    return json.dumps(value, separators=(',', ':'))
+
+
+def pack_records(records, max_bytes=SQS_MAX_MESSAGE_BYTES, max_records=ENVELOPE_MAX_RECORDS):
+    """
+        Yield message bodies of up to max_bytes and max_records records,
+        each holding as many of the records, in order, as fit.
+    """
+    header = '{{"v":{},"fields":{},"records":['.format(ENVELOPE_VERSION, encode(ENVELOPE_FIELDS))
+    footer = ']}'
+    rows = []
+    size = len(header) + len(footer)
+    for record in records:
+        # ASCII JSON, so characters are bytes
+        row = encode([record[field] for field in ENVELOPE_FIELDS])
+        if rows and (len(rows) == max_records or size + len(row) + 1 > max_bytes):
+            yield header + ','.join(rows) + footer
+            rows = []
+            size = len(header) + len(footer)
+        rows.append(row)
+        size += len(row) + (1 if len(rows) > 1 else 0)
+    if rows:
+        yield header + ','.join(rows) + footer
+
+
+def batch_bodies(bodies, max_bytes=SQS_MAX_MESSAGE_BYTES):
+    """
+        Yield lists of send_messages entries for the bodies, in order,
+        within the batch's message count and total size limits.
+    """
+    entries = []
+    size = 0
+    for body in bodies:
+        if entries and (len(entries) == SQS_MAX_BATCH_MESSAGES or size + len(body) > max_bytes):
+            yield entries
+            entries = []
+            size = 0
+        entries.append({'Id': str(len(entries)), 'MessageBody': body})
+        size += len(body)
+    if entries:
+        yield entries
+
+
+def unpack_records(body):
+    """ Return the list of scoring records in a message body """
+    message = json.loads(body)
+    if 'v' not in message:
+        return [message]
+    if message['v'] != ENVELOPE_VERSION:
+        raise ValueError('Unknown envelope version: {}'.format(message['v']))
+    fields = message['fields']
+    return [dict(zip(fields, values)) for values in message['records']]
@@ -1,20 +1,45 @@
 """
-    Acquire and parse the GDELT file, publishing each
-    event on the GDELT scoring queue.
+    Acquire and parse the GDELT file, publishing its
+    events on the GDELT scoring queue, packed many to a message.
+    Files and events already processed are skipped (see
+    processed_index.py).
 """
 
 import boto3
-from io import BytesIO
-import json
 import os
-from urllib.request import urlopen
-from zipfile import ZipFile
+
+from event_envelope import SQS_MAX_MESSAGE_BYTES, batch_bodies, pack_records
+from gdelt_parser import EventParser
+from gdelt_stream import download_event_file, iter_event_lines
+from processed_index import MySQLStore, ProcessedIndex
+import rds_connection
+from sqs_publisher import Publisher
 
 AWS_PROFILE = 'sp_global'
 AWS_REGION = 'us-east-1'
 
+# RDS credentials should be in a secret instead of here.
+RDS_HOST = 'XXXX'
+RDS_USER = 'XXXX'
+RDS_PASS = 'XXXX'
+RDS_DB = 'gdelt'
+RDS_PORT = 3306
+
 AWS_SQS_GDELT_LATEST = 'gdelt_latest'
 AWS_SQS_GDELT_SCORE = 'gdelt_score'
+# Scoring records are packed into messages of up to this size
+SQS_MESSAGE_BYTES = SQS_MAX_MESSAGE_BYTES
+# send_messages calls in flight, and retries (with exponential backoff
+# from SQS_PUBLISH_BACKOFF seconds) of entries that fail
+SQS_PUBLISH_CONCURRENCY = 4
+SQS_PUBLISH_RETRIES = 3
+SQS_PUBLISH_BACKOFF = 0.2
+# Files published and events scored are remembered this long, see
+# processed_index.py
+PROCESSED_INDEX = True
+PROCESSED_TTL = 7 * 24 * 3600
+PROCESSED_FILE = 'published_file'
+PROCESSED_EVENT = 'scored_event'
 
 GDELT_EVENT_INDEX_GLOBALEVENTID = 0
 GDELT_EVENT_INDEX_Actor1Type1Code = 12
@@ -24,72 +49,118 @@ GDELT_EVENT_INDEX_Actor1Geo_Lat = 40
 GDELT_EVENT_INDEX_Actor1Geo_Long = 41
 GDELT_EVENT_INDEX_DATEADDED = 59
 
+# The columns published for scoring, see gdelt_parser.py
+SCORING_PARSER = EventParser([
+    GDELT_EVENT_INDEX_GLOBALEVENTID,
+    GDELT_EVENT_INDEX_Actor1Type1Code,
+    GDELT_EVENT_INDEX_GoldsteinScale,
+    GDELT_EVENT_INDEX_AvgTone,
+    GDELT_EVENT_INDEX_Actor1Geo_Lat,
+    GDELT_EVENT_INDEX_Actor1Geo_Long,
+    GDELT_EVENT_INDEX_DATEADDED,
+])
 
-def process_event_file(pub_queue, file_url):
+# Reused by warm invocations, see get_connection()
+connection = None
+
+
+def get_connection():
     """
-        Get the event file.
-        Each line with an Actor1Type1Code gets published.
+        Return the database connection kept between warm invocations,
+        or None if the database can't be reached.
     """
+    global connection
+    connection = rds_connection.connect(
+        connection, RDS_HOST, RDS_USER, RDS_PASS, RDS_DB, RDS_PORT)
+    return connection
 
-    if not file_url:
-        print('No file URL in message body')
-        return
 
-    try:
-        response = urlopen(file_url)
-    except Exception as exc:
-        print('Exception getting the GDELT file: {}'.format(exc))
-        return
+def create_processed_index():
+    """ Create the index of files and events already processed """
+    store = MySQLStore(get_connection) if PROCESSED_INDEX else None
+    return ProcessedIndex(store, ttl=PROCESSED_TTL)
 
-    zipfile = ZipFile(BytesIO(response.read()))
-    file_url = os.path.basename(file_url[:-4])
-    count = 1
 
-    for line in zipfile.open(file_url).readlines():
-        parts = line.decode('utf-8').strip('\n').split('\t')
+processed_index = create_processed_index()
+
 
-        # Skip event records that don't have an Actor1Type1Code
-        if not parts[GDELT_EVENT_INDEX_Actor1Type1Code]:
+def scoring_records(lines):
+    """
+        Yield the scoring record of each event line. Event records that
+        don't have an Actor1Type1Code are skipped.
+    """
+    for event_id, actor_code, goldstein, avg_tone, lat, lon, dateadded in SCORING_PARSER.parse_lines(lines):
+        if not actor_code:
             continue
 
-        scoring_parts = {
-            'actor_code': parts[GDELT_EVENT_INDEX_Actor1Type1Code],
-            'goldstein': parts[GDELT_EVENT_INDEX_GoldsteinScale],
-            'avg_tone': parts[GDELT_EVENT_INDEX_AvgTone],
-            'lat': parts[GDELT_EVENT_INDEX_Actor1Geo_Lat],
-            'lon': parts[GDELT_EVENT_INDEX_Actor1Geo_Long],
-            'date': parts[GDELT_EVENT_INDEX_DATEADDED],
+        yield {
+            'event_id': event_id,
+            'actor_code': actor_code,
+            'goldstein': goldstein,
+            'avg_tone': avg_tone,
+            'lat': lat,
+            'lon': lon,
+            'date': dateadded,
         }
 
-        # Batch messages for API efficiency and speed of processing
-        if count == 1:
-            messages = []
 
-        messages.append(prepare(count, scoring_parts))
+def publish_records(pub_queue, records):
+    """
+        Publish the scoring records, packed many to a message (see
+        event_envelope.py), with concurrent batch sends and retries of
+        failed entries (see sqs_publisher.py). Returns the publisher's
+        sent, failed and retried counts.
+    """
+    publisher = Publisher(
+        pub_queue,
+        concurrency=SQS_PUBLISH_CONCURRENCY,
+        max_retries=SQS_PUBLISH_RETRIES,
+        backoff=SQS_PUBLISH_BACKOFF)
+    publisher.publish(batch_bodies(pack_records(records, SQS_MESSAGE_BYTES), SQS_MESSAGE_BYTES))
+    return publisher.stats()
 
-        if count == 10:
-            publish(pub_queue, messages)
-            count = 1
-            messages = []
-        count += 1
 
-    # Publish remaining events after parsing the GDELT file
-    messages.append(prepare(count, scoring_parts))
-    publish(pub_queue, messages)
+def process_event_file(pub_queue, file_url):
+    """
+        Get the event file.
+        Each line with an Actor1Type1Code gets published.
 
+        The file is streamed a line at a time (see gdelt_stream.py)
+        and only the published columns are parsed (see gdelt_parser.py).
 
-def prepare(count, scoring_parts):
-    """ Allocate new dictionary for the data, format and return """
-    data = {'Id': str(count), 'MessageBody': json.dumps(scoring_parts)}
-    return data
+        A file already published is skipped, as are the events already
+        scored. The file is recorded as published once all its messages
+        are sent.
+    """
 
+    if not file_url:
+        print('No file URL in message body')
+        return
+
+    file_name = os.path.basename(file_url)
+    if processed_index.seen(PROCESSED_FILE, [file_name]):
+        print('Already published: {}'.format(file_name))
+        return
 
-def publish(pub_queue, messages):
-    """ Publish the message set """
     try:
-        pub_queue.send_messages(Entries=messages)
+        spool = download_event_file(file_url)
     except Exception as exc:
-        print('Exception sending message: {}'.format(exc))
+        print('Exception getting the GDELT file: {}'.format(exc))
+        return
+
+    file_url = os.path.basename(file_url[:-4])
+
+    with spool:
+        records = processed_index.unseen(
+            PROCESSED_EVENT,
+            scoring_records(iter_event_lines(spool, file_url)),
+            key=lambda record: record['event_id'])
+        stats = publish_records(pub_queue, records)
+    print('Published messages: {}'.format(stats))
+    print('Processed index: {}'.format(processed_index.stats()))
+
+    if not stats['failed']:
+        processed_index.add(PROCESSED_FILE, [file_name])
 
 
 def main():
@@ -2,21 +2,61 @@
     Acquire the latest GDELT file name and publish it to the queue.
 
     The Lambda function is triggered by a CloudWatch rule
-    (gdelt_trigger_latest_file) that runs every 15 minutes.
+    (gdelt_trigger_latest_file) that runs every 15 minutes. A file name
+    already published isn't published again (see processed_index.py).
 
 """
 
 import boto3
+import os
 from urllib.request import urlopen
 
+from processed_index import MySQLStore, ProcessedIndex
+import rds_connection
+
 AWS_PROFILE = 'sp_global'
 AWS_REGION = 'us-east-1'
 
+# RDS credentials should be in a secret instead of here.
+RDS_HOST = 'XXXX'
+RDS_USER = 'XXXX'
+RDS_PASS = 'XXXX'
+RDS_DB = 'gdelt'
+RDS_PORT = 3306
+
 AWS_SQS_GDELT_LATEST = 'gdelt_latest'
 
 GDELT_LATEST_FILE_NAME = 'http://data.gdeltproject.org/gdeltv2/lastupdate.txt'
 GDELT_EVENT_FILE_NAME_PART = 'export.CSV.zip'
 
+# File names published are remembered this long, see processed_index.py
+PROCESSED_INDEX = True
+PROCESSED_TTL = 7 * 24 * 3600
+PROCESSED_FILE = 'latest_file'
+
+# Reused by warm invocations, see get_connection()
+connection = None
+
+
+def get_connection():
+    """
+        Return the database connection kept between warm invocations,
+        or None if the database can't be reached.
+    """
+    global connection
+    connection = rds_connection.connect(
+        connection, RDS_HOST, RDS_USER, RDS_PASS, RDS_DB, RDS_PORT)
+    return connection
+
+
+def create_processed_index():
+    """ Create the index of file names already published """
+    store = MySQLStore(get_connection) if PROCESSED_INDEX else None
+    return ProcessedIndex(store, ttl=PROCESSED_TTL)
+
+
+processed_index = create_processed_index()
+
 
 def get_latest_event_filename():
     """ Return the name of the most recent GDELT event file """
@@ -39,6 +79,12 @@ def publish_filename(filename=None):
         print('No GDELT url to publish')
         return
 
+    # lastupdate.txt names the same file until the next update
+    name = os.path.basename(filename)
+    if processed_index.seen(PROCESSED_FILE, [name]):
+        print('Already published: {}'.format(name))
+        return
+
     sqs = boto3.resource('sqs')
     try:
         queue = sqs.get_queue_by_name(QueueName=AWS_SQS_GDELT_LATEST)
@@ -50,11 +96,15 @@ def publish_filename(filename=None):
         queue.send_message(MessageBody=filename)
     except Exception as exc:
         print('Exception sending message: {}'.format(exc))
+        return
+
+    processed_index.add(PROCESSED_FILE, [name])
 
 
 def main():
     """ Processing controller """
     publish_filename(get_latest_event_filename())
+    processed_index.evict()
 
 
 def lambda_handler(event, context):
@@ -9,12 +9,17 @@
    The zip file list can be restricted to just the packages to reduce the size.
 """
 
-import base64
 import boto3
 import datetime
-import json
+import functools
 import pymysql
-import requests
+import time
+
+from event_envelope import ENVELOPE_MAX_RECORDS, unpack_records
+from processed_index import MySQLStore, ProcessedIndex
+import rds_connection
+from score_cache import ScoreCache, SQLiteStore
+from scoring_client import ScoringClient
 
 AWS_PROFILE = 'sp_global'
 AWS_REGION = 'us-east-1'
@@ -24,6 +29,7 @@ RDS_HOST = 'XXXX'
 RDS_USER = 'XXXX'
 RDS_PASS = 'XXXX'
 RDS_DB = 'gdelt'
+RDS_PORT = 3306
 
 # RDS_HOST = 'localhost'
 # RDS_USER = 'XXXX'
@@ -31,106 +37,283 @@ RDS_DB = 'gdelt'
 # RDS_DB = 'gdelt'
 
 AWS_SQS_GDELT_SCORE = 'gdelt_score'
+# Drain mode: receive until the queue is empty, this many records have
+# been received or this many seconds have passed (or, in Lambda, until
+# only SQS_DRAIN_RESERVE_SECONDS remain), long-polling each receive. The
+# queue's visibility timeout must outlast the Lambda timeout.
+SQS_DRAIN = True
+SQS_DRAIN_MAX_RECORDS = 5000
+SQS_DRAIN_SECONDS = 60
+SQS_DRAIN_RESERVE_SECONDS = 30
+SQS_DRAIN_WAIT_SECONDS = 2
 
 # API credentials should be in a secret instead of here
 SPG_MODEL_URL = 'https://app-models.dominodatalab.com:443/models/5bd0856346e0fb0008d06d74/latest/model'  # noqa: E501
 SPG_AUTH = 'XXXX'
+# Scoring requests in flight, and records per request (1 unless the
+# model endpoint accepts a list of records, see scoring_client.py)
+SPG_CONCURRENCY = 10
+SPG_BATCH_SIZE = 1
+# Scores are cached by scoring record in memory and, when a path is set,
+# in a SQLite file (see score_cache.py). Both survive between warm
+# Lambda invocations.
+SPG_CACHE_SIZE = 100000
+SPG_CACHE_PATH = '/tmp/gdelt_scores.db'
+SPG_CACHE_TTL = 7 * 24 * 3600
+# Events scored are remembered this long, so a message received again
+# isn't rescored (see processed_index.py). Inserts are upserts on
+# event_id either way.
+PROCESSED_INDEX = True
+PROCESSED_TTL = 7 * 24 * 3600
+PROCESSED_EVENT = 'scored_event'
+
+# Multi-row INSERT statements are kept below both this length and the
+# server's max_allowed_packet, less some headroom for the 5 byte packet
+# header (at most half of a small packet)
+RDS_MAX_STMT_LENGTH = 4 * 1024 * 1024
+RDS_PACKET_HEADROOM = 1024
+
+INSERT_SQL = """
+INSERT INTO api1
+(event_id, actor1_code, goldstein, avg_tone, lat, lon, event_date,
+class1, class2, timing)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE
+class1 = VALUES(class1), class2 = VALUES(class2), timing = VALUES(timing)"""
+
+# Reused by warm invocations, see get_connection()
+connection = None
+max_stmt_length = RDS_MAX_STMT_LENGTH
 
 
+@functools.lru_cache(maxsize=1024)
 def format_date(d):
-    """ GDELT dates are YYYYMMDDHHMMSS """
+    """ GDELT dates are YYYYMMDDHHMMSS; each batch shares a few """
     dt = datetime.datetime.strptime(d, '%Y%m%d%H%M%S')
     return datetime.datetime.strftime(dt, '%Y-%m-%d %H:%M:%S')
 
 
-def score(scoring_record):
-    """ Score the record. """
+def create_score_cache():
+    """ Create the score cache """
+    store = None
+    if SPG_CACHE_PATH:
+        store = SQLiteStore(SPG_CACHE_PATH, ttl=SPG_CACHE_TTL)
+        store.evict()
+    return ScoreCache(max_size=SPG_CACHE_SIZE, store=store)
 
-    user_pass = base64.b64encode('{}:{}'.format(
+
+score_cache = create_score_cache()
+
+
+def create_scoring_client():
+    """ Create the pooled model API client """
+    return ScoringClient(
+        SPG_MODEL_URL,
         SPG_AUTH,
-        SPG_AUTH).encode('utf-8')).decode('utf-8')
-    data = json.dumps({'data': scoring_record})
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': 'Basic {}'.format(user_pass)}
+        concurrency=SPG_CONCURRENCY,
+        batch_size=SPG_BATCH_SIZE,
+        cache=score_cache)
 
-    try:
-        response = requests.post(SPG_MODEL_URL, data=data, headers=headers)
-    except Exception as exc:
-        print(exc)
-        return
 
-    spg_score = response.json()
-    return """('{0}', {1}, {2}, {3}, {4}, '{5}', {6}, {7}, {8})""".format(
+# Kept, with its threads and their connections, between warm invocations
+scoring_client = create_scoring_client()
+
+
+def format_value(event_id, scoring_record, spg_score):
+    """ Return the insert parameters of the scored record. """
+    return (
+        event_id,
         scoring_record['actor_code'],
         scoring_record['goldstein'],
         scoring_record['avg_tone'],
         scoring_record['lat'] if scoring_record['lat'] else 0,
         scoring_record['lon'] if scoring_record['lon'] else 0,
         format_date(scoring_record['date']),
-        1 if spg_score['result']['class1'] else 0,
-        spg_score['result']['class2'],
+        1 if spg_score['class1'] else 0,
+        spg_score['class2'],
         spg_score['timing'])
 
 
-def insert(values):
-    """ Bulk insert the scored records. """
+def get_connection():
+    """
+        Return the database connection kept between warm invocations,
+        or None if the database can't be reached.
+    """
+    global connection, max_stmt_length
+    conn = rds_connection.connect(
+        connection, RDS_HOST, RDS_USER, RDS_PASS, RDS_DB, RDS_PORT)
+    if conn is not None and conn is not connection:
+        # executemany() splits its multi-row INSERTs at max_stmt_length, so
+        # keep each statement inside the server's packet limit
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT @@max_allowed_packet')
+            max_allowed_packet = cursor.fetchone()[0]
+        max_stmt_length = min(
+            RDS_MAX_STMT_LENGTH,
+            max_allowed_packet - min(RDS_PACKET_HEADROOM, max_allowed_packet // 2))
 
-    try:
-        conn = pymysql.connect(
-            RDS_HOST,
-            user=RDS_USER,
-            passwd=RDS_PASS,
-            db=RDS_DB,
-            connect_timeout=5,
-            autocommit=1)
-    except pymysql.MySQLError as e:
-        print('MySQL connection failure: {}'.format(e))
-        return
+    connection = conn
+    return connection
 
-    # auto-commit
-    conn.commit()
 
-    cursor = conn.cursor()
-    sql = """
-INSERT INTO api1
-(actor1_code, goldstein, avg_tone, lat, lon, event_date,
-class1, class2, timing)
-VALUES """
-    sql = sql + ', '.join(values)
+def create_processed_index():
+    """ Create the index of events already scored """
+    store = MySQLStore(get_connection) if PROCESSED_INDEX else None
+    return ProcessedIndex(store, ttl=PROCESSED_TTL)
+
+
+processed_index = create_processed_index()
 
-    try:
-        cursor.execute(sql)
-    except pymysql.MySQLError as e:
-        print('MySQL insert error: {}'.format(e))
-        print(sql)
 
-    conn.close()
+def insert(values):
+    """
+        Bulk insert the scored records, a tuple of parameters each (see
+        format_value()). Returns True once they are inserted.
+    """
+    if not values:
+        return True
 
+    conn = get_connection()
+    if conn is None:
+        return False
 
-def main():
-    """ Processing controller """
+    try:
+        with conn.cursor() as cursor:
+            cursor.max_stmt_length = max_stmt_length
+            cursor.executemany(INSERT_SQL, values)
+    except pymysql.MySQLError as e:
+        print('MySQL insert error: {}'.format(e))
+        return False
+    return True
+
+
+def receive_messages(sub_queue, max_records, deadline, wait_seconds=0, max_receives=None):
+    """
+        Yield (message, scoring_records) from the queue, long-polling
+        wait_seconds for each receive, until it comes back empty,
+        max_records records have been received, max_receives receives
+        have been made or the time.monotonic() deadline passes.
+
+        A message holds up to ENVELOPE_MAX_RECORDS records (see
+        event_envelope.py), so each receive asks for only as many
+        messages as the remaining budget holds, and for one once it
+        holds less than a full message. The budget can be overrun by
+        less than one message.
+    """
+    received = 0
+    receives = 0
+    while received < max_records and time.monotonic() < deadline:
+        if max_receives is not None and receives == max_receives:
+            return
+        receives += 1
+        messages = sub_queue.receive_messages(
+            AttributeNames=['All'],
+            MaxNumberOfMessages=max(1, min(10, (max_records - received) // ENVELOPE_MAX_RECORDS)),
+            WaitTimeSeconds=wait_seconds)
+        if not messages:
+            return
+        for message in messages:
+            records = unpack_records(message.body)
+            received += len(records)
+            yield message, records
+
+
+def delete_messages(sub_queue, messages):
+    """
+        Acknowledge the messages, 10 per request.
+        Returns the number that could not be deleted.
+    """
+    failed = 0
+    for offset in range(0, len(messages), 10):
+        entries = [{'Id': str(index), 'ReceiptHandle': message.receipt_handle}
+                   for index, message in enumerate(messages[offset:offset + 10])]
+        try:
+            response = sub_queue.delete_messages(Entries=entries)
+        except Exception as exc:
+            print('Exception deleting messages: {}'.format(exc))
+            failed += len(entries)
+            continue
+        for entry in response.get('Failed', []):
+            print('Failed to delete message: {}'.format(entry))
+            failed += 1
+    return failed
+
+
+def main(context=None, drain=SQS_DRAIN):
+    """
+        Processing controller
+
+        Without drain, one receive of up to 10 messages, within the
+        record budget, is scored. With
+        drain, the queue is long-polled until it is empty or the record
+        or time budget is used; scoring runs while further messages are
+        received. Either way the scored records are inserted at once and
+        the messages are deleted only after the insert succeeds, so a
+        failed insert leaves them to be received again.
+
+        The event ids of each message are checked in one lookup and the
+        events already scored are skipped; the rest are recorded as
+        scored after the insert. Records without an event id (published
+        before it was added) can't be deduplicated and are counted.
+    """
+    start = time.monotonic()
     sqs = boto3.resource('sqs')
     sub_queue = sqs.get_queue_by_name(QueueName=AWS_SQS_GDELT_SCORE)
 
-    messages = sub_queue.receive_messages(
-        AttributeNames=['All'],
-        MaxNumberOfMessages=10)
-
+    if drain:
+        budget = SQS_DRAIN_SECONDS
+        if context is not None:
+            # Leave time for the scoring, insert and deletes after the last receive
+            remaining = context.get_remaining_time_in_millis() / 1000
+            budget = min(budget, remaining - SQS_DRAIN_RESERVE_SECONDS)
+        received = receive_messages(
+            sub_queue, SQS_DRAIN_MAX_RECORDS, start + budget, SQS_DRAIN_WAIT_SECONDS)
+    else:
+        received = receive_messages(
+            sub_queue, SQS_DRAIN_MAX_RECORDS, start + SQS_DRAIN_SECONDS, max_receives=1)
+
+    messages = []
     values = []
-    for message in messages:
-        value = score(json.loads(message.body))
-        if value:
-            values.append(value)
-        message.delete()
+    event_ids = []
+
+    def items():
+        for message, records in received:
+            messages.append(message)
+            seen = processed_index.seen(PROCESSED_EVENT, [record.get('event_id') for record in records])
+            for record in records:
+                # The model scores the record without its event id
+                event_id = record.pop('event_id', None)
+                if event_id is None or str(event_id) not in seen:
+                    yield event_id, record
+
+    for event_id, scoring_record, spg_score in scoring_client.score_all(items()):
+        # Records that fail to score are dropped, as before, rather than
+        # being received again
+        if spg_score:
+            values.append(format_value(event_id, scoring_record, spg_score))
+            if event_id is not None:
+                event_ids.append(event_id)
+
+    if not insert(values):
+        print('Insert failed, leaving {} messages on the queue'.format(len(messages)))
+        return
+    processed_index.add(PROCESSED_EVENT, event_ids)
 
-    insert(values)
+    failed = delete_messages(sub_queue, messages)
+    seconds = time.monotonic() - start
+    print('Inserted {} records from {} messages in {:.1f}s ({:.0f}/s), {} not deleted'.format(
+        len(values), len(messages), seconds, len(values) / seconds if seconds else 0, failed))
+    if len(event_ids) < len(values):
+        print('{} records inserted without an event id, not deduplicated'.format(
+            len(values) - len(event_ids)))
+    print('Score cache: {}'.format(score_cache.stats()))
+    print('Processed index: {}'.format(processed_index.stats()))
 
 
 def lambda_handler(event, context):
     # Within Lambda, boto initialization uses the IAM role available
     boto3.setup_default_session(region_name=AWS_REGION)
-    main()
+    main(context)
 
 
 if __name__ == "__main__":
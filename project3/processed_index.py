@@ -0,0 +1,190 @@
+"""
+    Remember the GDELT files and events already processed.
+
+    Each stage of the pipeline checks its keys (file names, GLOBALEVENTIDs)
+    in bulk before doing the work and adds them once the work is done, so
+    a file that lastupdate.txt still names 15 minutes later, or an SQS
+    message delivered twice, isn't processed again. Keys are grouped by
+    kind, one per stage, and expire after a TTL. The keys are kept in a
+    persistent store shared by the Lambdas:
+
+        MySQLStore  the processed_keys table (see db_schema.sql)
+        RedisStore  any redis client
+
+    The index fails open: if the store can't be reached nothing counts
+    as processed and the work is done again, which api1's unique event_id
+    turns into an update of the same rows.
+"""
+
+import datetime
+import threading
+
+# Keys per SELECT ... IN (...) lookup
+CHUNK_SIZE = 1000
+
+
+def chunks(items, size=CHUNK_SIZE):
+    for offset in range(0, len(items), size):
+        yield items[offset:offset + size]
+
+
+class MySQLStore(object):
+    """
+        Keep the keys in a MySQL table. connect() returns an open
+        connection, or None if the database can't be reached.
+    """
+
+    def __init__(self, connect, table='processed_keys'):
+        self.connect = connect
+        self.table = table
+
+    def cursor(self):
+        conn = self.connect()
+        if conn is None:
+            raise IOError('No database connection')
+        return conn.cursor()
+
+    def seen(self, kind, keys):
+        now = datetime.datetime.utcnow()
+        found = set()
+        with self.cursor() as cursor:
+            for chunk in chunks(keys):
+                cursor.execute(
+                    'SELECT processed_key FROM {} WHERE kind = %s AND expires > %s '
+                    'AND processed_key IN ({})'.format(self.table, ', '.join(['%s'] * len(chunk))),
+                    [kind, now] + chunk)
+                found.update(row[0] for row in cursor.fetchall())
+        return found
+
+    def add(self, kind, keys, ttl):
+        expires = datetime.datetime.utcnow() + datetime.timedelta(seconds=ttl)
+        with self.cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO {} (kind, processed_key, expires) VALUES (%s, %s, %s) '
+                'ON DUPLICATE KEY UPDATE expires = VALUES(expires)'.format(self.table),
+                [(kind, key, expires) for key in keys])
+
+    def evict(self):
+        with self.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM {} WHERE expires <= %s'.format(self.table),
+                (datetime.datetime.utcnow(), ))
+
+
+class RedisStore(object):
+    """
+        Keep the keys in redis, each with the TTL as its expiry.
+    """
+
+    def __init__(self, redis, prefix='gdelt:processed'):
+        self.redis = redis
+        self.prefix = prefix
+
+    def name(self, kind, key):
+        return '{}:{}:{}'.format(self.prefix, kind, key)
+
+    def seen(self, kind, keys):
+        found = set()
+        for chunk in chunks(keys):
+            values = self.redis.mget([self.name(kind, key) for key in chunk])
+            found.update(key for key, value in zip(chunk, values) if value is not None)
+        return found
+
+    def add(self, kind, keys, ttl):
+        pipe = self.redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.set(self.name(kind, key), 1, ex=ttl)
+        pipe.execute()
+
+    def evict(self):
+        pass
+
+
+class ProcessedIndex(object):
+    """
+        Without a store nothing counts as processed, which turns the
+        index off.
+    """
+
+    def __init__(self, store=None, ttl=7 * 24 * 3600):
+        self.store = store
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.checked = 0
+        self.skipped = 0
+        self.added = 0
+        self.store_errors = 0
+
+    def error(self, exc):
+        print('Processed index error: {}'.format(exc))
+        with self.lock:
+            self.store_errors += 1
+
+    def seen(self, kind, keys):
+        """
+            Return the set of the keys already processed.
+        """
+        keys = [str(key) for key in set(keys) if key is not None]
+        found = set()
+        if self.store and keys:
+            try:
+                found = self.store.seen(kind, keys)
+            except Exception as exc:
+                self.error(exc)
+        with self.lock:
+            self.checked += len(keys)
+            self.skipped += len(found)
+        return found
+
+    def add(self, kind, keys):
+        """
+            Record the keys as processed.
+        """
+        keys = [str(key) for key in set(keys) if key is not None]
+        if not self.store or not keys:
+            return
+        try:
+            self.store.add(kind, keys, self.ttl)
+        except Exception as exc:
+            self.error(exc)
+            return
+        with self.lock:
+            self.added += len(keys)
+
+    def unseen(self, kind, items, key, chunk_size=CHUNK_SIZE):
+        """
+            Yield the items whose key(item) hasn't been processed,
+            checking chunk_size items at a time. Items without a key
+            are always yielded.
+        """
+        chunk = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) == chunk_size:
+                yield from self.filter(kind, chunk, key)
+                chunk = []
+        if chunk:
+            yield from self.filter(kind, chunk, key)
+
+    def filter(self, kind, items, key):
+        found = self.seen(kind, (key(item) for item in items))
+        return [item for item in items if key(item) is None or str(key(item)) not in found]
+
+    def evict(self):
+        if self.store:
+            try:
+                self.store.evict()
+            except Exception as exc:
+                self.error(exc)
+
+    def stats(self):
+        """
+            Return the keys checked, skipped as already processed and
+            added, and the store errors.
+        """
+        return {
+            'checked': self.checked,
+            'skipped': self.skipped,
+            'added': self.added,
+            'store_errors': self.store_errors,
+        }
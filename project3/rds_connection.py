@@ -0,0 +1,38 @@
+"""
+    The RDS connection each Lambda keeps between warm invocations.
+
+    Each Lambda holds its connection in a module global and passes it to
+    connect() before use:
+
+        connection = rds_connection.connect(
+            connection, RDS_HOST, RDS_USER, RDS_PASS, RDS_DB, RDS_PORT)
+"""
+
+import pymysql
+
+
+def connect(connection, host, user, password, database, port=3306):
+    """
+        Return the connection if it answers a ping (reconnecting it as
+        needed), or else a new connection. Returns None if the database
+        can't be reached.
+    """
+    if connection is not None:
+        try:
+            connection.ping(reconnect=True)
+            return connection
+        except pymysql.MySQLError as e:
+            print('MySQL ping failure, reconnecting: {}'.format(e))
+
+    # By keyword, as PyMySQL 1.0 and later take no positional arguments
+    try:
+        return pymysql.connect(
+            host=host,
+            user=user,
+            password=password,
+            database=database,
+            port=port,
+            connect_timeout=5,
+            autocommit=1)
+    except pymysql.MySQLError as e:
+        print('MySQL connection failure: {}'.format(e))
@@ -0,0 +1,192 @@
+"""
+    Cache model scores by the content of the scoring record.
+
+    Scoring records repeat heavily across GDELT events, so a score is
+    stored under a hash of the canonical JSON of its record and reused
+    for every identical record. The record's date (DATEADDED) is left
+    out of the hash: every event of a quarter hour export shares it, so
+    with it no score could be reused by a later file. That takes the
+    model's classes to depend on the event's columns, not on when GDELT
+    added it.
+
+    Lookups go to an in-memory LRU first and then, if configured, to a
+    persistent store shared between runs:
+
+        SQLiteStore  a local SQLite file (e.g. /tmp on Lambda)
+        RedisStore   any redis client, for sharing between hosts
+
+    Persistent entries expire after a TTL; the SQLite store also evicts
+    the entries closest to expiry beyond max_rows.
+"""
+
+from collections import OrderedDict
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+# Scoring record fields that aren't part of the key
+KEY_IGNORED_FIELDS = ('date',)
+
+
+def record_key(scoring_record):
+    """
+        Return the hash of the record's canonical JSON, without the
+        ignored fields.
+    """
+    fields = {name: value for name, value in scoring_record.items()
+              if name not in KEY_IGNORED_FIELDS}
+    canonical = json.dumps(fields, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+
+class SQLiteStore(object):
+
+    def __init__(self, path, ttl=7 * 24 * 3600, max_rows=1000000):
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        # It's a cache, losing the last writes in a crash is fine
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=OFF')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS scores ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)')
+        self.conn.execute(
+            'CREATE INDEX IF NOT EXISTS scores_expires ON scores (expires)')
+        self.conn.commit()
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT value FROM scores WHERE key = ? AND expires > ?',
+                (key, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key, value):
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO scores (key, value, expires) '
+                'VALUES (?, ?, ?)',
+                (key, json.dumps(value), time.time() + self.ttl))
+            self.conn.commit()
+
+    def evict(self):
+        """
+            Drop expired entries, then the entries closest to expiry
+            beyond max_rows.
+        """
+        with self.lock:
+            self.conn.execute(
+                'DELETE FROM scores WHERE expires <= ?', (time.time(),))
+            self.conn.execute(
+                'DELETE FROM scores WHERE key IN (SELECT key FROM scores '
+                'ORDER BY expires DESC LIMIT -1 OFFSET ?)', (self.max_rows,))
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class RedisStore(object):
+    """
+        Store entries in redis with a TTL; eviction beyond that is left
+        to the server's maxmemory policy.
+    """
+
+    def __init__(self, redis, prefix='gdelt:score', ttl=7 * 24 * 3600):
+        self.redis = redis
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key):
+        value = self.redis.get('{}:{}'.format(self.prefix, key))
+        return json.loads(value) if value else None
+
+    def put(self, key, value):
+        self.redis.set(
+            '{}:{}'.format(self.prefix, key), json.dumps(value), ex=self.ttl)
+
+    def evict(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class ScoreCache(object):
+
+    def __init__(self, max_size=100000, store=None):
+        self.max_size = max_size
+        self.store = store
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.store_errors = 0
+
+    def get(self, scoring_record):
+        """
+            Return the cached score for the record or None.
+        """
+        key = record_key(scoring_record)
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        if self.store:
+            try:
+                value = self.store.get(key)
+            except Exception as exc:
+                print('Score cache error: {}'.format(exc))
+                with self.lock:
+                    self.store_errors += 1
+                value = None
+            if value is not None:
+                with self.lock:
+                    self.store_hits += 1
+                self.remember(key, value)
+                return value
+
+        with self.lock:
+            self.misses += 1
+
+    def put(self, scoring_record, value):
+        key = record_key(scoring_record)
+        self.remember(key, value)
+        if self.store:
+            try:
+                self.store.put(key, value)
+            except Exception as exc:
+                print('Score cache error: {}'.format(exc))
+                with self.lock:
+                    self.store_errors += 1
+
+    def remember(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        """
+            Return the hit and miss counters and the overall hit rate.
+        """
+        lookups = self.hits + self.store_hits + self.misses
+        return {
+            'hits': self.hits,
+            'store_hits': self.store_hits,
+            'misses': self.misses,
+            'store_errors': self.store_errors,
+            'hit_rate': round((self.hits + self.store_hits) / lookups, 4) if lookups else 0.0,
+            'size': len(self.entries),
+        }
@@ -0,0 +1,92 @@
+"""
+    Send batches of messages to an SQS queue concurrently.
+
+    Up to `concurrency` send_messages calls are in flight at a time, with
+    a few more batches queued, so a lazy iterable of batches is never
+    held in memory all at once. Entries reported in a response's Failed
+    list (or a whole batch whose call raised) are sent again after a
+    backoff, up to max_retries times; entries that failed through the
+    sender's fault are not retried. The sent, failed and retried counts
+    are kept for reporting.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import threading
+import time
+
+
+class Publisher(object):
+
+    def __init__(self, queue, concurrency=4, max_retries=3, backoff=0.2):
+        self.queue = queue
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.lock = threading.Lock()
+
+    def count(self, sent=0, failed=0, retried=0):
+        with self.lock:
+            self.sent += sent
+            self.failed += failed
+            self.retried += retried
+
+    def send_batch(self, entries):
+        """
+            Send one batch of up to 10 entries, retrying the failed ones.
+            Returns the number of entries sent.
+        """
+        sent = 0
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+                self.count(retried=len(entries))
+
+            try:
+                response = self.queue.send_messages(Entries=entries)
+            except Exception as exc:
+                print('Exception sending messages: {}'.format(exc))
+                continue
+
+            successful = len(response.get('Successful', []))
+            sent += successful
+            self.count(sent=successful)
+
+            retry = set()
+            for failure in response.get('Failed', []):
+                print('Failed to send message: {}'.format(failure))
+                if failure.get('SenderFault'):
+                    self.count(failed=1)
+                else:
+                    retry.add(failure['Id'])
+            entries = [entry for entry in entries if entry['Id'] in retry]
+            if not entries:
+                return sent
+
+        self.count(failed=len(entries))
+        return sent
+
+    def publish(self, batches):
+        """
+            Send each batch of entries, returning the number of entries
+            sent once every batch is done.
+        """
+        batches = iter(batches)
+        sent = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            pending = deque()
+            while True:
+                for entries in itertools.islice(batches, self.concurrency * 2 - len(pending)):
+                    pending.append(executor.submit(self.send_batch, entries))
+                if not pending:
+                    break
+                sent += pending.popleft().result()
+        return sent
+
+    def stats(self):
+        with self.lock:
+            return {'sent': self.sent, 'failed': self.failed, 'retried': self.retried}